@@ -0,0 +1,196 @@
+import asyncio
+import html as html_lib
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import aiohttp
+
+from frontier import MemoryFrontier
+
+# Every href that starts with /wiki/, pulled straight out of the raw HTML.
+# Article pages carry hundreds of links, and a regex over the text is far
+# cheaper than building a BeautifulSoup tree just to walk its <a> tags.
+WIKI_HREF = re.compile(r'''<a\s[^>]*?href=["'](/wiki/[^"'#]*)''', re.IGNORECASE)
+
+
+def extract_wiki_links(html):
+    # Runs in the parse pool, so it must stay a plain module-level function
+    return [html_lib.unescape(href) if '&' in href else href for href in WIKI_HREF.findall(html)]
+
+
+class AsyncCrawler():
+    # The same start_url -> end_url search as Crawler.crawl, with up to
+    # `concurrency` pages in flight over one pooled keep-alive session.
+    # per_host caps the connections to any one host (Wikipedia asks crawlers
+    # to stay modest), and link extraction runs on a pool of parse_workers
+    # processes so the event loop only does I/O. parse_workers=0 parses
+    # inline, which is faster for small pages on few cores.
+    def __init__(self, start_url, end_url, is_valid_link, frontier=None, concurrency=32, per_host=8,
+                 parse_workers=None, on_page=None, max_pages=None, timeout=30, verbose=False):
+        self.end_url = end_url
+        self.is_valid_link = is_valid_link
+        self.frontier = frontier if frontier is not None else MemoryFrontier()
+        if start_url is not None:
+            self.frontier.push([start_url])
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.parse_workers = os.cpu_count() if parse_workers is None else parse_workers
+        # Called as on_page(url, html) on a thread, e.g. to store the page
+        self.on_page = on_page
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.verbose = verbose
+        self.number_of_pages_visited = 0
+        self.errors = 0
+        self.found = False
+
+    async def _fetch(self, session, url):
+        async with session.get(url) as response:
+            response.raise_for_status()
+            return await response.text()
+
+    async def _links(self, pool, current_url, html):
+        if pool is None:
+            hrefs = extract_wiki_links(html)
+        else:
+            hrefs = await asyncio.get_running_loop().run_in_executor(pool, extract_wiki_links, html)
+        return [urljoin(current_url, href) for href in hrefs if self.is_valid_link(href)]
+
+    async def _frontier(self, method, *args):
+        # RedisFrontier calls are blocking round trips, so they run on a
+        # thread pool of their own instead of stalling every page on the loop
+        if self._frontier_pool is not None:
+            return await asyncio.get_running_loop().run_in_executor(self._frontier_pool, method, *args)
+        return method(*args)
+
+    def _pop(self):
+        # Claimed in the same call, so a pop still running on the pool when
+        # the crawl stops is released too
+        url = self.frontier.pop()
+        if url is not None:
+            self._claimed.add(url)
+        return url
+
+    async def _visit(self, session, pool, current_url):
+        # Fetches one page and queues its links; True once the crawl is over
+        try:
+            html = await self._fetch(session, current_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.errors += 1
+            print(f"Error fetching {current_url}: {e!r}")
+            # Back in the queue, up to the frontier's max_attempts
+            await self._frontier(self.frontier.fail, current_url)
+            return False
+        self.number_of_pages_visited += 1
+        if self.verbose: print(f"{self.number_of_pages_visited}: {current_url}")
+        if self.on_page is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.on_page, current_url, html)
+        if current_url == self.end_url:
+            await self._frontier(self.frontier.complete, current_url)
+            if self.verbose: print(f"{self.number_of_pages_visited}: Reached the end URL: {self.end_url}")
+            self.found = True
+            return True
+        # Queues the links and only then marks the page visited
+        await self._frontier(self.frontier.complete, current_url, await self._links(pool, current_url, html))
+        return bool(self.max_pages and self.number_of_pages_visited >= self.max_pages)
+
+    async def _worker(self, session, pool):
+        try:
+            while not self._done.is_set():
+                # Counted as in flight while popping too, so no other worker
+                # takes the empty queue for the end of the crawl meanwhile
+                self._in_flight += 1
+                try:
+                    current_url = await self._frontier(self._pop)
+                except BaseException:
+                    self._in_flight -= 1
+                    raise
+                if current_url is None:
+                    self._in_flight -= 1
+                    if self._in_flight == 0:
+                        # The pop ran on the pool, so the last page in flight
+                        # may have queued its links since it came back empty:
+                        # only stop if the queue is still empty and no other
+                        # worker started meanwhile
+                        if await self._frontier(self.frontier.__len__) == 0 and self._in_flight == 0:
+                            # Nothing queued and nobody left to discover more
+                            self._done.set()
+                            return
+                        continue
+                    self._pushed.clear()
+                    await self._pushed.wait()
+                    continue
+                try:
+                    try:
+                        over = await self._visit(session, pool, current_url)
+                    except Exception as e:
+                        # Anything else wrong with this page (a body that won't
+                        # decode, on_page raising) is retried like a failed fetch
+                        self.errors += 1
+                        print(f"Error crawling {current_url}: {e!r}")
+                        await self._frontier(self.frontier.fail, current_url)
+                        over = False
+                    self._claimed.discard(current_url)
+                finally:
+                    self._in_flight -= 1
+                    # Wakes idle workers for new links, or to notice the crawl is over
+                    self._pushed.set()
+                if over:
+                    self._done.set()
+                    return
+        except Exception as e:
+            # The frontier itself failed (e.g. Redis went away): stop the
+            # crawl, and crawl() raises it once the other workers are cancelled
+            if self._error is None:
+                self._error = e
+            self._done.set()
+
+    async def crawl(self):
+        if self.frontier.is_visited(self.end_url):
+            # A resumed crawl that already got there
+            if self.verbose: print(f"Already reached the end URL: {self.end_url}")
+            self.found = True
+            return 0
+        self._done = asyncio.Event()
+        self._pushed = asyncio.Event()
+        self._in_flight = 0
+        self._error = None
+        # Popped by this crawl and not yet completed or failed
+        self._claimed = set()
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        pool = ProcessPoolExecutor(self.parse_workers) if self.parse_workers else None
+        self._frontier_pool = ThreadPoolExecutor(self.concurrency) if self.frontier.blocking else None
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                             headers={'User-Agent': 'Dancing_with_Data classwork crawler'}) as session:
+                workers = [asyncio.create_task(self._worker(session, pool)) for _ in range(self.concurrency)]
+                await self._done.wait()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+            if self._frontier_pool is not None:
+                # Cancelled workers' frontier calls still finish on the pool
+                self._frontier_pool.shutdown()
+            if self._error is not None:
+                # Pages left in progress are put back by the next run's recover()
+                raise self._error
+            # Pages still in flight when the crawl stopped go back in the queue;
+            # those completed or failed meanwhile are no longer in progress
+            self.frontier.release(list(self._claimed))
+        finally:
+            if self._frontier_pool is not None:
+                self._frontier_pool.shutdown(cancel_futures=True)
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        if self.verbose and not self.found: print("End URL not found")
+        return self.number_of_pages_visited
+
+    def run(self):
+        start = time.perf_counter()
+        pages = asyncio.run(self.crawl())
+        self.elapsed = time.perf_counter() - start
+        return pages
@@ -0,0 +1,98 @@
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+
+from async_crawl import AsyncCrawler, extract_wiki_links
+from link_graph import LinkGraph
+from simple_scrape import Crawler
+
+# Pages/sec of the serial mechanicalsoup crawl against the async crawler,
+# both searching the same generated graph served by wiki_server.py. The end
+# page is the --target'th page of a breadth-first walk, so every crawl
+# visits roughly that many pages.
+
+
+def bfs_page(graph, target, is_valid_link):
+    seen = {0}
+    order = deque([0])
+    visited = 0
+    while order:
+        page = order.popleft()
+        visited += 1
+        if visited == target:
+            return page
+        for href in graph.hrefs(page):
+            if is_valid_link(href):
+                next_page = graph.page_of(href)
+                if next_page is not None and next_page not in seen:
+                    seen.add(next_page)
+                    order.append(next_page)
+    return page
+
+
+@contextlib.contextmanager
+def wiki_server(pages, links, latency):
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wiki_server.py'),
+                               '--pages', str(pages), '--links', str(links), '--latency', str(latency)],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        yield f'http://127.0.0.1:{server.stdout.readline().strip()}'
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serial vs async crawl of a local Wikipedia-like site')
+    parser.add_argument('--pages', type=int, default=100_000, help='articles in the generated graph')
+    parser.add_argument('--links', type=int, default=80)
+    parser.add_argument('--target', type=int, default=1000, help='BFS position of the end page')
+    parser.add_argument('--latency', type=float, default=0.02, help='server-side delay per page, in seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 64])
+    parser.add_argument('--per-host', type=int, default=64)
+    parser.add_argument('--skip-serial', action='store_true')
+    args = parser.parse_args()
+
+    graph = LinkGraph(args.pages, args.links)
+    from bs4 import BeautifulSoup
+    html = graph.html(0)
+    for label, extract in (('BeautifulSoup find_all', lambda: BeautifulSoup(html, 'html.parser').find_all('a', href=True)),
+                           ('extract_wiki_links', lambda: extract_wiki_links(html))):
+        start = time.perf_counter()
+        for _ in range(100):
+            extract()
+        print(f"{label:<34}{(time.perf_counter() - start) * 10:7.2f}ms per page")
+
+    with wiki_server(args.pages, args.links, args.latency) as base:
+        is_valid_link = Crawler(base, base).is_valid_link
+        start_url, end_url = base + graph.path(0), base + graph.path(bfs_page(graph, args.target, is_valid_link))
+        print(f"{args.pages:,} articles, ~{args.links} links each, {args.latency * 1000:.0f}ms per page, "
+              f"end page at BFS position {args.target:,}")
+
+        if not args.skip_serial:
+            crawler = Crawler(start_url, end_url)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                crawler.crawl()
+            elapsed = time.perf_counter() - start
+            print(f"{'serial mechanicalsoup':<34}{len(crawler.visited):>7,} pages {elapsed:7.2f}s "
+                  f"{len(crawler.visited) / elapsed:8.1f} pages/s")
+
+        for concurrency in args.concurrency:
+            for workers in (0, os.cpu_count()):
+                crawler = AsyncCrawler(start_url, end_url, is_valid_link,
+                                       concurrency=concurrency, per_host=min(args.per_host, concurrency),
+                                       parse_workers=workers)
+                pages = crawler.run()
+                label = f"async x{concurrency}, {'inline parse' if not workers else f'{workers} parse procs'}"
+                print(f"{label:<34}{pages:>7,} pages {crawler.elapsed:7.2f}s {pages / crawler.elapsed:8.1f} pages/s"
+                      f"{'' if crawler.found else '  (end page not reached)'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import time
+
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import ApiError, Elasticsearch
+
+from es_bulk import BulkIndexer
+from fake_elasticsearch import FakeElasticsearch
+from link_graph import LinkGraph
+
+# Per-page es.index (what save_to_elasticsearch did) against BulkIndexer,
+# storing generated article pages in fake_elasticsearch.py. --latency adds a
+# server-side delay per request to stand in for the network round trip.
+# Also checks that every page lands despite rejected items and failed
+# requests, and that a re-crawl overwrites instead of duplicating.
+
+
+def client(fake, compress=False):
+    # The client's own retries are off so failures reach BulkIndexer
+    return Elasticsearch(fake.url, http_compress=compress, max_retries=0, request_timeout=60)
+
+
+class RejectOnce():
+    # Client whose first _bulk request is refused outright with a 400
+    def __init__(self, es):
+        self.es = es
+        self.rejected = False
+
+    def bulk(self, **kwargs):
+        if not self.rejected:
+            self.rejected = True
+            meta = ApiResponseMeta(400, '1.1', HttpHeaders(), 0.0, NodeConfig('http', '127.0.0.1', 9200))
+            raise ApiError('rejected', meta, {'error': 'bad request'})
+        return self.es.bulk(**kwargs)
+
+
+def per_page(es, pages):
+    for url, html in pages:
+        es.index(index='scrape', body={'url': url, 'html': html})
+
+
+def bulk(es, pages, **options):
+    with BulkIndexer(es, index='scrape', **options) as indexer:
+        for url, html in pages:
+            indexer.add(url, html)
+    return indexer
+
+
+def report(label, fake, elapsed, n):
+    stats = fake.stats
+    print(f"{label:<28} {n / elapsed:>9,.0f} docs/s  {stats['requests']:>6,} requests  "
+          f"{stats['request_bytes'] / 2 ** 20:>8,.1f} MiB sent")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-page vs bulk indexing into a fake Elasticsearch')
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--links', type=int, default=80)
+    parser.add_argument('--latency', type=float, default=0.002, help='server-side delay per request, in seconds')
+    parser.add_argument('--batch', type=int, default=500, help='max_docs per bulk request')
+    args = parser.parse_args()
+
+    graph = LinkGraph(max(args.docs, 1000), args.links)
+    pages = [(graph.url(page), graph.html(page)) for page in range(args.docs)]
+    print(f"{args.docs:,} pages, {sum(len(html) for _, html in pages) / 2 ** 20:.1f} MiB of HTML, "
+          f"{args.latency * 1000:.0f} ms per request\n")
+
+    for label, run, compress in [
+            ('es.index per page (before)', lambda es: per_page(es, pages), False),
+            ('bulk, html', lambda es: bulk(es, pages, max_docs=args.batch), False),
+            ('bulk, html, gzip', lambda es: bulk(es, pages, max_docs=args.batch), True),
+            ('bulk, text', lambda es: bulk(es, pages, max_docs=args.batch, store='text'), False),
+            ('bulk, text, gzip', lambda es: bulk(es, pages, max_docs=args.batch, store='text'), True)]:
+        with FakeElasticsearch(latency=args.latency) as fake:
+            es = client(fake, compress)
+            start = time.perf_counter()
+            run(es)
+            report(label, fake, time.perf_counter() - start, args.docs)
+            assert len(fake.documents('scrape')) == args.docs
+
+    print("\nflaky cluster: 20% of items rejected with 429, 10% of requests failing with 503")
+    with FakeElasticsearch(item_reject_rate=0.2, request_error_rate=0.1, seed=1) as fake:
+        indexer = bulk(client(fake), pages, max_docs=args.batch, max_retries=5, backoff=0.01)
+        stored = len(fake.documents('scrape'))
+        print(f"  {stored:,} of {args.docs:,} stored, {indexer.stats['retried']:,} documents retried, "
+              f"{indexer.stats['failed']:,} given up, {fake.stats['failed_requests']} requests failed")
+
+    print("\nrequest refused once with a non-retryable 400")
+    with FakeElasticsearch() as fake:
+        indexer = BulkIndexer(RejectOnce(client(fake)), index='scrape', max_docs=args.batch)
+        errors = 0
+        for url, html in pages:
+            try:
+                indexer.add(url, html)
+            except ApiError:
+                errors += 1
+        indexer.close()
+        stored = len(fake.documents('scrape'))
+        print(f"  {errors} request raised, {stored:,} of {args.docs:,} stored once the batch was resent")
+        assert stored == args.docs
+
+    print("\nre-crawl: every page indexed twice")
+    with FakeElasticsearch() as fake:
+        es = client(fake)
+        per_page(es, pages)
+        per_page(es, pages)
+        print(f"  es.index with generated ids: {len(fake.documents('scrape')):,} documents")
+    with FakeElasticsearch() as fake:
+        es = client(fake)
+        bulk(es, pages, max_docs=args.batch)
+        bulk(es, pages, max_docs=args.batch)
+        print(f"  BulkIndexer with URL ids: {len(fake.documents('scrape')):,} documents "
+              f"({fake.stats['updated']:,} updated in place)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import time
+from urllib.parse import urljoin
+
+import redis
+
+from frontier import RedisFrontier
+from link_graph import LinkGraph
+
+# Breadth-first "crawls" of a generated link graph straight through the
+# frontier (no HTTP or HTML), reporting links/sec as the number of seen URLs
+# grows. Needs a Redis server; keys go under bench-*: and are removed after.
+# python classworks/bench_frontier.py --redis redis://localhost:6379/15
+# --fakeredis runs against the in-process emulator instead (pip install
+# fakeredis lupa): no network round trips and its Lua is much slower than
+# Redis's, so only the relative numbers mean anything.
+
+
+def is_valid_link(link) -> bool:
+    return link.startswith('/wiki/') and not link.startswith(
+        ('/wiki/Special:', '/wiki/File:', '/wiki/User:', '/wiki/Talk:', '/wiki/Category:'))
+
+
+def page_links(graph, current_url):
+    page = graph.page_of(current_url)
+    return [urljoin(current_url, href) for href in graph.hrefs(page) if is_valid_link(href)]
+
+
+class ListFrontier():
+    # What Crawler.crawl did before: an in-process visited set, and for every
+    # link an LREM over the whole queue plus an RPUSH, one round trip each
+    def __init__(self, redis_client, prefix='bench-list'):
+        self.redis = redis_client
+        self.queue_key = f'{prefix}:queue'
+        self.visited = set()
+        self.redis.delete(self.queue_key)
+
+    def push(self, urls) -> int:
+        added = 0
+        for url in urls:
+            if url not in self.visited and self.redis.lrem(self.queue_key, 0, url) == 0:
+                self.redis.rpush(self.queue_key, url)
+                added += 1
+        return added
+
+    def pop(self):
+        url = self.redis.lpop(self.queue_key)
+        if url is None:
+            return None
+        url = url.decode('utf-8')
+        self.visited.add(url)
+        return url
+
+    def complete(self, url, links=()) -> int:
+        return self.push(links)
+
+    def reset(self) -> None:
+        self.redis.delete(self.queue_key)
+
+
+def memory(client, frontier):
+    try:
+        return f"redis used_memory {client.info('memory')['used_memory_human']}"
+    except redis.ResponseError:
+        # The emulator has no INFO: report the size of the seen-URL structure
+        seen_key = getattr(frontier, 'seen_key', None)
+        if seen_key is None:
+            return "seen URLs kept in process"
+        if frontier.bloom_bits:
+            size = client.strlen(seen_key)
+        else:
+            size = sum(len(url) for url in client.sscan_iter(seen_key, count=10_000))
+        return f"seen structure {size / 2 ** 20:,.1f} MiB"
+
+
+def run(label, frontier, graph, max_seen, time_limit, client):
+    frontier.reset()
+    frontier.push([graph.url(0)])
+    seen, links, pages = 1, 0, 0
+    checkpoint = 10_000
+    start = last = time.perf_counter()
+    last_links = 0
+    print(f"{label}")
+    while seen < max_seen:
+        url = frontier.pop()
+        if url is None:
+            break
+        hrefs = page_links(graph, url)
+        seen += frontier.complete(url, hrefs)
+        links += len(hrefs)
+        pages += 1
+        now = time.perf_counter()
+        if seen >= checkpoint or now - start > time_limit:
+            print(f"  seen {seen:>10,}  pages {pages:>8,}  {(links - last_links) / (now - last):>10,.0f} links/s")
+            last, last_links = now, links
+            while checkpoint <= seen:
+                checkpoint *= 10 if checkpoint >= 100_000 else 2
+            if now - start > time_limit:
+                print(f"  stopped after {time_limit:.0f}s")
+                break
+    elapsed = time.perf_counter() - start
+    print(f"  total {links:,} links from {pages:,} pages in {elapsed:.1f}s: {links / elapsed:,.0f} links/s, "
+          f"{memory(client, frontier)}")
+    frontier.reset()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Frontier throughput on a Wikipedia-like link graph')
+    parser.add_argument('--redis', default='redis://localhost:6379/15')
+    parser.add_argument('--pages', type=int, default=5_000_000, help='articles in the generated graph')
+    parser.add_argument('--links', type=int, default=80, help='mean links per article')
+    parser.add_argument('--max-seen', type=int, default=2_000_000, help='stop once this many URLs were queued')
+    parser.add_argument('--time-limit', type=float, default=120, help='seconds per frontier')
+    parser.add_argument('--skip-list', action='store_true', help="don't run the old LREM frontier")
+    parser.add_argument('--fakeredis', action='store_true', help='use the in-process fakeredis emulator')
+    args = parser.parse_args()
+
+    if args.fakeredis:
+        import fakeredis
+        client = fakeredis.FakeRedis()
+    else:
+        client = redis.Redis.from_url(args.redis)
+    graph = LinkGraph(args.pages, args.links)
+    if not args.skip_list:
+        run('list + LREM (before)', ListFrontier(client), graph, args.max_seen, min(args.time_limit, 30), client)
+    run('set frontier', RedisFrontier(client, prefix='bench-set'), graph, args.max_seen, args.time_limit, client)
+    run('bloom frontier', RedisFrontier(client, prefix='bench-bloom', bloom_capacity=args.max_seen * 2), graph,
+        args.max_seen, args.time_limit, client)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import random
+import tempfile
+import urllib.request
+from collections import deque
+
+from async_crawl import AsyncCrawler
+from bench_async_crawl import wiki_server
+from link_graph import LinkGraph
+from shortest_path import AdjacencyCache, BidirectionalSearch, title_of
+
+# Pages fetched and wall time to get from a random start page to a random
+# end page of a generated graph served by wiki_server.py: the BFS crawl
+# (AsyncCrawler, and the page count a serial crawl would need), against the
+# bidirectional search with an empty cache, the same query again, and a new
+# start for the same end page. Every path is checked against the graph and
+# against the BFS distance.
+
+
+def is_valid_link(link) -> bool:
+    return link.startswith('/wiki/') and not link.startswith(
+        ('/wiki/Special:', '/wiki/File:', '/wiki/User:', '/wiki/Talk:', '/wiki/Category:'))
+
+
+def bfs(graph, start, end):
+    # (pages a serial BFS crawl opens before it reaches end, link distance)
+    depth = {start: 0}
+    order = deque([start])
+    opened = 0
+    while order:
+        page = order.popleft()
+        opened += 1
+        if page == end:
+            return opened, depth[page]
+        for target in graph.links(page):
+            if target not in depth:
+                depth[target] = depth[page] + 1
+                order.append(target)
+    return opened, None
+
+
+def check(graph, path, distance):
+    pages = [graph.page_of(title_of(url)) for url in path]
+    assert all(b in graph.links(a) for a, b in zip(pages, pages[1:])), f"not a path: {path}"
+    assert len(path) - 1 == distance, f"{len(path) - 1} clicks, BFS says {distance}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BFS crawl vs bidirectional search on a local link graph')
+    parser.add_argument('--pages', type=int, default=20_000, help='articles in the generated graph')
+    parser.add_argument('--links', type=int, default=80)
+    parser.add_argument('--queries', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.005, help='server-side delay per request, in seconds')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--bfs-limit', type=int, default=20_000, help='stop the BFS crawl after this many pages')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    graph = LinkGraph(args.pages, args.links)
+    rng = random.Random(args.seed)
+    with wiki_server(args.pages, args.links, args.latency) as base, tempfile.TemporaryDirectory() as cache_dir:
+        # The server inverts its graph on the first backlinks query
+        urllib.request.urlopen(f'{base}/w/api.php?action=query&list=backlinks&bltitle=Article_0&bllimit=1').read()
+        totals = {}
+
+        def record(label, pages, seconds):
+            total = totals.setdefault(label, [0, 0.0])
+            total[0] += pages
+            total[1] += seconds
+            print(f"  {label:<24} {pages:>8,} fetches  {seconds:>7.2f}s")
+
+        for query in range(args.queries):
+            start, end = rng.randrange(args.pages), rng.randrange(graph.hubs, args.pages)
+            serial_pages, distance = bfs(graph, start, end)
+            print(f"{graph.title(start)} -> {graph.title(end)}: {distance} clicks, "
+                  f"serial BFS would open {serial_pages:,} pages")
+            crawler = AsyncCrawler(f'{base}/wiki/{graph.title(start)}', f'{base}/wiki/{graph.title(end)}', is_valid_link,
+                                   concurrency=args.concurrency, per_host=args.concurrency, parse_workers=0,
+                                   max_pages=args.bfs_limit)
+            crawler.run()
+            record('BFS crawl' + ('' if crawler.found else ' (gave up)'), crawler.number_of_pages_visited, crawler.elapsed)
+
+            for label, start_page in [('bidirectional, cold', start), ('same query again', start),
+                                      ('new start, same end', rng.randrange(args.pages))]:
+                search = BidirectionalSearch(f'{base}/wiki/{graph.title(start_page)}', f'{base}/wiki/{graph.title(end)}',
+                                             is_valid_link, cache=AdjacencyCache(cache_dir),
+                                             concurrency=args.concurrency, per_host=args.concurrency)
+                path = search.run()
+                check(graph, path, bfs(graph, start_page, end)[1])
+                record(label, search.fetches, search.elapsed)
+
+        print(f"\nmean over {args.queries} queries")
+        for label, (pages, seconds) in totals.items():
+            print(f"  {label:<24} {pages / args.queries:>10,.0f} fetches  {seconds / args.queries:>7.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,47 +1,71 @@
 import mechanicalsoup as ms
 from urllib.parse import urljoin
 import redis
+import requests
+import os
+import sys
 from elasticsearch import Elasticsearch
+from frontier import RedisFrontier
+from es_bulk import BulkIndexer
 import final_project.utils.config as config
 
 
 class Crawler():
-    def __init__(self, start_url, end_url):
-        self.visited = set()
-        # Use Redis to store the URLs to visit
+    def __init__(self, start_url, end_url, fresh=False):
+        # Use Redis to store the URLs to visit, every URL seen so far and the
+        # visited pages, so an interrupted crawl resumes where it stopped
         self.redis_client = redis.Redis()
-        self.queue_key = 'to_visit'
-        self.redis_client.rpush(self.queue_key, start_url)
+        self.frontier = RedisFrontier(self.redis_client, prefix='to_visit')
+        if fresh:
+            self.frontier.reset()
+        # Pages a previous run popped but never finished go back in the queue
+        self.frontier.recover()
+        self.frontier.push([start_url])
         self.end_url = end_url
         self.browser = ms.StatefulBrowser()
         # Store the HTML of visited pages in Elasticsearch
         elastic_key = config.key
         self.es = Elasticsearch("https://22246d944b014887a28dfb53f4f8ed0c.us-central1.gcp.cloud.es.io:443",
-                                    api_key=elastic_key)
+                                    api_key=elastic_key, http_compress=True)
+        # SCRAPE_STORE=text keeps the page text and outlinks instead of the HTML
+        self.indexer = BulkIndexer(self.es, index='scrape', store=os.getenv('SCRAPE_STORE', 'html'))
 
         
     def crawl(self, verbose=False) -> None:
+        if self.frontier.is_visited(self.end_url):
+            if verbose: print(f"Already reached the end URL: {self.end_url} (run with --fresh to crawl again)")
+            return
         # While there are still links to visit, crawl the pages until the end URL is found
-        while self.redis_client.llen(self.queue_key) > 0:
-            # Pop from the front of the list
-            current_url = self.redis_client.lpop(self.queue_key).decode('utf-8')
-            self.visited.add(current_url)
-            self.browser.open(current_url)
+        while True:
+            # Pop from the front of the queue; it is marked visited once its links are queued
+            current_url = self.frontier.pop()
+            if current_url is None:
+                break
+            try:
+                response = self.browser.open(current_url)
+            except requests.RequestException as e:
+                # Back in the queue, up to the frontier's max_attempts
+                print(f"Error fetching {current_url}: {e!r}")
+                self.frontier.fail(current_url)
+                continue
             if verbose: print(f"{current_url}")
             
-            # save the page to Elasticsearch
-            page_html = self.browser.get_current_page().prettify()
-            self.save_to_elasticsearch(current_url, page_html)
+            # Queue the page for Elasticsearch as fetched; prettify() only
+            # added whitespace and a second serialization
+            self.save_to_elasticsearch(current_url, response.text)
               
             if current_url == self.end_url:
+                self.frontier.complete(current_url)
                 if verbose: print(f"Reached the end URL: {self.end_url}")
                 return  # Exit after finding the end URL
+            links = []
             for link in self.browser.links():
                 href = link.get('href')
                 if href and self.is_valid_link(href):
-                    full_url = urljoin(current_url, href)
-                    if full_url not in self.visited and self.redis_client.lrem(self.queue_key, 0, full_url) == 0:
-                        self.redis_client.rpush(self.queue_key, full_url)
+                    links.append(urljoin(current_url, href))
+            # One round trip per page; Redis drops every URL it has seen before
+            # and marks this page visited in the same transaction
+            self.frontier.complete(current_url, links)
         if verbose: print("End URL not found")
     
     def is_valid_link(self, link) -> bool:
@@ -63,12 +87,15 @@ class Crawler():
                 return True
 
     def save_to_elasticsearch(self, url, html) -> None:
-        try:
-            self.es.index(index='scrape', body={'url': url, 'html': html})
-        except ConnectionError as e:
-            print(f"ConnectionError while saving to Elasticsearch: {e}")
+        # Buffered; pages go out in _bulk requests, see es_bulk.py
+        self.indexer.add(url, html)
 
 start_url = "https://en.wikipedia.org/wiki/Redis"
 end_url = "https://en.wikipedia.org/wiki/Jesus"
-crawler = Crawler(start_url, end_url)
-crawler.crawl(verbose=True)
+# Pass --fresh to forget the previous crawl instead of resuming it
+crawler = Crawler(start_url, end_url, fresh='--fresh' in sys.argv)
+try:
+    crawler.crawl(verbose=True)
+finally:
+    # Sends whatever is still buffered
+    crawler.indexer.close()
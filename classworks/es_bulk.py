@@ -0,0 +1,158 @@
+import hashlib
+import html as html_lib
+import json
+import re
+import threading
+import time
+
+from elasticsearch import ApiError, ConnectionError, ConnectionTimeout
+
+# Item and request statuses worth another attempt: overload and outages.
+# Anything else (a mapping conflict, a malformed document) fails the same
+# way every time.
+RETRYABLE = {429, 502, 503, 504}
+
+
+def document_id(url):
+    # Same URL, same document: re-crawls overwrite instead of duplicating
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+# Visible text by pattern rather than a parse tree, for the same reason as
+# async_crawl.WIKI_HREF: on article-sized pages an HTMLParser or
+# BeautifulSoup pass costs more than the rest of indexing put together.
+TITLE = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+INVISIBLE = re.compile(r'<(script|style|noscript|head)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+TAG = re.compile(r'<[^>]+>')
+SPACE = re.compile(r'\s+')
+
+
+def page_document(url, html, store='html'):
+    # store='html' keeps the page as fetched; store='text' keeps the visible
+    # text, the title and the /wiki/ outlinks, far smaller on real articles,
+    # which are mostly markup
+    if store == 'html':
+        return {'url': url, 'html': html, 'crawled_at': int(time.time())}
+    if store != 'text':
+        raise ValueError(f"Unknown store mode: {store}")
+    # Imported here so the html mode doesn't need aiohttp
+    from async_crawl import extract_wiki_links
+    title = TITLE.search(html)
+    text = SPACE.sub(' ', html_lib.unescape(TAG.sub(' ', INVISIBLE.sub(' ', html)))).strip()
+    return {'url': url, 'title': html_lib.unescape(title.group(1)).strip() if title else '', 'text': text,
+            'outlinks': list(dict.fromkeys(extract_wiki_links(html))), 'crawled_at': int(time.time())}
+
+
+class BulkIndexer():
+    # Buffers pages and sends them through the _bulk API: one request per
+    # max_docs pages, max_bytes of NDJSON, or flush_interval seconds since
+    # the oldest buffered page (checked on add), whichever comes first, and
+    # on close(). Documents are keyed by document_id(url), so indexing is an
+    # idempotent upsert. Items rejected with a retryable status, and whole
+    # requests that fail the same way, are resent up to max_retries times
+    # with exponential backoff; after that they are counted in
+    # stats['failed'] and dropped. A request refused with any other status
+    # raises, with its documents put back at the front of the buffer so the
+    # next flush (or close) sends them again. Thread-safe, so the async
+    # crawler's on_page threads can share one.
+    def __init__(self, es, index='scrape', store='html', max_docs=500, max_bytes=5 * 1024 * 1024,
+                 flush_interval=5.0, max_retries=3, backoff=0.5, verbose=False):
+        self.es = es
+        self.index = index
+        self.store = store
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.buffer = []  # (action line, source line)
+        self.buffer_bytes = 0
+        self.oldest = None
+        self.stats = {'added': 0, 'indexed': 0, 'failed': 0, 'retried': 0, 'requests': 0, 'bytes': 0}
+
+    def add(self, url, html) -> None:
+        source = json.dumps(page_document(url, html, self.store), ensure_ascii=False)
+        action = json.dumps({'index': {'_index': self.index, '_id': document_id(url)}})
+        with self.lock:
+            self.buffer.append((action, source))
+            self.buffer_bytes += len(action) + len(source) + 2
+            self.stats['added'] += 1
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            due = (len(self.buffer) >= self.max_docs or self.buffer_bytes >= self.max_bytes
+                   or time.monotonic() - self.oldest >= self.flush_interval)
+            batch = self._take() if due else None
+        if batch:
+            self._send(batch)
+
+    def _take(self):
+        batch = self.buffer
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.oldest = None
+        return batch
+
+    def _restore(self, batch) -> None:
+        with self.lock:
+            self.buffer[:0] = batch
+            self.buffer_bytes += sum(len(action) + len(source) + 2 for action, source in batch)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+
+    def flush(self) -> None:
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            operations = [line for pair in batch for line in pair]
+            try:
+                response = self.es.bulk(operations=operations)
+            except (ConnectionError, ConnectionTimeout) as e:
+                retry, error = batch, e
+            except ApiError as e:
+                if e.status_code not in RETRYABLE:
+                    self._restore(batch)
+                    raise
+                retry, error = batch, e
+            else:
+                retry, error = [], None
+                for pair, item in zip(batch, response['items']):
+                    result = next(iter(item.values()))
+                    if result['status'] < 300:
+                        self._count('indexed')
+                    elif result['status'] in RETRYABLE:
+                        retry.append(pair)
+                    else:
+                        self._count('failed')
+                        print(f"Elasticsearch rejected {result.get('_id')}: {result.get('error')}")
+            finally:
+                self._count('requests')
+                self._count('bytes', sum(len(line) + 1 for line in operations))
+            if not retry:
+                return
+            if attempt < self.max_retries:
+                self._count('retried', len(retry))
+                if self.verbose: print(f"Retrying {len(retry)} of {len(batch)} documents: {error or 'rejected'}")
+            batch = retry
+        self._count('failed', len(batch))
+        print(f"Gave up on {len(batch)} documents after {self.max_retries} retries")
+
+    def _count(self, name, value=1) -> None:
+        with self.lock:
+            self.stats[name] += value
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
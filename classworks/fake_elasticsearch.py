@@ -0,0 +1,187 @@
+import gzip
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class FakeElasticsearch():
+    # Just enough of the Elasticsearch REST API for the crawlers' indexing:
+    # cluster info, POST /<index>/_doc, POST /_bulk (NDJSON, gzip or plain),
+    # GET /<index>/_doc/<id> and GET /<index>/_count. Documents live in a
+    # dict. item_reject_rate makes individual bulk items fail with 429, and
+    # request_error_rate fails whole requests with 503, so the retry paths
+    # can be exercised; 'real' Elasticsearch clients talk to it unchanged.
+    def __init__(self, host='127.0.0.1', port=0, item_reject_rate=0.0, request_error_rate=0.0, latency=0.0, seed=0):
+        self.item_reject_rate = item_reject_rate
+        self.request_error_rate = request_error_rate
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.indices = {}
+        self.stats = {'requests': 0, 'bulk_requests': 0, 'index_requests': 0, 'request_bytes': 0,
+                      'items': 0, 'rejected_items': 0, 'failed_requests': 0, 'created': 0, 'updated': 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def documents(self, index):
+        with self.lock:
+            return dict(self.indices.get(index, {}))
+
+    def _store(self, index, doc_id, source):
+        with self.lock:
+            docs = self.indices.setdefault(index, {})
+            if doc_id is None:
+                doc_id = f'auto-{len(docs)}-{self.random.getrandbits(32):08x}'
+            result = 'updated' if doc_id in docs else 'created'
+            docs[doc_id] = source
+            self.stats[result] += 1
+        return doc_id, result
+
+    def bulk(self, lines, default_index=None):
+        items = []
+        i = 0
+        while i < len(lines):
+            action = json.loads(lines[i])
+            (op, meta), = action.items()
+            index = meta.get('_index', default_index)
+            doc_id = meta.get('_id')
+            i += 1
+            with self.lock:
+                self.stats['items'] += 1
+                rejected = self.random.random() < self.item_reject_rate
+            if op == 'delete':
+                with self.lock:
+                    found = self.indices.get(index, {}).pop(doc_id, None) is not None
+                items.append({op: {'_index': index, '_id': doc_id, 'status': 200 if found else 404,
+                                   'result': 'deleted' if found else 'not_found'}})
+                continue
+            source = json.loads(lines[i])
+            i += 1
+            if rejected:
+                with self.lock:
+                    self.stats['rejected_items'] += 1
+                items.append({op: {'_index': index, '_id': doc_id, 'status': 429, 'error': {
+                    'type': 'es_rejected_execution_exception', 'reason': 'rejected execution (queue capacity)'}}})
+                continue
+            if op == 'update':
+                with self.lock:
+                    current = dict(self.indices.get(index, {}).get(doc_id, {}))
+                current.update(source.get('doc', {}))
+                source = current
+            doc_id, result = self._store(index, doc_id, source)
+            items.append({op: {'_index': index, '_id': doc_id, 'status': 201 if result == 'created' else 200,
+                               'result': result}})
+        return {'took': 1, 'errors': any(item[next(iter(item))]['status'] >= 300 for item in items), 'items': items}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out as separate writes; without this the
+            # client's delayed ACK adds ~40 ms to every request
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('X-Elastic-Product', 'Elasticsearch')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _body(self):
+                raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with fake.lock:
+                    fake.stats['requests'] += 1
+                    fake.stats['request_bytes'] += len(raw)
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    raw = gzip.decompress(raw)
+                return raw.decode('utf-8')
+
+            def _fail(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                with fake.lock:
+                    failed = fake.random.random() < fake.request_error_rate
+                    if failed:
+                        fake.stats['failed_requests'] += 1
+                if failed:
+                    self._send(503, {'error': {'type': 'unavailable_shards_exception', 'reason': 'fake outage'},
+                                     'status': 503})
+                return failed
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                parts = [part for part in urlparse(self.path).path.split('/') if part]
+                if not parts:
+                    return self._send(200, {'name': 'fake', 'cluster_name': 'fake', 'tagline': 'You Know, for Search',
+                                            'version': {'number': '8.13.0', 'build_flavor': 'default'}})
+                if len(parts) == 3 and parts[1] == '_doc':
+                    source = fake.documents(parts[0]).get(parts[2])
+                    if source is None:
+                        return self._send(404, {'_index': parts[0], '_id': parts[2], 'found': False})
+                    return self._send(200, {'_index': parts[0], '_id': parts[2], 'found': True, '_source': source})
+                if len(parts) == 2 and parts[1] == '_count':
+                    return self._send(200, {'count': len(fake.documents(parts[0]))})
+                self._send(404, {'error': f'unknown path {self.path}', 'status': 404})
+
+            def do_POST(self):
+                body = self._body()
+                if self._fail():
+                    return
+                parts = [part for part in urlparse(self.path).path.split('/') if part]
+                if parts and parts[-1] == '_bulk':
+                    with fake.lock:
+                        fake.stats['bulk_requests'] += 1
+                    lines = [line for line in body.split('\n') if line.strip()]
+                    return self._send(200, fake.bulk(lines, parts[0] if len(parts) == 2 else None))
+                if len(parts) in (2, 3) and parts[1] == '_doc':
+                    with fake.lock:
+                        fake.stats['index_requests'] += 1
+                    doc_id, result = fake._store(parts[0], parts[2] if len(parts) == 3 else None, json.loads(body))
+                    return self._send(201 if result == 'created' else 200,
+                                      {'_index': parts[0], '_id': doc_id, 'result': result})
+                self._send(404, {'error': f'unknown path {self.path}', 'status': 404})
+
+            do_PUT = do_POST
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    with FakeElasticsearch(port=int(sys.argv[1]) if len(sys.argv) > 1 else 9200) as fake:
+        print(f"Fake Elasticsearch listening on {fake.url}")
+        fake.thread.join()
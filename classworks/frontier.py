@@ -0,0 +1,290 @@
+import hashlib
+import math
+from collections import deque
+
+# Queues every URL not seen before, in one round trip for a whole page of
+# links. SADD answers "seen before?" in O(1) and the check and the push
+# happen atomically, so several crawlers can share one frontier.
+PUSH_NEW = """
+local added = 0
+for _, url in ipairs(ARGV) do
+    if redis.call('SADD', KEYS[1], url) == 1 then
+        redis.call('RPUSH', KEYS[2], url)
+        added = added + 1
+    end
+end
+redis.call('INCRBY', KEYS[3], added)
+return added
+"""
+
+# Same with a Bloom filter in a Redis bitmap instead of a set. ARGV is k,
+# then each URL followed by its k bit offsets. A URL is new if any of its
+# bits was still 0.
+PUSH_NEW_BLOOM = """
+local k = tonumber(ARGV[1])
+local added = 0
+for i = 2, #ARGV, k + 1 do
+    local new = false
+    for j = 1, k do
+        if redis.call('SETBIT', KEYS[1], ARGV[i + j], 1) == 0 then
+            new = true
+        end
+    end
+    if new then
+        redis.call('RPUSH', KEYS[2], ARGV[i])
+        added = added + 1
+    end
+end
+redis.call('INCRBY', KEYS[3], added)
+return added
+"""
+
+# Takes the next URL and records it as in progress in one step. It only
+# becomes visited once complete() has queued its links.
+POP = """
+local url = redis.call('LPOP', KEYS[1])
+if url then
+    redis.call('SADD', KEYS[2], url)
+end
+return url
+"""
+
+# A page that could not be crawled goes back to the end of the queue until
+# it has failed ARGV[2] times, then into the failed set
+FAIL = """
+redis.call('SREM', KEYS[1], ARGV[1])
+local attempts = redis.call('HINCRBY', KEYS[3], ARGV[1], 1)
+if attempts < tonumber(ARGV[2]) then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('SADD', KEYS[4], ARGV[1])
+return 0
+"""
+
+# Puts in-progress URLs back at the front of the queue: ARGV, or all of them
+RELEASE = """
+local urls = ARGV
+if #urls == 0 then
+    urls = redis.call('SMEMBERS', KEYS[1])
+end
+local released = 0
+for i = #urls, 1, -1 do
+    if redis.call('SREM', KEYS[1], urls[i]) == 1 then
+        redis.call('LPUSH', KEYS[2], urls[i])
+        released = released + 1
+    end
+end
+return released
+"""
+
+
+class RedisFrontier():
+    # Crawl frontier kept entirely in Redis under <prefix>:*, so a crawl can
+    # be stopped and resumed, or shared between processes:
+    #   <prefix>:queue     list of URLs still to visit, in discovery order
+    #   <prefix>:seen      every URL ever queued (set, or a Bloom bitmap)
+    #   <prefix>:active    URLs popped but not yet completed
+    #   <prefix>:visited   every URL whose links have been queued
+    #   <prefix>:attempts  failures so far of URLs being retried
+    #   <prefix>:failed    URLs given up on after max_attempts
+    #   <prefix>:queued    count of URLs ever queued
+    # A page is only marked visited once complete() has queued its links,
+    # in the same transaction, so a fetch that fails or a crawler that dies
+    # mid-page never loses outlinks: fail() re-queues the page, and
+    # recover() puts whatever a dead crawler left in progress back at the
+    # front of the queue.
+    # With bloom_capacity set, the seen set becomes a Bloom filter sized for
+    # that many URLs at error_rate: a fixed ~1.8 bytes per URL at 0.1%
+    # instead of the full URL, at the cost of skipping that fraction of
+    # genuinely new URLs. Every call is a blocking round trip, so async
+    # crawlers make them off the event loop.
+    blocking = True
+
+    def __init__(self, redis_client, prefix='crawl', bloom_capacity=None, error_rate=0.001, batch_size=1000,
+                 max_attempts=3):
+        self.redis = redis_client
+        self.queue_key = f'{prefix}:queue'
+        self.seen_key = f'{prefix}:seen'
+        self.active_key = f'{prefix}:active'
+        self.visited_key = f'{prefix}:visited'
+        self.attempts_key = f'{prefix}:attempts'
+        self.failed_key = f'{prefix}:failed'
+        self.queued_key = f'{prefix}:queued'
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.bloom_bits = None
+        if bloom_capacity:
+            self.bloom_bits = math.ceil(-bloom_capacity * math.log(error_rate) / math.log(2) ** 2)
+            self.bloom_hashes = max(1, round(self.bloom_bits / bloom_capacity * math.log(2)))
+            self._push_script = redis_client.register_script(PUSH_NEW_BLOOM)
+        else:
+            self._push_script = redis_client.register_script(PUSH_NEW)
+        self._pop_script = redis_client.register_script(POP)
+        self._fail_script = redis_client.register_script(FAIL)
+        self._release_script = redis_client.register_script(RELEASE)
+
+    def _bloom_offsets(self, url):
+        # k positions by double hashing one 128-bit digest
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bloom_bits for i in range(self.bloom_hashes)]
+
+    def _queue(self, pipe, urls) -> int:
+        # Adds the push script calls for `urls` to the pipeline; returns how many
+        keys = [self.seen_key, self.queue_key, self.queued_key]
+        calls = 0
+        for i in range(0, len(urls), self.batch_size):
+            batch = urls[i:i + self.batch_size]
+            if self.bloom_bits:
+                args = [self.bloom_hashes]
+                for url in batch:
+                    args.append(url)
+                    args.extend(self._bloom_offsets(url))
+            else:
+                args = batch
+            self._push_script(keys=keys, args=args, client=pipe)
+            calls += 1
+        return calls
+
+    def push(self, urls) -> int:
+        # Queues the URLs not seen before; returns how many that was. Large
+        # pages go out as several script calls in one pipelined round trip.
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue(pipe, urls)
+        return sum(pipe.execute())
+
+    def pop(self):
+        # Next URL to visit, or None when the frontier is empty. The URL is
+        # in progress until complete(), fail() or release() is called for it.
+        url = self._pop_script(keys=[self.queue_key, self.active_key])
+        return url.decode('utf-8') if url is not None else None
+
+    def complete(self, url, links=()) -> int:
+        # Queues a crawled page's links and marks it visited, in one
+        # MULTI/EXEC round trip; returns how many links were new
+        links = list(dict.fromkeys(links))
+        pipe = self.redis.pipeline(transaction=True)
+        calls = self._queue(pipe, links)
+        pipe.srem(self.active_key, url)
+        pipe.hdel(self.attempts_key, url)
+        pipe.sadd(self.visited_key, url)
+        return sum(pipe.execute()[:calls])
+
+    def fail(self, url) -> bool:
+        # Re-queues a page that could not be crawled; False once it has
+        # failed max_attempts times and was given up on
+        return bool(self._fail_script(keys=[self.active_key, self.queue_key, self.attempts_key, self.failed_key],
+                                      args=[url, self.max_attempts]))
+
+    def release(self, urls) -> int:
+        # Puts pages this crawler popped but never got to back at the front
+        return self._release_script(keys=[self.active_key, self.queue_key], args=list(urls)) if urls else 0
+
+    def recover(self) -> int:
+        # Puts every in-progress page back at the front of the queue. Call it
+        # when a crawl starts: anything still in progress was left by a
+        # crawler that died. (With several live crawlers sharing the
+        # frontier, their pages in flight may then be fetched twice.)
+        return self._release_script(keys=[self.active_key, self.queue_key])
+
+    def is_visited(self, url) -> bool:
+        return bool(self.redis.sismember(self.visited_key, url))
+
+    def __len__(self):
+        return self.redis.llen(self.queue_key)
+
+    def stats(self):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.llen(self.queue_key)
+        pipe.get(self.queued_key)
+        pipe.scard(self.active_key)
+        pipe.scard(self.visited_key)
+        pipe.scard(self.failed_key)
+        queued, seen, active, visited, failed = pipe.execute()
+        return {'queued': queued, 'seen': int(seen or 0), 'active': active, 'visited': visited, 'failed': failed}
+
+    def reset(self) -> None:
+        # Forgets this crawl only; other data in the Redis database is left alone
+        self.redis.delete(self.queue_key, self.seen_key, self.active_key, self.visited_key, self.attempts_key,
+                          self.failed_key, self.queued_key)
+
+
+class MemoryFrontier():
+    # RedisFrontier's interface over in-process structures, for crawls that
+    # don't need to survive a restart
+    blocking = False
+
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+        self.queue = deque()
+        self.seen = set()
+        self.active = set()
+        self.visited = set()
+        self.attempts = {}
+        self.failed = set()
+
+    def push(self, urls) -> int:
+        added = 0
+        for url in urls:
+            if url not in self.seen:
+                self.seen.add(url)
+                self.queue.append(url)
+                added += 1
+        return added
+
+    def pop(self):
+        if not self.queue:
+            return None
+        url = self.queue.popleft()
+        self.active.add(url)
+        return url
+
+    def complete(self, url, links=()) -> int:
+        added = self.push(links)
+        self.active.discard(url)
+        self.attempts.pop(url, None)
+        self.visited.add(url)
+        return added
+
+    def fail(self, url) -> bool:
+        self.active.discard(url)
+        self.attempts[url] = self.attempts.get(url, 0) + 1
+        if self.attempts[url] < self.max_attempts:
+            self.queue.append(url)
+            return True
+        del self.attempts[url]
+        self.failed.add(url)
+        return False
+
+    def release(self, urls) -> int:
+        released = [url for url in urls if url in self.active]
+        self.active.difference_update(released)
+        self.queue.extendleft(reversed(released))
+        return len(released)
+
+    def recover(self) -> int:
+        return self.release(list(self.active))
+
+    def is_visited(self, url) -> bool:
+        return url in self.visited
+
+    def __len__(self):
+        return len(self.queue)
+
+    def stats(self):
+        return {'queued': len(self.queue), 'seen': len(self.seen), 'active': len(self.active),
+                'visited': len(self.visited), 'failed': len(self.failed)}
+
+    def reset(self) -> None:
+        self.queue.clear()
+        self.seen.clear()
+        self.active.clear()
+        self.visited.clear()
+        self.attempts.clear()
+        self.failed.clear()
@@ -0,0 +1,93 @@
+import random
+from array import array
+
+WIKI_PREFIX = 'https://en.wikipedia.org'
+
+# Links on a real article that is_valid_link() has to throw away
+NOISE_LINKS = ['/wiki/Special:Random', '/wiki/File:Example.jpg', '/wiki/Category:Articles',
+               '/wiki/Talk:Main_Page', '/wiki/User:Example', '#cite_note-1', '//foundation.wikimedia.org/',
+               'https://www.example.com/', '/w/index.php?title=Main_Page&action=edit']
+
+
+class LinkGraph():
+    # Deterministic stand-in for Wikipedia's article graph, large enough to
+    # push a frontier into the millions without storing any edges: page i's
+    # out-links are regenerated from (seed, i) whenever they are asked for.
+    # Out-degrees are heavy-tailed around mean_links, and a `popular` share
+    # of links point at a small core of hub articles, the way every article
+    # links to countries and years; the rest are spread over the whole graph
+    # so the frontier keeps growing.
+    def __init__(self, n_pages, mean_links=80, popular=0.5, hubs=1000, seed=0):
+        self.n_pages = n_pages
+        self.mean_links = mean_links
+        self.popular = popular
+        self.hubs = min(hubs, n_pages)
+        self.seed = seed
+        self._reverse = None
+
+    def title(self, page):
+        return f'Article_{page}'
+
+    def path(self, page):
+        return f'/wiki/{self.title(page)}'
+
+    def url(self, page):
+        return WIKI_PREFIX + self.path(page)
+
+    def page_of(self, path):
+        # Inverse of path(); None for anything that isn't one of our articles
+        name = path.rsplit('/wiki/', 1)[-1]
+        if not name.startswith('Article_'):
+            return None
+        try:
+            page = int(name[len('Article_'):])
+        except ValueError:
+            return None
+        return page if 0 <= page < self.n_pages else None
+
+    def links(self, page):
+        # Out-links of `page` as page numbers, in document order
+        rng = random.Random(self.seed * 1_000_003 + page)
+        degree = min(int(rng.paretovariate(2.0) * self.mean_links / 2), 20 * self.mean_links)
+        hubs, n = self.hubs, self.n_pages
+        return [int(hubs * rng.random() ** 2) if rng.random() < self.popular else rng.randrange(n)
+                for _ in range(degree)]
+
+    def backlinks(self, page):
+        # Pages linking to `page`, ascending. The first call inverts the whole
+        # graph (two passes over links(), a few seconds per 10k pages), so
+        # only the server and benchmarks ask for it.
+        if self._reverse is None:
+            self._reverse = self._invert()
+        starts, sources = self._reverse
+        return sources[starts[page]:starts[page + 1]]
+
+    def _invert(self):
+        n = self.n_pages
+        starts = array('I', [0]) * (n + 1)
+        for page in range(n):
+            for target in set(self.links(page)):
+                starts[target + 1] += 1
+        for page in range(n):
+            starts[page + 1] += starts[page]
+        fill = starts[:-1]
+        sources = array('I', [0]) * starts[n]
+        for page in range(n):
+            for target in set(self.links(page)):
+                sources[fill[target]] = page
+                fill[target] += 1
+        return starts, sources
+
+    def hrefs(self, page):
+        # links() as the hrefs a crawler sees, with a few links it must skip
+        rng = random.Random(self.seed * 7_000_003 + page)
+        hrefs = [self.path(target) for target in self.links(page)]
+        for noise in rng.sample(NOISE_LINKS, 3):
+            hrefs.insert(rng.randrange(len(hrefs) + 1), noise)
+        return hrefs
+
+    def html(self, page):
+        # A minimal article page with the links as anchors
+        anchors = '\n'.join(f'<p>See <a href="{href}">{href.rsplit("/", 1)[-1]}</a>.</p>' for href in self.hrefs(page))
+        return (f'<!DOCTYPE html><html><head><title>{self.title(page)} - Wikipedia</title></head>'
+                f'<body><h1>{self.title(page)}</h1>\n{anchors}\n</body></html>')
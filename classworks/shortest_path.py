@@ -0,0 +1,285 @@
+import asyncio
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from urllib.parse import quote, unquote, urljoin, urlparse
+
+import aiohttp
+
+from async_crawl import extract_wiki_links
+
+CACHE_DIR = os.getenv('GRAPH_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'graph_cache'))
+CSR_MAGIC = b'DWDCSR\x00\x01'
+CSR_HEADER = struct.Struct('<8sII')  # magic, nodes, edges
+DIRECTIONS = ('links', 'backlinks')
+
+
+def title_of(url):
+    # 'https://en.wikipedia.org/wiki/Caf%C3%A9' -> 'Café', with underscores
+    # for spaces, so page URLs and API titles meet on the same key
+    return unquote(urlparse(url).path.split('/wiki/', 1)[1]).replace(' ', '_')
+
+
+class AdjacencyCache():
+    # Every page the search has fetched, kept between runs so repeat queries
+    # only fetch what they haven't seen. Titles get dense integer ids, one
+    # title per line of titles.txt in id order, and each direction is a CSR
+    # file mapped straight from disk:
+    #   header, fetched flag per node (padded to 4 bytes),
+    #   indptr (nodes + 1 uint32), indices (edges uint32)
+    # Node i's neighbours are indices[indptr[i]:indptr[i + 1]] if its flag is
+    # set; a clear flag means never fetched, which is not the same as no
+    # links. Rows fetched since loading live in a dict until save().
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        self.titles = []
+        self.ids = {}
+        if directory and os.path.exists(os.path.join(directory, 'titles.txt')):
+            with open(os.path.join(directory, 'titles.txt'), encoding='utf-8') as f:
+                self.titles = f.read().split('\n')[:-1]
+            self.ids = {title: node for node, title in enumerate(self.titles)}
+        self.mapped = {direction: self._map(direction) for direction in DIRECTIONS}
+        self.fetched = {direction: {} for direction in DIRECTIONS}
+
+    def _map(self, direction):
+        path = os.path.join(self.directory or '', f'{direction}.csr')
+        if not self.directory or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        magic, n_nodes, n_edges = CSR_HEADER.unpack_from(view)
+        flag_bytes = -(-n_nodes // 4) * 4
+        if (magic != CSR_MAGIC or sys.byteorder != 'little' or n_nodes > len(self.titles)
+                or len(view) != CSR_HEADER.size + flag_bytes + 4 * (n_nodes + 1 + n_edges)):
+            # Stale or from a half-finished save: start that direction over
+            print(f"Ignoring unreadable adjacency cache {path}")
+            return None
+        offset = CSR_HEADER.size
+        flags = view[offset:offset + n_nodes]
+        offset += flag_bytes
+        indptr = view[offset:offset + 4 * (n_nodes + 1)].cast('I')
+        offset += 4 * (n_nodes + 1)
+        return mapped, flags, indptr, view[offset:].cast('I')
+
+    def __len__(self):
+        return len(self.titles)
+
+    def id(self, title):
+        node = self.ids.get(title)
+        if node is None:
+            node = self.ids[title] = len(self.titles)
+            self.titles.append(title)
+        return node
+
+    def neighbours(self, direction, node):
+        # Cached neighbour ids of `node`, or None if it was never fetched
+        row = self.fetched[direction].get(node)
+        if row is not None:
+            return row
+        mapped = self.mapped[direction]
+        if mapped is None:
+            return None
+        _, flags, indptr, indices = mapped
+        if node >= len(flags) or not flags[node]:
+            return None
+        return indices[indptr[node]:indptr[node + 1]].tolist()
+
+    def store(self, direction, node, neighbours) -> None:
+        self.fetched[direction][node] = neighbours
+
+    def save(self) -> None:
+        if not self.directory or not any(self.fetched.values()):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Titles first: a CSR never refers to ids the titles file lacks
+        self._replace('titles.txt', ''.join(title + '\n' for title in self.titles).encode('utf-8'))
+        for direction in DIRECTIONS:
+            if not self.fetched[direction]:
+                continue
+            n = len(self.titles)
+            flags = bytearray(-(-n // 4) * 4)
+            indptr, indices = array('I', [0]), array('I')
+            for node in range(n):
+                row = self.neighbours(direction, node)
+                if row is not None:
+                    flags[node] = 1
+                    indices.extend(row)
+                indptr.append(len(indices))
+            if sys.byteorder != 'little':
+                indptr.byteswap()
+                indices.byteswap()
+            self._replace(f'{direction}.csr', CSR_HEADER.pack(CSR_MAGIC, n, len(indices)) + flags
+                          + indptr.tobytes() + indices.tobytes())
+            self.fetched[direction] = {}
+            self.mapped[direction] = self._map(direction)
+
+    def _replace(self, name, data) -> None:
+        path = os.path.join(self.directory, name)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class BidirectionalSearch():
+    # Shortest start_url -> end_url link path, searched from both ends: out
+    # of the start page through its links, and into the end page through
+    # backlinks from the MediaWiki API (list=backlinks, 500 titles a
+    # request). Each round expands the whole of the smaller frontier, and the
+    # search stops the moment a page is reached from both sides; checking
+    # every page as it is added makes that first meeting a shortest path.
+    # Two frontiers of depth d/2 are a tiny fraction of the one of depth d a
+    # BFS crawl has to clear. Pages come from the AdjacencyCache when it has
+    # them; everything fetched is added to it.
+    def __init__(self, start_url, end_url, is_valid_link, cache=None, api_url=None, concurrency=16,
+                 per_host=8, max_fetches=None, timeout=30, verbose=False):
+        self.start_url = start_url
+        self.end_url = end_url
+        self.is_valid_link = is_valid_link
+        self.cache = cache if cache is not None else AdjacencyCache()
+        self.api_url = api_url or urljoin(end_url, '/w/api.php')
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.max_fetches = max_fetches
+        self.timeout = timeout
+        self.verbose = verbose
+        self.pages_fetched = 0
+        self.backlink_requests = 0
+        self.cache_hits = 0
+        self.errors = 0
+
+    @property
+    def fetches(self):
+        return self.pages_fetched + self.backlink_requests
+
+    def url(self, node):
+        return urljoin(self.start_url, '/wiki/' + quote(self.cache.titles[node]))
+
+    async def _links(self, session, node):
+        async with session.get(self.url(node)) as response:
+            response.raise_for_status()
+            html = await response.text()
+        self.pages_fetched += 1
+        titles = [unquote(href[len('/wiki/'):]) for href in extract_wiki_links(html) if self.is_valid_link(href)]
+        return list(dict.fromkeys(self.cache.id(title) for title in titles))
+
+    async def _backlinks(self, session, node):
+        params = {'action': 'query', 'list': 'backlinks', 'bltitle': self.cache.titles[node], 'blnamespace': '0',
+                  'bllimit': 'max', 'format': 'json', 'formatversion': '2'}
+        sources = []
+        while True:
+            async with session.get(self.api_url, params=params) as response:
+                response.raise_for_status()
+                result = await response.json(content_type=None)
+            self.backlink_requests += 1
+            sources.extend(self.cache.id(page['title'].replace(' ', '_'))
+                           for page in result['query']['backlinks']
+                           if self.is_valid_link('/wiki/' + page['title'].replace(' ', '_')))
+            if 'continue' not in result:
+                return sources
+            params.update(result['continue'])
+
+    async def _fetch(self, session, direction, node):
+        fetch = self._links if direction == 'links' else self._backlinks
+        try:
+            row = await fetch(session, node)
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+            self.errors += 1
+            print(f"Error fetching {direction} of {self.cache.titles[node]}: {e!r}")
+            return node, None
+        self.cache.store(direction, node, row)
+        return node, row
+
+    async def _expand(self, session, layer, direction, parents, other):
+        # Visits every neighbour of the layer; returns the next layer and the
+        # node where the two searches met, if they did
+        next_layer = []
+
+        def visit(node, neighbours):
+            for neighbour in neighbours:
+                if neighbour not in parents:
+                    parents[neighbour] = node
+                    if neighbour in other:
+                        return neighbour
+                    next_layer.append(neighbour)
+            return None
+
+        missing = []
+        for node in layer:
+            row = self.cache.neighbours(direction, node)
+            if row is None:
+                missing.append(node)
+                continue
+            self.cache_hits += 1
+            meet = visit(node, row)
+            if meet is not None:
+                return next_layer, meet
+        if self.max_fetches is not None:
+            missing = missing[:max(0, self.max_fetches - self.fetches)]
+        tasks = [asyncio.create_task(self._fetch(session, direction, node)) for node in missing]
+        try:
+            for done in asyncio.as_completed(tasks):
+                node, row = await done
+                if row is not None:
+                    meet = visit(node, row)
+                    if meet is not None:
+                        return next_layer, meet
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return next_layer, None
+
+    def _path(self, meet, forward, backward):
+        path = []
+        node = meet
+        while node is not None:
+            path.append(node)
+            node = forward[node]
+        path.reverse()
+        node = backward[meet]
+        while node is not None:
+            path.append(node)
+            node = backward[node]
+        return [self.url(node) for node in path]
+
+    async def search(self):
+        # The path as a list of page URLs, start and end included, or None
+        start, end = self.cache.id(title_of(self.start_url)), self.cache.id(title_of(self.end_url))
+        if start == end:
+            return [self.url(start)]
+        forward, backward = {start: None}, {end: None}
+        forward_layer, backward_layer = [start], [end]
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                         headers={'User-Agent': 'Dancing_with_Data classwork crawler'}) as session:
+            while forward_layer and backward_layer:
+                if self.max_fetches is not None and self.fetches >= self.max_fetches:
+                    if self.verbose: print(f"Gave up after {self.fetches} fetches")
+                    return None
+                if len(forward_layer) <= len(backward_layer):
+                    forward_layer, meet = await self._expand(session, forward_layer, 'links', forward, backward)
+                else:
+                    backward_layer, meet = await self._expand(session, backward_layer, 'backlinks', backward, forward)
+                if self.verbose:
+                    print(f"{self.fetches} fetches, {self.cache_hits} cached: frontiers {len(forward_layer)} "
+                          f"forward, {len(backward_layer)} backward")
+                if meet is not None:
+                    return self._path(meet, forward, backward)
+        if self.verbose: print("No path found")
+        return None
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            path = asyncio.run(self.search())
+        finally:
+            self.cache.save()
+        self.elapsed = time.perf_counter() - start
+        if self.verbose and path:
+            print(f"{len(path) - 1} clicks in {self.elapsed:.1f}s, {self.fetches} fetches: " + ' -> '.join(path))
+        return path
@@ -1,4 +1,5 @@
 import mechanicalsoup as ms
+import sys
 from urllib.parse import urljoin
 
 class Crawler():
@@ -27,6 +28,27 @@ class Crawler():
                     if full_url not in self.visited and full_url not in self.to_visit:
                         self.to_visit.append(full_url)
         print("End URL not found")
+
+    def crawl_async(self, concurrency=32, per_host=8, parse_workers=None):
+        # The same search with many pages in flight at once; see async_crawl.py
+        from async_crawl import AsyncCrawler
+        from frontier import MemoryFrontier
+        frontier = MemoryFrontier()
+        frontier.push(self.to_visit)
+        crawler = AsyncCrawler(self.to_visit[0], self.end_url, self.is_valid_link, frontier=frontier,
+                               concurrency=concurrency, per_host=per_host, parse_workers=parse_workers, verbose=True)
+        pages = crawler.run()
+        self.visited = frontier.visited
+        return pages
+
+    def find_path(self, concurrency=16):
+        # The shortest chain of links instead of a crawl until we stumble on
+        # the end page; see shortest_path.py. Fetched pages are cached on
+        # disk, so asking again, or for a nearby pair, is mostly free.
+        from shortest_path import BidirectionalSearch
+        search = BidirectionalSearch(self.to_visit[0], self.end_url, self.is_valid_link,
+                                     concurrency=concurrency, verbose=True)
+        return search.run()
     
     def is_valid_link(self, link) -> bool:
         # Ensure the link starts with "/wiki/" and is not a Wikipedia special or file page
@@ -41,7 +63,15 @@ class Crawler():
                 return True
 
 
-start_url = "https://en.wikipedia.org/wiki/Redis"
-end_url = "https://en.wikipedia.org/wiki/Jesus"
-crawler = Crawler(start_url, end_url)
-crawler.crawl()
+if __name__ == '__main__':
+    start_url = "https://en.wikipedia.org/wiki/Redis"
+    end_url = "https://en.wikipedia.org/wiki/Jesus"
+    crawler = Crawler(start_url, end_url)
+    # --async fetches many pages concurrently instead of one at a time, and
+    # --path searches from both ends for the shortest path
+    if '--path' in sys.argv:
+        crawler.find_path()
+    elif '--async' in sys.argv:
+        crawler.crawl_async()
+    else:
+        crawler.crawl()
@@ -0,0 +1,100 @@
+import argparse
+import bisect
+import json
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from link_graph import LinkGraph
+
+# Serves a generated LinkGraph as Wikipedia-like article pages at
+# /wiki/Article_<n>, with keep-alive and an optional per-request delay to
+# stand in for network latency. /w/api.php answers the MediaWiki
+# list=backlinks query, paged like the real API, for shortest_path.py.
+# Prints the port it bound once it is ready.
+# python classworks/wiki_server.py --pages 100000 --latency 0.05
+
+
+def make_handler(graph, latency):
+    class WikiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        # Headers and body go out as separate writes; without this the
+        # client's delayed ACK adds ~40 ms to every page
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if self.path.startswith('/w/api.php'):
+                self.backlinks()
+                return
+            if not self.path.startswith('/wiki/'):
+                self.send_error(404)
+                return
+            if latency:
+                time.sleep(latency)
+            page = graph.page_of(self.path)
+            # Talk:, User: and other non-article pages exist but link nowhere
+            body = (graph.html(page) if page is not None else
+                    f'<html><body><h1>{self.path[len("/wiki/"):]}</h1></body></html>').encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def backlinks(self):
+            # action=query&list=backlinks&bltitle=...&bllimit=...&blcontinue=0|<pageid>
+            params = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+            if params.get('list') != 'backlinks' or 'bltitle' not in params:
+                self.send_error(400)
+                return
+            if latency:
+                time.sleep(latency)
+            page = graph.page_of('/wiki/' + params['bltitle'].replace(' ', '_'))
+            sources = graph.backlinks(page) if page is not None else []
+            limit = 500 if params.get('bllimit', 'max') == 'max' else min(int(params['bllimit']), 500)
+            first = bisect.bisect_left(sources, int(params['blcontinue'].split('|')[1])) if 'blcontinue' in params else 0
+            result = {'batchcomplete': True, 'query': {'backlinks': [
+                {'pageid': source, 'ns': 0, 'title': graph.title(source).replace('_', ' ')}
+                for source in sources[first:first + limit]]}}
+            if first + limit < len(sources):
+                result['continue'] = {'blcontinue': f'0|{sources[first + limit]}', 'continue': '-||'}
+            body = json.dumps(result).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return WikiHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a generated Wikipedia-like link graph over HTTP')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--pages', type=int, default=100_000)
+    parser.add_argument('--links', type=int, default=80)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each response')
+    args = parser.parse_args()
+
+    class QuietServer(ThreadingHTTPServer):
+        def handle_error(self, request, client_address):
+            pass  # crawlers drop keep-alive connections when they finish
+
+    server = QuietServer(('127.0.0.1', args.port),
+                                 make_handler(LinkGraph(args.pages, args.links, seed=args.seed), args.latency))
+    server.daemon_threads = True
+    print(server.server_address[1], flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
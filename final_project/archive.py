@@ -0,0 +1,320 @@
+import argparse
+import json
+import os
+import shutil
+
+import metrics
+from db import DB_PATH, connect
+from metrics import timed
+from rollups import SENTIMENT_LABELS
+
+# Columnar copy of the SQLite history for long-range analysis: one Parquet
+# file per table and scraped_date, laid out as
+#   <dir>/<table>/scraped_date=YYYY-MM-DD/part-0.parquet
+# so a date range only opens the partitions it covers and a query only reads
+# the column chunks it asks for. SQLite stays the source of truth; set
+# ARCHIVE_DIR to have filter.py, pipeline.py and reddit_scrape.py bring the
+# archive up to date at the end of every run.
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR')
+DEFAULT_DIR = 'final_project/scraped_data/archive'
+# Bump when a table's columns change so every partition is rewritten once
+ARCHIVE_VERSION = 2
+MANIFEST = '_manifest.json'
+ROW_GROUP_SIZE = 64 * 1024
+
+# table -> (query for one date's rows, column types). scraped_date is the
+# partition key and isn't repeated inside the files. Low-cardinality strings
+# are dictionary-encoded and come back as pandas categoricals.
+TABLES = {
+    'posts': ('''
+        SELECT url, title, sub_reddit, author, post_date, upvotes, body, comments, image
+        FROM posts WHERE scraped_date = ?
+    ''', [('url', 'string'), ('title', 'string'), ('sub_reddit', 'dictionary'), ('author', 'string'),
+          ('post_date', 'float64'), ('upvotes', 'int64'), ('body', 'string'), ('comments', 'int64'),
+          ('image', 'string')]),
+    # The subreddit is joined in here so rollups over the archive need no
+    # join; is_post is 0 for comments, which rollups.py doesn't count as posts
+    'stock_mentions': ('''
+        SELECT m.url, p.sub_reddit, m.extracted_data, p.url IS NOT NULL FROM stock_mentions m
+        LEFT JOIN posts p ON p.url = m.url AND p.scraped_date = m.scraped_date
+        WHERE m.scraped_date = ?
+    ''', [('url', 'string'), ('sub_reddit', 'dictionary'), ('extracted_data', 'string'), ('is_post', 'int64')]),
+    # Sorted by ticker so row-group statistics can skip on ticker filters
+    'mention': ('''
+        SELECT url, sub_reddit, ticker, sentiment, score FROM mention
+        WHERE scraped_date = ? ORDER BY ticker
+    ''', [('url', 'string'), ('sub_reddit', 'dictionary'), ('ticker', 'dictionary'),
+          ('sentiment', 'dictionary'), ('score', 'float64')]),
+}
+
+
+def _schema(columns):
+    import pyarrow as pa
+    types = {'string': pa.string(), 'float64': pa.float64(), 'int64': pa.int64(),
+             'dictionary': pa.dictionary(pa.int32(), pa.string())}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _partition_dir(directory, table, date):
+    return os.path.join(directory, table, f'scraped_date={date}')
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get('version') == ARCHIVE_VERSION else {}
+
+
+def save_manifest(directory, manifest) -> None:
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+# Per table and date, how many rows were updated or deleted. Inserts (and
+# INSERT OR REPLACE, which takes a new rowid) already move the row count or
+# highest rowid, so only UPDATE and DELETE need a trigger, and bulk ingest
+# pays nothing for it. The triggers are part of the schema (see
+# track_changes), so edits are counted whether or not an archive exists yet.
+CREATE_CHANGES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS archive_changes (
+        name TEXT NOT NULL,
+        scraped_date TEXT NOT NULL,
+        changes INTEGER NOT NULL,
+        PRIMARY KEY (name, scraped_date)
+    )
+'''
+
+
+def _count_change(table, row):
+    return (f"INSERT INTO archive_changes VALUES ('{table}', {row}.scraped_date, 1) "
+            f"ON CONFLICT (name, scraped_date) DO UPDATE SET changes = changes + 1;")
+
+
+def _existing_tables(conn):
+    return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def track_changes(conn) -> None:
+    # Called by the schema setup of reddit_scrape.py, filter.py and
+    # mentions.py; archived tables that don't exist yet get their triggers
+    # from whichever of them creates the table
+    conn.execute(CREATE_CHANGES_TABLE)
+    existing = _existing_tables(conn)
+    for table in TABLES:
+        if table not in existing:
+            continue
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS archive_{table}_update AFTER UPDATE ON {table} BEGIN
+                {_count_change(table, 'OLD')} {_count_change(table, 'NEW')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS archive_{table}_delete AFTER DELETE ON {table} BEGIN
+                {_count_change(table, 'OLD')}
+            END
+        ''')
+    conn.commit()
+
+
+def signatures(conn, table):
+    # (row count, highest rowid, updates and deletes) per date: a delete
+    # followed by an insert that reuses the rowid, or an in-place UPDATE,
+    # still changes the signature. Edits made before track_changes() first
+    # ran need --dates or --full.
+    changes = {}
+    if 'archive_changes' in _existing_tables(conn):
+        changes = dict(conn.execute('SELECT scraped_date, changes FROM archive_changes WHERE name = ?', (table,)))
+    return {date: [count, last, changes.get(date, 0)] for date, count, last in conn.execute(
+        f'SELECT scraped_date, COUNT(*), MAX(rowid) FROM {table} GROUP BY scraped_date')}
+
+
+def write_partition(conn, directory, table, date) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    query, columns = TABLES[table]
+    rows = conn.execute(query, (date,)).fetchall()
+    schema = _schema(columns)
+    arrays = [pa.array(values, type=pa.string()).dictionary_encode() if kind == 'dictionary'
+              else pa.array(values, type=field.type)
+              for (_, kind), field, values in zip(columns, schema, zip(*rows) if rows else [()] * len(columns))]
+    partition = _partition_dir(directory, table, date)
+    os.makedirs(partition, exist_ok=True)
+    path = os.path.join(partition, 'part-0.parquet')
+    # Written under a dot name (skipped by dataset discovery) and renamed, so
+    # readers never see half a file
+    tmp_path = os.path.join(partition, '.part-0.parquet.tmp')
+    pq.write_table(pa.Table.from_arrays(arrays, schema=schema), tmp_path, row_group_size=ROW_GROUP_SIZE,
+                   compression='zstd')
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+@timed('archive_update_seconds')
+def update(conn, directory=None, dates=None, full=False):
+    # Rewrites the partitions whose SQLite rows changed since the last update
+    # (or the given dates, or all of them) and drops partitions for dates no
+    # longer in SQLite. Returns {table: [dates written]}.
+    directory = directory or ARCHIVE_DIR
+    if not directory:
+        return {}
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    manifest['version'] = ARCHIVE_VERSION
+    written = {}
+    # Only tables this database has; stock_mentions is read joined to posts
+    existing = _existing_tables(conn)
+    tables = [table for table in TABLES if table in existing and (table != 'stock_mentions' or 'posts' in existing)]
+    current = {table: signatures(conn, table) for table in tables}
+    # stock_mentions partitions carry their posts' subreddit, so they follow posts too
+    for date, signature in current.get('stock_mentions', {}).items():
+        signature.extend(current['posts'].get(date, []))
+    try:
+        for table in tables:
+            stored = manifest.setdefault(table, {})
+            for date in sorted(set(stored) - set(current[table])):
+                shutil.rmtree(_partition_dir(directory, table, date), ignore_errors=True)
+                del stored[date]
+            for date, signature in sorted(current[table].items()):
+                if full or (dates is not None and date in dates) or stored.get(date) != signature:
+                    metrics.inc('archive_rows_written', write_partition(conn, directory, table, date))
+                    stored[date] = signature
+                    written.setdefault(table, []).append(date)
+    finally:
+        save_manifest(directory, manifest)
+    return written
+
+
+def _date_filter(start=None, end=None):
+    import pyarrow.dataset as ds
+    condition = None
+    for bound in ((ds.field('scraped_date') >= start) if start else None,
+                  (ds.field('scraped_date') <= end) if end else None):
+        if bound is not None:
+            condition = bound if condition is None else condition & bound
+    return condition
+
+
+class Archive():
+    # Read side. Date bounds prune partitions before any file is opened,
+    # `columns` limits which column chunks are read, and `filter` (a
+    # pyarrow.dataset expression) is checked against row-group statistics.
+    # The rollup methods return the same rows as the functions of the same
+    # name in rollups.py, so vis.py takes an Archive wherever it takes a
+    # SQLite connection.
+    def __init__(self, directory=None):
+        self.directory = directory or ARCHIVE_DIR or DEFAULT_DIR
+
+    def dataset(self, table):
+        # Discovered on every call (one directory listing) so partitions
+        # written by a concurrent update() show up
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        path = os.path.join(self.directory, table)
+        schema = _schema(TABLES[table][1]).append(pa.field('scraped_date', pa.string()))
+        if not os.path.isdir(path):
+            return ds.dataset([], schema=schema, format='parquet')
+        partitioning = ds.partitioning(pa.schema([('scraped_date', pa.string())]), flavor='hive')
+        return ds.dataset(path, schema=schema, format='parquet', partitioning=partitioning,
+                          ignore_prefixes=['.', '_'])
+
+    def dates(self, table='posts'):
+        path = os.path.join(self.directory, table)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name.split('=', 1)[1] for name in os.listdir(path) if name.startswith('scraped_date='))
+
+    def scan(self, table, columns=None, start=None, end=None, filter=None):
+        # Arrow table of the requested columns for start..end (inclusive)
+        condition = _date_filter(start, end)
+        if filter is not None:
+            condition = filter if condition is None else condition & filter
+        return self.dataset(table).to_table(columns=columns, filter=condition)
+
+    def read(self, table, columns=None, start=None, end=None, filter=None):
+        # pandas view of scan(). Numeric columns are handed over without a
+        # copy and dictionary columns become categoricals; split_blocks and
+        # self_destruct keep pandas from consolidating into a second copy.
+        return self.scan(table, columns, start, end, filter).to_pandas(split_blocks=True, self_destruct=True)
+
+    def frames(self, start=None, end=None):
+        # The (mentions_df, posts_df) pair vis.display_plots_from_frames takes,
+        # reading only the columns it uses
+        mentions_df = self.read('stock_mentions', ['url', 'scraped_date', 'extracted_data'], start, end)
+        posts_df = self.read('posts', ['url', 'scraped_date', 'sub_reddit'], start, end)
+        return mentions_df, posts_df
+
+    def _sentiment_sums(self, keys, start, end, filter=None):
+        # (*keys, positive, neutral, negative) per group of mention rows
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        table = self.scan('mention', [*keys, 'sentiment'], start, end, filter)
+        sentiment = table['sentiment'].cast(pa.string())
+        columns = {key: table[key].cast(pa.string()) for key in keys}
+        for label in SENTIMENT_LABELS:
+            columns[label] = pc.cast(pc.equal(sentiment, label), pa.int64())
+        grouped = pa.table(columns).group_by(list(keys)).aggregate([(label, 'sum') for label in SENTIMENT_LABELS])
+        return [grouped[name].to_pylist() for name in (*keys, *(f'{label}_sum' for label in SENTIMENT_LABELS))]
+
+    def _post_counts(self, keys, start, end):
+        # Analyzed posts per group, from the stock_mentions rows of posts
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        table = self.scan('stock_mentions', list(keys), start, end, ds.field('is_post') == 1)
+        table = pa.table({key: table[key].cast(pa.string()) for key in keys})
+        grouped = table.group_by(list(keys)).aggregate([([], 'count_all')])
+        return dict(zip(zip(*(grouped[key].to_pylist() for key in keys)), grouped['count_all'].to_pylist()))
+
+    def ticker_range(self, start, end, tickers=None):
+        import pyarrow.dataset as ds
+        condition = ds.field('ticker').isin(list(tickers)) if tickers is not None else None
+        return list(zip(*self._sentiment_sums(['scraped_date', 'ticker'], start, end, condition)))
+
+    def subreddit_range(self, start, end):
+        keys = ['scraped_date', 'sub_reddit']
+        posts = self._post_counts(keys, start, end)
+        sums = {(date, sub): counts for date, sub, *counts in zip(*self._sentiment_sums(keys, start, end))}
+        # Posts whose subreddit is unknown only count towards the overall rollup
+        groups = sorted(key for key in posts.keys() | sums.keys() if key[1] is not None)
+        return [(date, sub, posts.get((date, sub), 0), *sums.get((date, sub), (0, 0, 0))) for date, sub in groups]
+
+    def overall_range(self, start, end):
+        posts = self._post_counts(['scraped_date'], start, end)
+        sums = {date: counts for date, *counts in zip(*self._sentiment_sums(['scraped_date'], start, end))}
+        return [(date, posts.get((date,), 0), *sums.get(date, (0, 0, 0)))
+                for date in sorted({date for date, in posts} | sums.keys())]
+
+    def ticker_sentiment(self, date):
+        return [row[1:] for row in self.ticker_range(date, date)]
+
+    def subreddit_sentiment(self, date):
+        return [(sub, *counts) for _, sub, _, *counts in self.subreddit_range(date, date)]
+
+    def overall_sentiment(self, date):
+        rows = self.overall_range(date, date)
+        return tuple(rows[0][2:]) if rows else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bring the Parquet archive up to date with the SQLite database')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--out', default=ARCHIVE_DIR or DEFAULT_DIR)
+    parser.add_argument('--dates', nargs='+', help='rewrite these dates even if they look unchanged')
+    parser.add_argument('--full', action='store_true', help='rewrite every partition')
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    written = update(conn, args.out, dates=args.dates, full=args.full)
+    conn.close()
+    for table in TABLES:
+        print(f"{table}: {len(written.get(table, []))} partitions written")
+    print(f"Archive: {args.out}")
+    metrics.export(run='archive')
+
+
+if __name__ == '__main__':
+    main()
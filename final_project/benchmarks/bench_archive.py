@@ -0,0 +1,84 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import archive
+import rollups
+import vis
+from benchmarks.corpus import ensure_corpus
+from db import connect
+
+
+def timed(label, function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    print(f"{label:<46}{time.perf_counter() - start:8.3f}s")
+    return value
+
+
+def check_rollups(conn, store, start, end):
+    # The archive has to answer what the SQLite rollups do, comments included
+    for name in ('overall_range', 'subreddit_range', 'ticker_range'):
+        expected = sorted(getattr(rollups, name)(conn, start, end))
+        assert sorted(getattr(store, name)(start, end)) == expected, f"archive {name} differs from the rollups"
+    print(f"{'archive rollups match sqlite':<46}{'ok':>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite vs the Parquet archive for multi-day scans')
+    parser.add_argument('--posts', type=int, default=200_000)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--range-days', type=int, default=60, help='length of the scanned date range')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'dwd-bench'))
+    parser.add_argument('--db', help='run against this database (e.g. one from pipeline.py --fake) instead of the corpus')
+    args = parser.parse_args()
+
+    conn = connect(args.db or ensure_corpus(args.corpus_dir, args.posts, args.days))
+    dates = [date for date, in conn.execute('SELECT DISTINCT scraped_date FROM posts ORDER BY scraped_date')]
+    start, end = dates[-min(args.range_days, len(dates))], dates[-1]
+    directory = tempfile.mkdtemp(prefix='archive-')
+    try:
+        print(f"{conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0]:,} posts over {len(dates)} days, scanning {start}..{end}")
+        timed('archive: first export', archive.update, conn, directory)
+        timed('archive: update, nothing changed', archive.update, conn, directory)
+        timed('archive: update, one day forced', archive.update, conn, directory, [end])
+        store = archive.Archive(directory)
+        check_rollups(conn, store, start, end)
+
+        # What vis.py's frame path reads today: both tables, every column, every day
+        timed('sqlite: read_sql_query whole tables', lambda: (
+            pd.read_sql_query('SELECT * FROM stock_mentions', conn), pd.read_sql_query('SELECT * FROM posts', conn)))
+        timed('sqlite: frame columns for the range', lambda: (
+            pd.read_sql_query('SELECT url, scraped_date, extracted_data FROM stock_mentions '
+                              'WHERE scraped_date BETWEEN ? AND ?', conn, params=(start, end)),
+            pd.read_sql_query('SELECT url, scraped_date, sub_reddit FROM posts '
+                              'WHERE scraped_date BETWEEN ? AND ?', conn, params=(start, end))))
+        timed('archive: frame columns for the range', store.frames, start, end)
+
+        timed('sqlite: mention tickers for the range', pd.read_sql_query,
+              'SELECT scraped_date, ticker, sentiment FROM mention WHERE scraped_date BETWEEN ? AND ?', conn,
+              None, True, (start, end))
+        timed('archive: mention tickers for the range', store.read, 'mention',
+              ['scraped_date', 'ticker', 'sentiment'], start, end)
+
+        timed('rollups: sentiment_timeseries', vis.sentiment_timeseries, conn, start, end)
+        timed('archive: sentiment_timeseries', vis.sentiment_timeseries, store, start, end)
+        timed('rollups: timeseries, 3 tickers', vis.sentiment_timeseries, conn, start, end, ['AAPL', 'MSFT', 'NVDA'])
+        timed('archive: timeseries, 3 tickers', vis.sentiment_timeseries, store, start, end, ['AAPL', 'MSFT', 'NVDA'])
+
+        size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+        print(f"archive size: {size / 1e6:.1f} MB   sqlite: {os.path.getsize(conn.execute('PRAGMA database_list').fetchone()[2]) / 1e6:.1f} MB")
+    finally:
+        conn.close()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from benchmarks.bench_ticker_index import synthetic_posts
+from extraction import (BatchParseError, ExtractionEngine, pack_batches, request_batch_extraction,
+                        request_extraction)
+from fakes.fake_openai import FakeOpenAIServer
+from ticker_index import TickerIndex
+
+
+def extract_batch(client, batch):
+    posts = dict(batch)
+    if len(posts) == 1:
+        return {pid: request_extraction(client, text) for pid, text in posts.items()}
+    try:
+        extracted = request_batch_extraction(client, posts)
+    except BatchParseError:
+        extracted = {}
+    for pid, text in posts.items():
+        if pid not in extracted:
+            extracted[pid] = request_extraction(client, text)
+    return extracted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Posts/sec and tokens/post for batched extraction prompts')
+    parser.add_argument('--posts', type=int, default=400)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--in-flight', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.3, help='fixed per-request overhead in seconds')
+    parser.add_argument('--latency-per-token', type=float, default=0.002)
+    parser.add_argument('--malformed-rate', type=float, default=0.02)
+    parser.add_argument('--token-budget', type=int, default=6000)
+    args = parser.parse_args()
+
+    index = TickerIndex.from_json()
+    tickers = [pattern[0] for pattern in index.patterns if pattern[2] == 'ticker']
+    posts = [(f"p{i:06d}", text) for i, text in enumerate(synthetic_posts(tickers, args.posts, mention_rate=1.0))]
+
+    print(f"{'batch':>5} {'requests':>8} {'posts/s':>8} {'prompt tok/post':>16} {'compl tok/post':>15}")
+    for batch_size in args.batch_sizes:
+        with FakeOpenAIServer(latency=args.latency, jitter=0.0, latency_per_token=args.latency_per_token,
+                              malformed_rate=args.malformed_rate, ticker_index=index) as fake:
+            client = OpenAI(api_key='fake', base_url=fake.base_url, max_retries=0)
+            engine = ExtractionEngine(lambda batch: extract_batch(client, batch), max_in_flight=args.in_flight)
+            batches = pack_batches(posts, lambda post: post[1], batch_size=batch_size, token_budget=args.token_budget)
+            start = time.perf_counter()
+            done = sum(len(results) for _, results, error in engine.run(batches) if error is None)
+            elapsed = time.perf_counter() - start
+            stats = fake.stats
+        print(f"{batch_size:5d} {stats['requests']:8d} {done / elapsed:8.1f} "
+              f"{stats['prompt_tokens'] / done:16.1f} {stats['completion_tokens'] / done:15.1f}")
+
+
+if __name__ == '__main__':
+    main()
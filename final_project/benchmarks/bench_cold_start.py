@@ -0,0 +1,54 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROJECT = os.path.join(ROOT, 'final_project')
+
+# Each case runs in a fresh interpreter from the repo root, the way cron and
+# the entry points start. Times include interpreter startup.
+CASES = {
+    'python': 'pass',
+    'import ticker_index + load': 'from ticker_index import TickerIndex; TickerIndex.load()',
+    'import filter': 'import filter',
+    'filter first prefilter': "import filter; filter.needs_extraction({'title': 'Buying $TSLA', 'body': ''})",
+    'import vis': 'import vis',
+    'vis rollup view': ("import vis, db, rollups; conn = db.connect(':memory:'); rollups.create_rollup_tables(conn); "
+                        "vis.overall_sentiment_sql(conn, '2024-01-01')"),
+    'import pipeline': 'import pipeline',
+}
+
+
+def run_case(code, env):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', f"import sys; sys.path.insert(0, {PROJECT!r})\n{code}"],
+                         cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if out.returncode:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1])
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start time of the entry points')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--only', nargs='+', choices=CASES)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, OPENAI_API_KEY=os.getenv('OPENAI_API_KEY', 'offline'),
+                   FILTER_CACHE_PATH=os.path.join(directory, 'llm_cache.db'))
+        for name in args.only or CASES:
+            # One warm-up so the page cache and .pyc files are in place
+            run_case(CASES[name], env)
+            times = [run_case(CASES[name], env) for _ in range(args.runs)]
+            print(f"{name:<28} median {statistics.median(times) * 1000:8.1f}ms   "
+                  f"min {min(times) * 1000:8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
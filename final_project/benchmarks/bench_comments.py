@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comments import INSERT_COMMENT, CommentIngester, comment_url, create_comment_tables
+from db import connect
+from fakes.fake_reddit import FakeListingProvider
+from ticker_index import TickerIndex
+
+# Comments/sec and peak RSS ingesting one --comments thread from the fake
+# comment provider: CommentIngester streaming it in batches, against
+# materializing the whole forest first (what replace_more(limit=None) and
+# .list() do) and inserting it in one go. Each mode runs in a fresh
+# interpreter so its peak RSS is its own; "generate" only drains the fake,
+# which is the floor for both. The streamed database is then refreshed after
+# the thread grows by --growth comments, and once more unchanged.
+
+
+def peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def thread(n_comments):
+    provider = FakeListingProvider(latency=0.0)
+    post = provider.make_post('wallstreetbets', 0)
+    post.num_comments = n_comments
+    return provider, post
+
+
+def worker(mode, db_path, n_comments, batch_size):
+    ticker_index = TickerIndex.load()
+    provider, post = thread(n_comments)
+    conn = connect(db_path)
+    create_comment_tables(conn)
+    baseline = peak_rss_mib()
+    start = time.perf_counter()
+    result = {}
+    if mode == 'generate':
+        result['walked'] = sum(1 for _ in provider.comments(post))
+    elif mode == 'materialize':
+        forest = list(provider.comments(post))
+        today = time.strftime("%Y-%m-%d", time.localtime(time.time()))
+        rows = [(c.id, comment_url(post, c.id), post.id, post.url, 'wallstreetbets', c.parent_id, str(c.author),
+                 c.body, c.score, c.created_utc, int(ticker_index.contains_any(c.body)), today) for c in forest]
+        with conn:
+            conn.executemany(INSERT_COMMENT, rows)
+        result['walked'] = len(forest)
+    else:
+        ingester = CommentIngester(conn, provider, ticker_index, batch_size=batch_size)
+        for _ in ingester.ingest('wallstreetbets', post):
+            pass
+        result.update(ingester.stats)
+    result['seconds'] = time.perf_counter() - start
+    result['baseline_mib'] = baseline
+    result['peak_mib'] = peak_rss_mib()
+    conn.close()
+    print(json.dumps(result))
+
+
+def run_worker(mode, db_path, args):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', mode, '--db', db_path,
+                             '--comments', str(args.comments), '--batch', str(args.batch)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def refresh(db_path, n_comments, batch_size, ticker_index):
+    provider, post = thread(n_comments)
+    conn = connect(db_path)
+    ingester = CommentIngester(conn, provider, ticker_index, batch_size=batch_size)
+    start = time.perf_counter()
+    for _ in ingester.ingest('wallstreetbets', post):
+        pass
+    elapsed = time.perf_counter() - start
+    total = conn.execute('SELECT COUNT(*) FROM comments').fetchone()[0]
+    conn.close()
+    return ingester.stats, elapsed, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming vs materialized ingestion of one huge comment thread')
+    parser.add_argument('--comments', type=int, default=1_000_000)
+    parser.add_argument('--batch', type=int, default=1000, help='CommentIngester batch_size')
+    parser.add_argument('--growth', type=int, default=10_000, help='new comments before the refresh')
+    parser.add_argument('--worker', choices=['generate', 'stream', 'materialize'], help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args.worker, args.db, args.comments, args.batch)
+
+    print(f"one thread of {args.comments:,} comments, batch {args.batch:,}\n")
+    print(f"{'mode':<12} {'comments/s':>11} {'seconds':>8} {'peak RSS':>9} {'over baseline':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ('generate', 'materialize', 'stream'):
+            db_path = os.path.join(directory, f'{mode}.db')
+            result = run_worker(mode, db_path, args)
+            assert result['walked'] == args.comments
+            print(f"{mode:<12} {args.comments / result['seconds']:>11,.0f} {result['seconds']:>8.1f} "
+                  f"{result['peak_mib']:>6.0f}MiB {result['peak_mib'] - result['baseline_mib']:>11.0f}MiB")
+
+        db_path = os.path.join(directory, 'stream.db')
+        ticker_index = TickerIndex.load()
+        stats, elapsed, total = refresh(db_path, args.comments + args.growth, args.batch, ticker_index)
+        assert stats['stored'] == args.growth and total == args.comments + args.growth
+        print(f"\nrefresh after {args.growth:,} new comments: walked {stats['walked']:,}, stored {stats['stored']:,} "
+              f"in {elapsed:.1f}s ({total:,} rows)")
+        stats, elapsed, total = refresh(db_path, args.comments + args.growth, args.batch, ticker_index)
+        assert stats['skipped'] == 1 and total == args.comments + args.growth
+        print(f"refresh, thread unchanged: skipped without a request in {elapsed * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from benchmarks.bench_ticker_index import synthetic_posts
+from extraction import ExtractionEngine, request_extraction
+from fakes.fake_openai import FakeOpenAIServer
+from ticker_index import TickerIndex
+
+
+def run(client, posts, max_in_flight, rpm, tpm):
+    engine = ExtractionEngine(lambda text: request_extraction(client, text), max_in_flight=max_in_flight,
+                              requests_per_minute=rpm, tokens_per_minute=tpm, base_delay=0.05, max_delay=1.0)
+    start = time.perf_counter()
+    failures = sum(1 for _, _, error in engine.run(posts) if error is not None)
+    return time.perf_counter() - start, failures, engine.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serial vs. concurrent extraction against a fake OpenAI server')
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.05)
+    parser.add_argument('--in-flight', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--rpm', type=int, default=100_000)
+    parser.add_argument('--tpm', type=int, default=50_000_000)
+    args = parser.parse_args()
+
+    index = TickerIndex.from_json()
+    tickers = [pattern[0] for pattern in index.patterns if pattern[2] == 'ticker']
+    posts = synthetic_posts(tickers, args.posts, mention_rate=1.0)
+
+    with FakeOpenAIServer(latency=args.latency, error_rate=args.error_rate,
+                          rate_limit_rate=args.rate_limit_rate, ticker_index=index) as fake:
+        client = OpenAI(api_key='fake', base_url=fake.base_url, max_retries=0)
+        for max_in_flight in args.in_flight:
+            elapsed, failures, stats = run(client, posts, max_in_flight, args.rpm, args.tpm)
+            print(f"in-flight {max_in_flight:3d}: {elapsed:6.2f}s  {len(posts) / elapsed:7.1f} posts/s  "
+                  f"retries {stats['retries']:4d}  failed {failures}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes.fake_reddit import FakeListingProvider
+from reddit_scrape import Scraper
+
+
+def simulate(db_path, incremental, args):
+    provider = FakeListingProvider(latency=0.0, churn=args.churn, edit_rate=args.edit_rate)
+    scraper = Scraper(number_of_posts=args.posts, provider=provider, db_path=db_path, incremental=incremental)
+    for day in range(args.days):
+        provider.day = day
+        # Every run is stamped with today's date, so give each simulated day its own
+        scraper.db_connection.execute('UPDATE posts SET scraped_date = ? WHERE scraped_date = date(\'now\', \'localtime\')',
+                                      (f"1999-01-{day + 1:02d}",))
+        scraper.db_connection.execute('UPDATE post_snapshots SET scraped_date = ? WHERE scraped_date = date(\'now\', \'localtime\')',
+                                      (f"1999-01-{day + 1:02d}",))
+        scraper.scrape_all()
+    conn = scraper.db_connection
+    posts = conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+    snapshots = conn.execute('SELECT COUNT(*) FROM post_snapshots').fetchone()[0]
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    scraper.db_connection = None
+    return posts, snapshots, os.path.getsize(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Storage and filter.py workload after N daily scrapes, full vs. incremental')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--posts', type=int, default=100)
+    parser.add_argument('--churn', type=float, default=0.2)
+    parser.add_argument('--edit-rate', type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, incremental in (('full', False), ('incremental', True)):
+            posts, snapshots, size = simulate(os.path.join(tmp, f"{label}.db"), incremental, args)
+            print(f"{label:12s} posts rows (filter.py work): {posts:7d}  snapshot rows: {snapshots:7d}  "
+                  f"db size: {size / 1e6:6.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
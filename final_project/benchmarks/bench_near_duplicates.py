@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import FILLER
+from llm_cache import normalize_text
+from near_duplicates import NearDuplicateBackend, NearDuplicateIndex, lsh_parameters
+from sentiment_backends import LexiconBackend, SentimentBackend
+from ticker_index import TICKERS_PATH, TickerIndex
+
+# Share of LLM extractions NearDuplicateBackend avoids on a synthetic scrape
+# where `--dup-rate` of the posts are near-copies of an earlier post, from the
+# same day or up to a week before: crossposts with a tag in the title,
+# reworded titles, small body edits and "EDIT:" lines. Another `--swap-rate`
+# copy a post but name a different ticker; those must not reuse anything.
+# Each day runs with a fresh index over the same SQLite file, the way daily
+# filter.py runs do. The lexicon backend stands in for the LLM, and every
+# reused result is checked against the post it was extracted from.
+
+TITLE_TAGS = ['[Crosspost]', 'x-post from r/wallstreetbets:', '(repost)', 'Thoughts?', 'DD:', 'UPDATE -']
+
+
+class CountingBackend(SentimentBackend):
+    # The "LLM": lexicon extraction, tagged with the post it was made for
+    batch_size = 8
+    max_in_flight = 1
+
+    def __init__(self, ticker_index):
+        self.lexicon = LexiconBackend(ticker_index)
+        self.posts = 0
+        self.elapsed = 0.0
+
+    def analyze(self, rows):
+        start = time.perf_counter()
+        self.posts += len(rows)
+        results = [(url, date, json.dumps({'source': url, 'mentions': json.loads(data)}))
+                   for url, date, data in self.lexicon.analyze(rows)]
+        self.elapsed += time.perf_counter() - start
+        return results
+
+
+def mutate(rng, row, tickers):
+    title = row['title'].split()
+    body = row['body'].split()
+    if rng.random() < 0.5:
+        title.insert(0 if rng.random() < 0.7 else len(title), rng.choice(TITLE_TAGS))
+    else:
+        title[rng.randrange(len(title))] = rng.choice(FILLER)
+    for _ in range(rng.randint(0, max(1, len(body) // 40))):
+        position = rng.randrange(len(body))
+        if rng.random() < 0.5 and body[position] not in tickers:
+            body[position] = rng.choice(FILLER)
+        else:
+            body.insert(position, rng.choice(FILLER))
+    if rng.random() < 0.3:
+        body += ['EDIT:', 'thanks', 'for', 'the', 'awards']
+    return ' '.join(title), ' '.join(body)
+
+
+def corpus(n_posts, days, dup_rate, swap_rate, tickers, seed=0):
+    # Rows with url, title, body, scraped_date and 'root': the original post
+    # a copy descends from plus the ticker it names, so a ticker swap starts
+    # a new root and swapping back returns to the old one
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(len(tickers))]
+    rows = []
+    per_day = n_posts // days
+    for i in range(n_posts):
+        day = min(i // per_day, days - 1)
+        url = f'https://www.reddit.com/r/stocks/comments/{i:07x}/'
+        date = f'2024-07-{day + 1:02d}'
+        # Sources from today or up to a week back
+        earlier = [j for j in range(max(0, (day - 7) * per_day), i)] if i else []
+        roll = rng.random()
+        if earlier and roll < dup_rate:
+            source = rows[rng.choice(earlier)]
+            title, body = mutate(rng, source, tickers)
+            rows.append({'url': url, 'scraped_date': date, 'title': title, 'body': body, 'root': source['root']})
+            continue
+        if earlier and roll < dup_rate + swap_rate:
+            source = rows[rng.choice(earlier)]
+            words = set(source['title'].split() + source['body'].split())
+            ticker = rng.choice([t for t in tickers[:50] if t not in words])
+            body = ' '.join(ticker if word in tickers else word for word in source['body'].split())
+            title = ' '.join(ticker if word in tickers else word for word in source['title'].split())
+            rows.append({'url': url, 'scraped_date': date, 'title': title, 'body': body,
+                         'root': f"{source['root'].split('#')[0]}#{ticker}"})
+            continue
+        ticker = rng.choices(tickers, weights=weights)[0]
+        title = rng.choices(FILLER, k=rng.randint(5, 12))
+        title.insert(rng.randrange(len(title) + 1), ticker)
+        body = rng.choices(FILLER, k=rng.randint(30, 200))
+        body.insert(rng.randrange(len(body) + 1), ticker)
+        rows.append({'url': url, 'scraped_date': date, 'title': ' '.join(title), 'body': ' '.join(body),
+                     'root': f'{url}#{ticker}'})
+    return rows
+
+
+def run(rows, days, threshold, ticker_index, directory):
+    path = os.path.join(directory, f'near_duplicates-{threshold}.db')
+    inner = CountingBackend(ticker_index)
+    roots = {row['url']: row['root'] for row in rows}
+    reused = wrong = 0
+    elapsed = 0.0
+    for day in sorted({row['scraped_date'] for row in rows}):
+        index = NearDuplicateIndex(path, threshold=threshold)
+        backend = NearDuplicateBackend(inner, index, ticker_index)
+        day_rows = [row for row in rows if row['scraped_date'] == day]
+        start = time.perf_counter()
+        for i in range(0, len(day_rows), inner.batch_size):
+            batch = day_rows[i:i + inner.batch_size]
+            for row, (url, _, data) in zip(batch, backend.analyze(batch)):
+                source = json.loads(data)['source']
+                if source != url:
+                    reused += 1
+                    wrong += roots[source] != roots[url]
+        elapsed += time.perf_counter() - start
+        index.close()
+    # Time spent outside the stand-in LLM is the deduplication overhead
+    return inner.posts, reused, wrong, elapsed - inner.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LLM extractions avoided by MinHash/LSH near-duplicate clustering')
+    parser.add_argument('--posts', type=int, default=20_000)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--dup-rate', type=float, default=0.25, help='share of posts that near-copy an earlier one')
+    parser.add_argument('--swap-rate', type=float, default=0.05, help='share that copy a post with another ticker')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    args = parser.parse_args()
+
+    ticker_index = TickerIndex.load(TICKERS_PATH)
+    with open(TICKERS_PATH, 'r') as f:
+        # Only tickers the prefilter recognises on their own; posts naming
+        # none of them would never reach the LLM
+        tickers = [v['ticker'] for v in json.load(f).values() if ticker_index.contains_any(v['ticker'])][:500]
+    rows = corpus(args.posts, args.days, args.dup_rate, args.swap_rate, tickers)
+    # Posts with an earlier post of the same root could reuse its extraction
+    roots, texts = set(), set()
+    copies = exact = 0
+    for row in rows:
+        copies += row['root'] in roots
+        roots.add(row['root'])
+        key = normalize_text(f"{row['title']} {row['body']}")
+        exact += key in texts
+        texts.add(key)
+    print(f"{len(rows):,} posts over {args.days} days, {copies:,} near-copies ({copies / len(rows):.0%}); "
+          f"an exact-text cache would skip {exact:,} ({exact / len(rows):.1%})\n")
+
+    print(f"{'threshold':>9} {'bands x rows':>12} {'LLM calls':>10} {'avoided':>8} {'copies caught':>14} "
+          f"{'wrong reuse':>11} {'overhead':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for threshold in args.thresholds:
+            calls, reused, wrong, elapsed = run(rows, args.days, threshold, ticker_index, directory)
+            bands, rows_per_band = lsh_parameters(threshold, 128)
+            print(f"{threshold:9.2f} {f'{bands} x {rows_per_band}':>12} {calls:10,} {1 - calls / len(rows):8.1%} "
+                  f"{(reused - wrong) / copies:14.1%} {wrong:11,} {elapsed / len(rows) * 1000:7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
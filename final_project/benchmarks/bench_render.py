@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render  # selects the Agg backend before pyplot is imported
+import matplotlib.pyplot as plt
+
+import vis
+from benchmarks.bench_timeseries import synthetic_rollups
+from db import connect
+
+
+def pyplot_per_date(conn, dates, out_dir, formats):
+    # What a headless loop over display_plots amounts to: fresh pyplot
+    # figures for every date, saved instead of shown
+    for date in dates:
+        stock, subs, total = render.date_views(conn, date)
+        for name, (size, _, draw), data in zip(render.FIGURES, render.FIGURES.values(), (stock, subs, total)):
+            fig, ax = plt.subplots(figsize=size)
+            draw(ax, data)
+            plt.tight_layout()
+            for fmt in formats:
+                fig.savefig(os.path.join(out_dir, f'{date}_{name}.{fmt}'))
+            plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless rendering of the daily plots')
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--format', dest='formats', nargs='+', default=['png'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn = connect(os.path.join(directory, 'bench.db'))
+        dates = synthetic_rollups(conn, args.days, args.tickers)
+        print(f"days: {len(dates)}  formats: {', '.join(args.formats)}  workers: {args.workers}")
+
+        out = os.path.join(directory, 'pyplot')
+        os.makedirs(out)
+        start = time.perf_counter()
+        pyplot_per_date(conn, dates, out, args.formats)
+        print(f"pyplot, new figures per date:        {time.perf_counter() - start:6.2f}s")
+
+        for i, (label, workers) in enumerate((('reused figures, 1 process', 1),
+                                              (f'reused figures, {args.workers} processes', args.workers))):
+            out = os.path.join(directory, f'render-{i}')
+            start = time.perf_counter()
+            rendered, _ = render.render_dates(conn, out, formats=args.formats, workers=workers)
+            print(f"{label + ':':<37}{time.perf_counter() - start:6.2f}s  ({len(rendered)} dates)")
+
+        start = time.perf_counter()
+        rendered, skipped = render.render_dates(conn, out, formats=args.formats, workers=args.workers)
+        print(f"rerun, nothing changed:              {time.perf_counter() - start:6.2f}s  "
+              f"({len(rendered)} rendered, {len(skipped)} skipped)")
+
+        with conn:
+            conn.execute("UPDATE rollup_overall SET positive = positive + 1 WHERE scraped_date = ?", (dates[-1],))
+        start = time.perf_counter()
+        rendered, skipped = render.render_dates(conn, out, formats=args.formats, workers=args.workers)
+        print(f"rerun, one day changed:              {time.perf_counter() - start:6.2f}s  "
+              f"({len(rendered)} rendered, {len(skipped)} skipped)")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
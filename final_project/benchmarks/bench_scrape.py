@@ -0,0 +1,41 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes.fake_reddit import FakeListingProvider
+from reddit_scrape import Scraper
+
+
+def run(db_path, concurrent, args):
+    provider = FakeListingProvider(latency=args.latency)
+    scraper = Scraper(number_of_posts=args.posts, provider=provider, max_workers=args.workers, db_path=db_path)
+    start = time.perf_counter()
+    scraper.scrape_all(concurrent=concurrent)
+    elapsed = time.perf_counter() - start
+    rows = scraper.db_connection.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+    scraper.db_connection.close()
+    scraper.db_connection = None
+    return elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serial vs. concurrent scrape of all subreddits against a fake listing provider')
+    parser.add_argument('--posts', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds per listing page')
+    parser.add_argument('--workers', type=int, default=11)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        serial, serial_rows = run(os.path.join(tmp, 'serial.db'), False, args)
+        concurrent, concurrent_rows = run(os.path.join(tmp, 'concurrent.db'), True, args)
+    print(f"serial:     {serial:6.2f}s  ({serial_rows} posts)")
+    print(f"concurrent: {concurrent:6.2f}s  ({concurrent_rows} posts, {args.workers} workers)")
+    print(f"speedup:    {serial / concurrent:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
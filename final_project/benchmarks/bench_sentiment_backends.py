@@ -0,0 +1,45 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ticker_index import synthetic_posts
+from extraction import pack_batches
+from sentiment_backends import LexiconBackend
+from ticker_index import TickerIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the local lexicon sentiment backend')
+    parser.add_argument('--posts', type=int, default=100_000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    index = TickerIndex.from_json()
+    tickers = [pattern[0] for pattern in index.patterns if pattern[2] == 'ticker']
+    rows = [{'url': f"https://reddit.com/{i}", 'scraped_date': '2024-07-16', 'title': '', 'body': text}
+            for i, text in enumerate(synthetic_posts(tickers, args.posts, mention_rate=1.0))]
+
+    start = time.perf_counter()
+    for row in rows:
+        index.find(row['body'])
+    match_time = time.perf_counter() - start
+    print(f"posts: {len(rows)}  ticker matching alone: {len(rows) / match_time:,.0f} posts/s")
+
+    for batch_size in args.batch_sizes:
+        backend = LexiconBackend(index, batch_size=batch_size)
+        labels = Counter()
+        start = time.perf_counter()
+        for batch in pack_batches(rows, lambda row: row['body'], batch_size=batch_size, token_budget=None):
+            for _, _, extracted in backend.analyze(batch):
+                labels.update(item['sentiment'] for item in json.loads(extracted))
+        elapsed = time.perf_counter() - start
+        print(f"batch {batch_size:6d}: {elapsed:6.1f}s  {len(rows) / elapsed:9,.0f} posts/s  {dict(labels)}")
+
+
+if __name__ == '__main__':
+    main()
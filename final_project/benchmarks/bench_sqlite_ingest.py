@@ -0,0 +1,74 @@
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import POST_COLUMNS, PostWriter, connect
+
+CREATE_POSTS = """
+    CREATE TABLE IF NOT EXISTS posts (
+        url TEXT, title TEXT, sub_reddit TEXT, author TEXT, post_date REAL, upvotes INTEGER,
+        body TEXT, comments INTEGER, image TEXT, scraped_date REAL,
+        primary key (url, scraped_date)
+    )
+"""
+INSERT_POST = f"INSERT OR IGNORE INTO posts ({', '.join(POST_COLUMNS)}) VALUES ({', '.join('?' for _ in POST_COLUMNS)})"
+
+
+def synthetic_rows(n, run):
+    body = "Long post body about earnings, options flow and the macro picture. " * 20
+    return [(f"https://reddit.com/r/stocks/{run}/{i}", f"Post {i}", 'stocks', 'someone', 1721100000.0 + i,
+             i % 500, body, i % 80, '', '2024-07-16') for i in range(n)]
+
+
+def bench_row_at_a_time(path, rows):
+    # What Crawler.save_to_sqlite used to do: rollback journal, commit per post
+    conn = sqlite3.connect(path)
+    conn.execute(CREATE_POSTS)
+    start = time.perf_counter()
+    for row in rows:
+        cursor = conn.cursor()
+        cursor.execute(INSERT_POST, row)
+        conn.commit()
+        cursor.close()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def bench_buffered(path, rows, per_subreddit):
+    conn = connect(path)
+    conn.execute(CREATE_POSTS)
+    writer = PostWriter(conn, batch_size=len(rows))
+    start = time.perf_counter()
+    for i, row in enumerate(rows, 1):
+        writer.add(row)
+        if i % per_subreddit == 0:
+            writer.flush()
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rows/sec for per-row commits vs. buffered WAL writes')
+    parser.add_argument('--rows', type=int, default=1100, help='11 subreddits x 100 posts by default')
+    parser.add_argument('--per-subreddit', type=int, default=100)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows, 'before')
+    with tempfile.TemporaryDirectory() as tmp:
+        before = bench_row_at_a_time(os.path.join(tmp, 'before.db'), rows)
+        after = bench_buffered(os.path.join(tmp, 'after.db'), synthetic_rows(args.rows, 'after'), args.per_subreddit)
+    print(f"commit per row:        {before:7.3f}s  {args.rows / before:10,.0f} rows/s")
+    print(f"buffered + WAL:        {after:7.3f}s  {args.rows / after:10,.0f} rows/s")
+    print(f"speedup:               {before / after:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
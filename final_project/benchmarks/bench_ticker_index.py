@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ticker_index import TickerIndex, TICKERS_PATH
+
+FILLER = ("the market is wild today and i think we are going to see a big move "
+          "before earnings calls puts yolo diamond hands bag holder rotation into "
+          "value fed rates inflation print was hot bond yields dip buy").split()
+
+
+def synthetic_posts(tickers, n_posts, mention_rate=0.3, seed=0):
+    rng = random.Random(seed)
+    # Mentions are heavily skewed towards the big names, like real subs
+    weights = [1.0 / (rank + 1) for rank in range(len(tickers))]
+    posts = []
+    for _ in range(n_posts):
+        words = rng.choices(FILLER, k=rng.randint(20, 120))
+        if rng.random() < mention_rate:
+            ticker = rng.choices(tickers, weights=weights)[0]
+            words.insert(rng.randrange(len(words)), rng.choice([ticker, '$' + ticker]))
+        posts.append(' '.join(words))
+    return posts
+
+
+def bench_regex(tickers, posts):
+    ticker_patterns = {ticker: re.compile(r'\b' + re.escape(ticker) + r'\b', re.IGNORECASE) for ticker in tickers}
+    start = time.perf_counter()
+    hits = sum(1 for text in posts if any(pattern.search(text) for pattern in ticker_patterns.values()))
+    return time.perf_counter() - start, hits
+
+
+def bench_index(index, posts):
+    start = time.perf_counter()
+    hits = sum(1 for text in posts if index.contains_any(text))
+    elapsed_any = time.perf_counter() - start
+    start = time.perf_counter()
+    matches = sum(len(index.find(text)) for text in posts)
+    elapsed_find = time.perf_counter() - start
+    return elapsed_any, elapsed_find, hits, matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aho-Corasick ticker index vs. the per-ticker regex loop')
+    parser.add_argument('--posts', type=int, default=100_000)
+    parser.add_argument('--regex-posts', type=int, default=1_000,
+                        help='the regex loop is timed on this many posts and extrapolated')
+    parser.add_argument('--tickers', default=TICKERS_PATH)
+    args = parser.parse_args()
+
+    with open(args.tickers, 'r') as f:
+        tickers = [v['ticker'] for v in json.load(f).values()]
+
+    start = time.perf_counter()
+    index = TickerIndex.from_json(args.tickers)
+    build_time = time.perf_counter() - start
+
+    posts = synthetic_posts(tickers, args.posts)
+    regex_sample = posts[:min(args.regex_posts, len(posts))]
+
+    regex_time, regex_hits = bench_regex(tickers, regex_sample)
+    regex_per_post = regex_time / len(regex_sample)
+    any_time, find_time, hits, matches = bench_index(index, posts)
+
+    print(f"tickers: {len(tickers)}  posts: {len(posts)}  index build: {build_time:.2f}s")
+    print(f"regex loop:      {regex_per_post * 1e6:9.1f} us/post  "
+          f"(~{regex_per_post * len(posts):.1f}s for {len(posts)} posts, timed on {len(regex_sample)})")
+    print(f"index any():     {any_time / len(posts) * 1e6:9.1f} us/post  ({any_time:.1f}s total, {hits} posts hit)")
+    print(f"index find():    {find_time / len(posts) * 1e6:9.1f} us/post  ({find_time:.1f}s total, {matches} matches)")
+    print(f"speedup (any):   {regex_per_post * len(posts) / any_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
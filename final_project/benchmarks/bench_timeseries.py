@@ -0,0 +1,98 @@
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use('Agg')
+
+import rollups
+import vis
+from db import connect
+
+SUBREDDITS = ["wallstreetbets", "investing", "stocks", "trading", "forex", "algotrading",
+              "investor", "etoro", "asktrading", "finance", "forextrading"]
+
+
+def synthetic_rollups(conn, days, n_tickers, seed=0, spike='SPIKE'):
+    # A year of rollups as the dashboards would see them: a long tail of
+    # tickers with a few mentions a day, plus one that takes off on the last day
+    rng = random.Random(seed)
+    rollups.create_rollup_tables(conn)
+    start = datetime.date(2024, 1, 1)
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+    weights = [1 / (i + 1) for i in range(n_tickers)]
+    dates = [(start + datetime.timedelta(days=d)).isoformat() for d in range(days)]
+    with conn:
+        for day, date in enumerate(dates):
+            rows = []
+            for ticker, weight in zip(tickers, weights):
+                mentions = int(rng.expovariate(1 / (200 * weight)))
+                if mentions:
+                    positive = rng.randint(0, mentions)
+                    negative = rng.randint(0, mentions - positive)
+                    rows.append((date, ticker, positive, mentions - positive - negative, negative))
+            mentions = 3 if day < days - 1 else 60
+            rows.append((date, spike, mentions - 1, 1, 0))
+            conn.executemany(rollups.UPSERT_TICKER, rows)
+            totals = [sum(row[i] for row in rows) for i in (2, 3, 4)]
+            for sub_reddit in SUBREDDITS:
+                share = [count // len(SUBREDDITS) for count in totals]
+                conn.execute(rollups.UPSERT_SUBREDDIT, (date, sub_reddit, rng.randint(50, 500), *share))
+            conn.execute(rollups.UPSERT_OVERALL, (date, sum(totals) // 2, *totals))
+    return dates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Range queries over the daily rollups')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--tickers', type=int, default=2000)
+    parser.add_argument('--plot', help='write the range figure to this path')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn = connect(os.path.join(directory, 'bench.db'))
+        dates = synthetic_rollups(conn, args.days, args.tickers)
+        rows = conn.execute('SELECT COUNT(*) FROM rollup_ticker').fetchone()[0]
+        print(f"days: {len(dates)}  rollup_ticker rows: {rows:,}")
+
+        start = time.perf_counter()
+        for date in dates:
+            vis.mentions_and_sentiment_sql(conn, date)
+            vis.subreddit_sentiment_sql(conn, date)
+            vis.overall_sentiment_sql(conn, date)
+        per_day = time.perf_counter() - start
+        print(f"three daily views x {len(dates)} days:      {per_day:6.2f}s")
+
+        for freq in ('D', 'W', 'MS'):
+            start = time.perf_counter()
+            ts = vis.sentiment_timeseries(conn, dates[0], dates[-1], freq=freq)
+            elapsed = time.perf_counter() - start
+            print(f"sentiment_timeseries freq={freq:<3}            {elapsed:6.2f}s  "
+                  f"({len(ts.tickers)} periods x {ts.tickers.shape[1] // 3} tickers)")
+
+        start = time.perf_counter()
+        few = vis.sentiment_timeseries(conn, dates[0], dates[-1], tickers=['T0000', 'T0001', 'SPIKE'])
+        print(f"sentiment_timeseries, 3 tickers:         {time.perf_counter() - start:6.2f}s")
+
+        ts = vis.sentiment_timeseries(conn, dates[0], dates[-1])
+        start = time.perf_counter()
+        vis.rolling_sentiment(ts.tickers, 7)
+        trend = vis.trending_tickers(ts)
+        print(f"rolling window + trending_tickers:       {time.perf_counter() - start:6.2f}s")
+        print(trend.head().to_string())
+
+        if args.plot:
+            start = time.perf_counter()
+            vis.plot_timeseries(few).savefig(args.plot)
+            print(f"plot_timeseries -> {args.plot}:  {time.perf_counter() - start:6.2f}s")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
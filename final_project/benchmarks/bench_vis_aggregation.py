@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import vis
+
+SUBREDDITS = ["wallstreetbets", "investing", "stocks", "trading", "forex", "algotrading",
+              "investor", "etoro", "asktrading", "finance", "forextrading"]
+TICKERS = ['AAPL', 'TSLA', 'NVDA', 'GME', 'AMC', 'MSFT', 'AMZN', 'META', 'PLTR', 'SPY', 'AMD', 'NFLX']
+
+
+def synthetic_frames(n_mentions, days=30, mentions_per_post=2.5, seed=0):
+    rng = random.Random(seed)
+    n_posts = int(n_mentions / mentions_per_post)
+    dates = [f"2024-07-{d + 1:02d}" if d < 31 else f"2024-08-{d - 30:02d}" for d in range(days)]
+    posts = []
+    mentions = []
+    remaining = n_mentions
+    for i in range(n_posts):
+        url = f"https://reddit.com/{i}"
+        date = dates[i % days]
+        posts.append((url, date, rng.choice(SUBREDDITS)))
+        k = min(remaining, rng.randint(0, 5)) if i < n_posts - 1 else remaining
+        remaining -= k
+        extracted = [{'ticker': rng.choice(TICKERS), 'sentiment': rng.choice(['positive', 'neutral', 'negative'])}
+                     for _ in range(k)]
+        mentions.append((url, date, json.dumps(extracted)))
+    posts_df = pd.DataFrame(posts, columns=['url', 'scraped_date', 'sub_reddit'])
+    mentions_df = pd.DataFrame(mentions, columns=['url', 'scraped_date', 'extracted_data'])
+    return mentions_df, posts_df, dates
+
+
+def time_views(module, date, mentions_df, posts_df):
+    start = time.perf_counter()
+    results = (module.mentions_and_sentiment(date, mentions_df, posts_df),
+               module.subreddit_sentiment(date, mentions_df, posts_df),
+               module.overall_sentiment(date, mentions_df, posts_df))
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='vis.py aggregations over a large mentions table')
+    parser.add_argument('--mentions', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--baseline', help='path to a copy of the old vis.py to compare against')
+    args = parser.parse_args()
+
+    mentions_df, posts_df, dates = synthetic_frames(args.mentions, args.days)
+    print(f"mentions: {args.mentions:,}  posts: {len(posts_df):,}  days: {args.days}")
+
+    start = time.perf_counter()
+    long_df = vis.sentiment_frame(mentions_df, posts_df)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    for date in dates:
+        vis.mentions_and_sentiment(date, mentions_df, posts_df, long_df)
+        vis.subreddit_sentiment(date, mentions_df, posts_df, long_df)
+        vis.overall_sentiment(date, mentions_df, posts_df, long_df)
+    views = time.perf_counter() - start
+    print(f"sentiment_frame over all {len(long_df):,} mentions: {build:6.2f}s")
+    print(f"three views x {len(dates)} days from the frame:    {views:6.2f}s")
+
+    one_day, new_results = time_views(vis, dates[0], mentions_df, posts_df)
+    print(f"one day, standalone calls (new):       {one_day:8.2f}s")
+
+    if args.baseline:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location('old_vis', args.baseline)
+        old_vis = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(old_vis)
+        old_time, old_results = time_views(old_vis, dates[0], mentions_df, posts_df)
+        print(f"one day, standalone calls (baseline):  {old_time:8.2f}s  ({old_time / one_day:.0f}x slower)")
+        print(f"results identical: {old_results == new_results}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rollups
+from benchmarks.bench_sqlite_ingest import CREATE_POSTS
+from db import CREATE_POSTS_INDEX, PostWriter, connect
+from mentions import INSERT_MENTION, SENTIMENT_SCORES
+from ticker_index import TICKERS_PATH, normalize_company_name
+
+SUBREDDITS = ["wallstreetbets", "investing", "stocks", "trading", "forex", "algotrading",
+              "investor", "etoro", "asktrading", "finance", "forextrading"]
+# Share of posts each subreddit contributes, busiest first
+SUBREDDIT_WEIGHTS = [30, 14, 14, 8, 6, 4, 4, 3, 3, 8, 6]
+SENTIMENT_WEIGHTS = {'positive': 0.45, 'neutral': 0.35, 'negative': 0.20}
+
+FILLER = ("the market is wild today and i think we are going to see a big move before earnings "
+          "calls puts yolo diamond hands bag holder rotation into value fed rates inflation print "
+          "was hot bond yields dip buy what do you all think about my portfolio allocation "
+          "should i sell or hold through the quarter guidance looked weak but revenue beat").split()
+
+
+def load_universe(path=TICKERS_PATH):
+    # (ticker, company alias) in file order, which is roughly by market cap
+    with open(path, 'r') as f:
+        entries = json.load(f).values()
+    return [(v['ticker'].upper(), normalize_company_name(v['title'])) for v in entries]
+
+
+def offline_filter():
+    # Benchmarks never call the API, so filter.py needs neither credentials
+    # nor a scraped_data directory should anything reach for the client.
+    os.environ.setdefault('OPENAI_API_KEY', 'offline')
+    os.environ.setdefault('FILTER_CACHE_PATH', ':memory:')
+    os.environ.setdefault('FILTER_DEDUP_PATH', ':memory:')
+    import filter
+    return filter
+
+
+def create_schema(conn) -> None:
+    # The same tables reddit_scrape.py and filter.py create
+    conn.execute(CREATE_POSTS)
+    conn.execute(CREATE_POSTS_INDEX)
+    conn.commit()
+    offline_filter().create_tables(conn)
+
+
+class CorpusGenerator():
+    # Deterministic posts/stock_mentions/mention tables shaped like the real
+    # scrape: posts spread over `days` scraped dates and the usual subreddits,
+    # `mention_rate` of them naming 1-3 tickers drawn with Zipf weights over
+    # company_tickers.json (as $TICKER, TICKER or the company name), and the
+    # oldest `analyzed` share already carrying an extraction, so the newest
+    # posts are the unanalyzed backlog filter.py would pick up.
+    def __init__(self, n_posts, days=30, mention_rate=0.4, analyzed=0.9, seed=0, tickers_path=TICKERS_PATH,
+                 start_date=datetime.date(2024, 7, 1)):
+        self.n_posts = n_posts
+        self.days = days
+        self.mention_rate = mention_rate
+        self.analyzed = analyzed
+        self.rng = random.Random(seed)
+        self.universe = load_universe(tickers_path)
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank + 1) ** 1.1 for rank in range(len(self.universe))))
+        self.sentiments = list(itertools.accumulate(SENTIMENT_WEIGHTS.values()))
+        self.dates = [(start_date + datetime.timedelta(days=d)).isoformat() for d in range(days)]
+
+    def _mentions(self):
+        if self.rng.random() >= self.mention_rate:
+            return []
+        picks = self.rng.choices(range(len(self.universe)), cum_weights=self.cum_weights, k=self.rng.choice((1, 1, 1, 2, 3)))
+        return list(dict.fromkeys(picks))
+
+    def _text(self, picks):
+        rng = self.rng
+        words = rng.choices(FILLER, k=rng.randint(15, 150))
+        for i in picks:
+            ticker, alias = self.universe[i]
+            form = rng.random()
+            if form < 0.5:
+                word = '$' + ticker
+            elif form < 0.8 or len(alias) < 4:
+                word = ticker
+            else:
+                word = alias.title()
+            words.insert(rng.randrange(len(words) + 1), word)
+        split = min(len(words), rng.randint(5, 12))
+        title = ' '.join(words[:split])
+        return title[:1].upper() + title[1:], ' '.join(words[split:])
+
+    def rows(self):
+        # Yields (post row, extracted mentions or None when unanalyzed)
+        rng = self.rng
+        per_day = max(1, -(-self.n_posts // self.days))
+        cutoff = int(self.n_posts * self.analyzed)
+        for i in range(self.n_posts):
+            date = self.dates[min(i // per_day, self.days - 1)]
+            sub_reddit = rng.choices(SUBREDDITS, weights=SUBREDDIT_WEIGHTS)[0]
+            picks = self._mentions()
+            title, body = self._text(picks)
+            url = f"https://www.reddit.com/r/{sub_reddit}/comments/{i:08x}/"
+            post = (url, title, sub_reddit, f"user{rng.randint(1, 50000)}", 1719800000.0 + i * 7,
+                    int(rng.paretovariate(1.2)) - 1, body, int(rng.paretovariate(1.5)) - 1, '', date)
+            extracted = None
+            if i < cutoff:
+                extracted = [(self.universe[p][0], rng.choices(list(SENTIMENT_WEIGHTS), cum_weights=self.sentiments)[0])
+                             for p in picks]
+            yield post, extracted
+
+    def write(self, path, chunk_size=20000):
+        conn = connect(path)
+        create_schema(conn)
+        writer = PostWriter(conn, batch_size=chunk_size)
+        mentions = []
+        mention_rows = []
+
+        def flush_mentions():
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO stock_mentions VALUES (?, ?, ?)', mentions)
+                conn.executemany(INSERT_MENTION, mention_rows)
+            mentions.clear()
+            mention_rows.clear()
+
+        for post, extracted in self.rows():
+            writer.add(post)
+            if extracted is not None:
+                url, date, sub_reddit = post[0], post[-1], post[2]
+                mentions.append((url, date, json.dumps([{'ticker': t, 'sentiment': s} for t, s in extracted])))
+                mention_rows.extend((url, date, sub_reddit, t, s, SENTIMENT_SCORES[s]) for t, s in extracted)
+                if len(mentions) >= chunk_size:
+                    writer.flush()
+                    flush_mentions()
+        writer.flush()
+        flush_mentions()
+        rollups.rebuild(conn)
+        conn.execute('ANALYZE')
+        conn.close()
+        return path
+
+
+def corpus_path(directory, n_posts, days, seed):
+    return os.path.join(directory, f"corpus-{n_posts}-{days}d-s{seed}.db")
+
+
+def ensure_corpus(directory, n_posts, days=30, seed=0, verbose=True):
+    # Generated once per (size, days, seed) and reused; large corpora take minutes
+    path = corpus_path(directory, n_posts, days, seed)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        start = time.perf_counter()
+        CorpusGenerator(n_posts, days, seed=seed).write(path + '.partial')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + '.partial' + suffix):
+                os.replace(path + '.partial' + suffix, path + suffix)
+        if verbose:
+            print(f"Generated {n_posts:,} posts in {time.perf_counter() - start:.1f}s -> {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic posts/stock_mentions database')
+    parser.add_argument('path')
+    parser.add_argument('--posts', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--mention-rate', type=float, default=0.4)
+    parser.add_argument('--analyzed', type=float, default=0.9)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    CorpusGenerator(args.posts, args.days, args.mention_rate, args.analyzed, args.seed).write(args.path)
+    print(f"Wrote {args.posts:,} posts to {args.path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import create_schema, ensure_corpus, offline_filter
+from db import POST_COLUMNS, PostWriter, connect
+
+SECTIONS = ('prefilter', 'selection', 'ingest', 'vis')
+# Slower than the baseline by more than this fraction, and by more than
+# MIN_SLOWDOWN seconds, counts as a regression. The absolute floor keeps
+# millisecond-scale measures, where scheduler noise alone is tens of
+# percent, from failing the gate.
+THRESHOLD = 0.2
+MIN_SLOWDOWN = 0.02
+REPEAT = 5
+
+
+def timed(results, name, items, function, *args, repeat=1, setup=None, **kwargs):
+    # Median of `repeat` runs; short timings are noisy on a shared box. With
+    # setup, each run gets a fresh setup() result as its first argument,
+    # prepared outside the timing.
+    samples = []
+    for _ in range(repeat):
+        call_args = (setup(), *args) if setup is not None else args
+        start = time.perf_counter()
+        value = function(*call_args, **kwargs)
+        samples.append(time.perf_counter() - start)
+    seconds = statistics.median(samples)
+    count = items(value) if callable(items) else items
+    results[name] = {'seconds': round(seconds, 4), 'items': count, 'repeat': repeat,
+                     'per_second': round(count / seconds, 1) if seconds else None}
+    print(f"  {name:<32}{seconds:9.3f}s  {count:>10,} items  {results[name]['per_second'] or 0:>12,.0f}/s")
+    return value
+
+
+def bench_prefilter(conn, results, sample, repeat):
+    from ticker_index import TickerIndex
+    timed(results, 'ticker_index_build', 1, TickerIndex.from_json, repeat=repeat)
+    # What filter.py does at import: map the compiled index, compiling it first if needed
+    TickerIndex.load()
+    index = timed(results, 'ticker_index_load', 1, TickerIndex.load, repeat=repeat)
+    texts = [f"{title} {body}" for title, body in conn.execute(
+        'SELECT title, body FROM posts ORDER BY rowid LIMIT ?', (sample,))]
+    timed(results, 'prefilter_contains_any', len(texts), lambda: sum(map(index.contains_any, texts)),
+          repeat=repeat)
+    timed(results, 'prefilter_tickers_in', len(texts), lambda: [index.tickers_in(text) for text in texts],
+          repeat=repeat)
+
+
+def bench_selection(conn, results, repeat):
+    # The unanalyzed-post scan at the top of filter.py main(), from a zero watermark
+    filter = offline_filter()
+    timed(results, 'unanalyzed_selection', lambda n: n, lambda: sum(1 for _ in filter.iter_unanalyzed_posts(conn, 0)),
+          repeat=repeat)
+
+
+def bench_ingest(conn, results, sample, directory, repeat):
+    filter = offline_filter()
+    rows = conn.execute(f"SELECT {', '.join(POST_COLUMNS)} FROM posts ORDER BY rowid LIMIT ?", (sample,)).fetchall()
+    extracted = dict(((url, date), data) for url, date, data in conn.execute(
+        'SELECT url, scraped_date, extracted_data FROM stock_mentions ORDER BY rowid LIMIT ?', (sample,)))
+    targets = []
+
+    def fresh_target():
+        # Every run writes into an empty database of its own
+        target = connect(os.path.join(directory, f'ingest-{len(targets)}.db'))
+        create_schema(target)
+        targets.append(target)
+        return target
+
+    def write_posts(target):
+        # One flush per 100 posts, the size of one subreddit listing
+        writer = PostWriter(target, batch_size=100)
+        for row in rows:
+            writer.add(row)
+        writer.flush()
+    timed(results, 'ingest_posts', len(rows), write_posts, repeat=repeat, setup=fresh_target)
+
+    def write_mentions(target):
+        for (url, date), data in extracted.items():
+            filter.save_mention(target, (url, date, data), commit=False)
+        target.commit()
+    timed(results, 'ingest_save_mention', len(extracted), write_mentions, repeat=repeat, setup=fresh_target)
+    for target in targets:
+        target.close()
+
+
+def bench_vis(conn, results, repeat):
+    import pandas as pd
+    import vis
+    dates = [date for date, in conn.execute('SELECT scraped_date FROM rollup_overall ORDER BY scraped_date')]
+    day = dates[-1]
+    mentions_df, posts_df = timed(results, 'vis_read_one_day', lambda frames: len(frames[0]), lambda: (
+        pd.read_sql_query('SELECT url, scraped_date, extracted_data FROM stock_mentions WHERE scraped_date = ?', conn, params=(day,)),
+        pd.read_sql_query('SELECT url, scraped_date, sub_reddit FROM posts WHERE scraped_date = ?', conn, params=(day,))),
+        repeat=repeat)
+    long_df = timed(results, 'vis_sentiment_frame', len, vis.sentiment_frame, mentions_df, posts_df, repeat=repeat)
+    timed(results, 'vis_frame_views', 3, lambda: (vis.mentions_and_sentiment(day, mentions_df, posts_df, long_df),
+                                                  vis.subreddit_sentiment(day, mentions_df, posts_df, long_df),
+                                                  vis.overall_sentiment(day, mentions_df, posts_df, long_df)),
+          repeat=repeat)
+    timed(results, 'vis_rollup_views_all_days', len(dates), lambda: [
+        (vis.mentions_and_sentiment_sql(conn, date), vis.subreddit_sentiment_sql(conn, date),
+         vis.overall_sentiment_sql(conn, date)) for date in dates], repeat=repeat)
+    timed(results, 'vis_timeseries_all_days', len(dates), vis.sentiment_timeseries, conn, dates[0], dates[-1],
+          repeat=repeat)
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'posts': args.posts, 'days': args.days, 'seed': args.seed, 'sample': args.sample, 'commit': commit,
+            'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results, baseline, threshold=THRESHOLD, min_slowdown=MIN_SLOWDOWN):
+    # Benchmarks whose throughput dropped more than threshold below the
+    # baseline and that took more than min_slowdown seconds longer than the
+    # baseline rate predicts for this run's item count
+    regressions = {}
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before.get('per_second') or not result.get('per_second'):
+            continue
+        slowdown = result['seconds'] - result['items'] / before['per_second']
+        if result['per_second'] < before['per_second'] * (1 - threshold) and slowdown > min_slowdown:
+            regressions[name] = (before['per_second'], result['per_second'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark suite over a synthetic corpus')
+    parser.add_argument('--posts', type=int, default=10_000, help='corpus size (10k to 10M)')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'dwd-bench'),
+                        help='where generated corpora are kept between runs')
+    parser.add_argument('--sample', type=int, default=20_000, help='posts used by the prefilter and ingest timings')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='every timing is the median of this many runs')
+    parser.add_argument('--only', nargs='+', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--out', help='write results JSON here')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--min-slowdown', type=float, default=MIN_SLOWDOWN,
+                        help='seconds a timing must also lose before it counts as a regression')
+    args = parser.parse_args()
+
+    path = ensure_corpus(args.corpus_dir, args.posts, args.days, args.seed)
+    conn = connect(path)
+    results = {}
+    print(f"corpus: {path}")
+    with tempfile.TemporaryDirectory() as directory:
+        if 'prefilter' in args.only:
+            bench_prefilter(conn, results, args.sample, args.repeat)
+        if 'selection' in args.only:
+            bench_selection(conn, results, args.repeat)
+        if 'ingest' in args.only:
+            bench_ingest(conn, results, args.sample, directory, args.repeat)
+        if 'vis' in args.only:
+            bench_vis(conn, results, args.repeat)
+    conn.close()
+
+    report = {'meta': metadata(args), 'results': results}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"results: {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('posts') != args.posts:
+            print(f"warning: baseline was run on {baseline['meta'].get('posts'):,} posts")
+        regressions = compare(results, baseline['results'], args.threshold, args.min_slowdown)
+        for name, (before, after) in regressions.items():
+            print(f"REGRESSION {name}: {before:,.0f}/s -> {after:,.0f}/s ({after / before - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%} and {args.min_slowdown * 1000:.0f}ms against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
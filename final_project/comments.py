@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import time
+
+from metrics import inc, timed
+
+# Highest-scoring posts per subreddit whose comment threads are ingested
+COMMENT_POSTS = int(os.getenv('SCRAPE_COMMENT_POSTS', 5))
+COMMENT_BATCH_SIZE = int(os.getenv('SCRAPE_COMMENT_BATCH_SIZE', 1000))
+
+COMMENT_COLUMNS = ('comment_id', 'url', 'post_id', 'post_url', 'sub_reddit', 'parent_id', 'author', 'body',
+                   'upvotes', 'comment_date', 'has_ticker', 'scraped_date')
+
+CREATE_COMMENTS = '''
+    CREATE TABLE IF NOT EXISTS comments (
+        comment_id TEXT PRIMARY KEY,
+        url TEXT,
+        post_id TEXT,
+        post_url TEXT,
+        sub_reddit TEXT,
+        parent_id TEXT,
+        author TEXT,
+        body TEXT,
+        upvotes INTEGER,
+        comment_date REAL,
+        has_ticker INTEGER,
+        scraped_date TEXT
+    )
+'''
+
+# Per post: the comment count and newest comment of the last completed walk
+CREATE_COMMENT_PROGRESS = '''
+    CREATE TABLE IF NOT EXISTS comment_progress (
+        post_id TEXT PRIMARY KEY,
+        post_url TEXT,
+        sub_reddit TEXT,
+        num_comments INTEGER,
+        last_comment_date REAL,
+        walked INTEGER,
+        last_scraped TEXT
+    )
+'''
+
+COMMENT_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS comments_post ON comments (post_id)',
+]
+
+INSERT_COMMENT = (f"INSERT OR IGNORE INTO comments ({', '.join(COMMENT_COLUMNS)}) "
+                  f"VALUES ({', '.join('?' for _ in COMMENT_COLUMNS)})")
+
+UPSERT_PROGRESS = 'INSERT OR REPLACE INTO comment_progress VALUES (?, ?, ?, ?, ?, ?, ?)'
+
+
+def create_comment_tables(conn) -> None:
+    conn.execute(CREATE_COMMENTS)
+    conn.execute(CREATE_COMMENT_PROGRESS)
+    for statement in COMMENT_INDEXES:
+        conn.execute(statement)
+    conn.commit()
+
+
+def select_posts(posts, n):
+    # The n highest-scoring posts of a listing
+    return sorted(posts, key=lambda post: post.score, reverse=True)[:n]
+
+
+def comment_url(post, comment_id):
+    # The comment's permalink; also its key in stock_mentions
+    return f"https://www.reddit.com{post.permalink}{comment_id}/"
+
+
+def comment_subreddit(conn, url, scraped_date):
+    # (sub_reddit,) of the comment with this permalink, found through the id
+    # comment_url() ends it with, or None if there is no such comment (or no
+    # comments table yet)
+    comment_id = url.rstrip('/').rsplit('/', 1)[-1]
+    try:
+        return conn.execute('SELECT sub_reddit FROM comments WHERE comment_id = ? AND url = ? AND scraped_date = ?',
+                            (comment_id, url, scraped_date)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+
+
+class CommentIngester():
+    # Streams the comment forests of selected posts into the comments table
+    # without ever holding a whole thread: the provider yields comments as it
+    # walks the tree, and they are written with one executemany per
+    # batch_size, so memory is one batch plus the provider's walk.
+    #
+    # comment_progress makes later scrapes refresh only what is new: a post
+    # whose comment count has not grown since its last walk is skipped
+    # without a request, and a re-walk only stores comments posted after the
+    # newest one already stored. Each comment goes through the ticker
+    # prefilter once, on the way in; has_ticker marks the ones filter.py and
+    # pipeline.py send to extraction.
+    def __init__(self, connection, provider, ticker_index=None, batch_size=COMMENT_BATCH_SIZE):
+        self.connection = connection
+        self.provider = provider
+        if ticker_index is None:
+            from ticker_index import TickerIndex
+            ticker_index = TickerIndex.load()
+        self.ticker_index = ticker_index
+        self.batch_size = batch_size
+        self.stats = {'posts': 0, 'skipped': 0, 'walked': 0, 'stored': 0, 'with_tickers': 0}
+        create_comment_tables(connection)
+
+    def progress(self, post_id):
+        return self.connection.execute('SELECT num_comments, last_comment_date FROM comment_progress WHERE post_id = ?',
+                                       (post_id,)).fetchone()
+
+    def ingest(self, sub_reddit, post):
+        # Stores the post's new comments, yielding the {url, title, body,
+        # scraped_date} rows of those naming a ticker a batch at a time, once
+        # the batch is committed
+        self.stats['posts'] += 1
+        progress = self.progress(post.id)
+        if progress is not None and post.num_comments <= progress[0]:
+            self.stats['skipped'] += 1
+            return
+        since = progress[1] if progress is not None else None
+        newest = since
+        today = time.strftime("%Y-%m-%d", time.localtime(time.time()))
+        contains_any = self.ticker_index.contains_any
+        batch = []
+        walked = 0
+        for comment in self.provider.comments(post):
+            walked += 1
+            created = comment.created_utc
+            # Ties with the newest stored comment are re-sent; the insert ignores them
+            if since is not None and created < since:
+                continue
+            if newest is None or created > newest:
+                newest = created
+            body = comment.body
+            batch.append((comment.id, comment_url(post, comment.id), post.id, post.url, sub_reddit, comment.parent_id,
+                          str(comment.author), body, comment.score, created, int(contains_any(body)), today))
+            if len(batch) >= self.batch_size:
+                yield from self._flush(batch)
+                batch = []
+        yield from self._flush(batch)
+        # Only a finished walk moves the watermark, so an interrupted one is redone
+        with self.connection:
+            self.connection.execute(UPSERT_PROGRESS, (post.id, post.url, sub_reddit, post.num_comments, newest,
+                                                      walked, today))
+        self.stats['walked'] += walked
+
+    @timed('comments_flush_seconds')
+    def _flush(self, batch):
+        if not batch:
+            return []
+        # Comments naming a ticker are inserted one by one, so only those that
+        # were new (not ties with `since`, not a re-walk after a crash) go on
+        # to extraction; the rest go in with one executemany
+        rows = []
+        with self.connection:
+            stored = self.connection.executemany(INSERT_COMMENT, [row for row in batch if not row[10]]).rowcount
+            for row in batch:
+                if row[10] and self.connection.execute(INSERT_COMMENT, row).rowcount:
+                    rows.append({'url': row[1], 'title': '', 'body': row[7], 'scraped_date': row[11]})
+        stored += len(rows)
+        inc('comments_stored', stored)
+        self.stats['stored'] += stored
+        self.stats['with_tickers'] += len(rows)
+        return rows
+
+    def summary(self):
+        return (f"Comments: {self.stats['stored']} stored ({self.stats['with_tickers']} naming a ticker) from "
+                f"{self.stats['walked']} walked over {self.stats['posts'] - self.stats['skipped']} threads, "
+                f"{self.stats['skipped']} threads unchanged")
@@ -0,0 +1,111 @@
+import hashlib
+import sqlite3
+
+from metrics import inc, timed
+
+DB_PATH = 'final_project/scraped_data/reddit_posts.db'
+
+# WAL lets filter.py and vis.py keep reading while the scraper writes, and
+# synchronous=NORMAL only fsyncs at checkpoints instead of on every commit.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,  # KiB
+}
+
+SNAPSHOT_COLUMNS = ('url', 'scraped_date', 'upvotes', 'comments')
+SEEN_COLUMNS = ('sub_reddit', 'post_id', 'url', 'fingerprint', 'first_seen', 'last_seen')
+
+POST_COLUMNS = ('url', 'title', 'sub_reddit', 'author', 'post_date', 'upvotes', 'body', 'comments', 'image', 'scraped_date')
+# What an edit (or a newer score) changes in a post's row for the day
+EDITABLE_COLUMNS = ('title', 'upvotes', 'body', 'comments', 'image')
+
+# Lets "which subreddits were scraped that day" (vis.py) avoid a full posts
+# scan; created wherever posts is
+CREATE_POSTS_INDEX = 'CREATE INDEX IF NOT EXISTS posts_date_subreddit ON posts (scraped_date, sub_reddit)'
+
+
+def post_fingerprint(title, body, url):
+    # Changes when a post is edited, not when only its score or comment count moves
+    return hashlib.sha1('\x1f'.join((title or '', body or '', url or '')).encode('utf-8')).hexdigest()
+
+
+def connect(path=DB_PATH, **kwargs):
+    connection = sqlite3.connect(path, **kwargs)
+    for pragma, value in PRAGMAS.items():
+        connection.execute(f"PRAGMA {pragma} = {value}")
+    return connection
+
+
+def _insert(table, columns, verb='INSERT OR IGNORE'):
+    return f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+
+
+class PostWriter():
+    # Buffers posts (plus, for incremental scrapes, score snapshots and
+    # seen-post fingerprints) and writes them with one executemany per table
+    # per flush, so a subreddit costs one transaction instead of one commit
+    # per post.
+    STATEMENTS = {
+        'posts': _insert('posts', POST_COLUMNS),
+        # Posts edited since they were stored today replace that row's content
+        'edited_posts': _insert('posts', POST_COLUMNS, 'INSERT') + f"""
+            ON CONFLICT (url, scraped_date) DO UPDATE SET
+                {', '.join(f'{column} = excluded.{column}' for column in EDITABLE_COLUMNS)}
+        """,
+        'post_snapshots': _insert('post_snapshots', SNAPSHOT_COLUMNS, 'INSERT OR REPLACE'),
+        'seen_posts': _insert('seen_posts', SEEN_COLUMNS) + """
+            ON CONFLICT (sub_reddit, post_id) DO UPDATE SET
+                url = excluded.url, fingerprint = excluded.fingerprint, last_seen = excluded.last_seen
+        """,
+    }
+
+    def __init__(self, connection, batch_size=500):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.buffers = {table: [] for table in self.STATEMENTS}
+        self.rows_written = 0
+        self.snapshots_written = 0
+
+    def _add(self, table, row) -> None:
+        self.buffers[table].append(row)
+        if len(self.buffers[table]) >= self.batch_size:
+            self.flush()
+
+    def add(self, row, edited=False) -> None:
+        self._add('edited_posts' if edited else 'posts', row)
+
+    def add_snapshot(self, row) -> None:
+        self._add('post_snapshots', row)
+
+    def mark_seen(self, row) -> None:
+        self._add('seen_posts', row)
+
+    @timed('sqlite_flush_seconds')
+    def flush(self) -> None:
+        # Raises sqlite3.Error if the transaction fails. The rows stay
+        # buffered, so the next flush retries them and callers know not to
+        # treat the listing as stored.
+        if not any(self.buffers.values()):
+            return
+        buffers = self.buffers
+        try:
+            with self.connection:
+                for table, rows in buffers.items():
+                    if rows:
+                        self.connection.executemany(self.STATEMENTS[table], rows)
+        except sqlite3.Error:
+            inc('sqlite_flush_errors')
+            raise
+        self.buffers = {table: [] for table in self.STATEMENTS}
+        inc('sqlite_rows_written', sum(len(rows) for rows in buffers.values()))
+        self.rows_written += len(buffers['posts']) + len(buffers['edited_posts'])
+        self.snapshots_written += len(buffers['post_snapshots'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from llm_cache import cache_key
+
+MODEL = "gpt-4o-mini"
+MAX_TOKENS = 150
+TEMPERATURE = 0.5
+SYSTEM_PROMPT = "You are a sentiment analysis assistant, skilled in extracting stock tickers and sentiment from text."
+BATCH_PROMPT = "Here are several blocks of text scraped from Reddit, each starting with a line '### POST <id>'. For every post, list any stock or company referenced, as well as a rating of how positive the post is about that stock or company. Only output a JSON object mapping each post id to a list of objects with 'ticker' and 'sentiment' keys, nothing else.\n\n{posts}"
+USER_PROMPT = "Here is a block of text scraped from Reddit. Return a list of python dictionaries format of any stock or company referenced, as well as a rating of how positive the post is about that stock or company. Only output the python list, nothing else.\n\n{text}"
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text) -> int:
+    # Roughly 4 characters per token for English; good enough for budgeting
+    return len(text) // 4 + 1
+
+
+def build_messages(text):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT.format(text=text)}]
+
+
+def parse_ticker_list(content):
+    # use regex, to only select the [ ] and the content inside
+    match = re.search(r'\[.*?\]', content or '', re.DOTALL)
+    if match:
+        return match.group()
+    else:
+        print("No match found")
+        return '[]'
+
+
+def request_extraction(client, text, model=MODEL, max_tokens=MAX_TOKENS, temperature=TEMPERATURE,
+                       cache=None, rate_limiter=None):
+    messages = build_messages(text)
+    if cache is not None:
+        key = cache_key(model, messages, max_tokens=max_tokens, temperature=temperature)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    # Only real API calls count against the budget, never cache hits
+    if rate_limiter is not None:
+        rate_limiter.acquire(sum(estimate_tokens(m['content']) for m in messages) + max_tokens)
+
+    completion = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    result = parse_ticker_list(completion.choices[0].message.content)
+
+    if cache is not None:
+        usage = getattr(completion, 'usage', None)
+        cache.put(key, model, result,
+                  getattr(usage, 'prompt_tokens', 0) or 0,
+                  getattr(usage, 'completion_tokens', 0) or 0)
+    return result
+
+
+class BatchParseError(ValueError):
+    pass
+
+
+def post_id(url, scraped_date):
+    # Stable across runs and batch layouts, short enough to not waste tokens
+    return 'p' + hashlib.sha1(f"{url}|{scraped_date}".encode('utf-8')).hexdigest()[:10]
+
+
+def build_batch_messages(posts):
+    blocks = '\n\n'.join(f"### POST {pid}\n{text}" for pid, text in posts.items())
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": BATCH_PROMPT.format(posts=blocks)}]
+
+
+def parse_batch_response(content, post_ids):
+    # Returns {post id: JSON list string} for every id the model answered
+    start = (content or '').find('{')
+    end = (content or '').rfind('}')
+    if start < 0 or end < start:
+        raise BatchParseError("No JSON object in batch response")
+    try:
+        parsed = json.loads(content[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise BatchParseError(f"Malformed batch response: {e}")
+    if not isinstance(parsed, dict):
+        raise BatchParseError("Batch response is not an object")
+    results = {}
+    for pid in post_ids:
+        extracted = parsed.get(pid)
+        if isinstance(extracted, list):
+            results[pid] = json.dumps([item for item in extracted if isinstance(item, dict)])
+    return results
+
+
+def pack_batches(items, text_fn, batch_size=8, token_budget=6000):
+    # Greedily pack consecutive items into batches of at most batch_size posts
+    # and token_budget estimated prompt tokens (None for no limit). Oversized
+    # posts go alone.
+    batch = []
+    batch_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(text_fn(item))
+        over_budget = token_budget is not None and batch_tokens + tokens > token_budget
+        if batch and (len(batch) >= batch_size or over_budget):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def request_batch_extraction(client, posts, model=MODEL, max_tokens=MAX_TOKENS, temperature=TEMPERATURE,
+                             cache=None, rate_limiter=None):
+    # posts maps a stable post id to its text. Returns {post id: JSON list
+    # string}; ids missing from the model's answer are absent from the result
+    # and should be retried one at a time. Raises BatchParseError when the
+    # whole response is unusable.
+    results = {}
+    keys = {}
+    pending = {}
+    for pid, text in posts.items():
+        if cache is not None:
+            keys[pid] = cache_key(model, build_messages(text), max_tokens=max_tokens, temperature=temperature)
+            cached = cache.get(keys[pid])
+            if cached is not None:
+                results[pid] = cached
+                continue
+        pending[pid] = text
+    if not pending:
+        return results
+
+    messages = build_batch_messages(pending)
+    batch_max_tokens = max_tokens * len(pending)
+    if rate_limiter is not None:
+        rate_limiter.acquire(sum(estimate_tokens(m['content']) for m in messages) + batch_max_tokens)
+    completion = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=batch_max_tokens,
+        temperature=temperature,
+    )
+    answered = parse_batch_response(completion.choices[0].message.content, pending)
+    results.update(answered)
+
+    if cache is not None and answered:
+        # Split the batch's usage evenly so cache savings stay comparable
+        usage = getattr(completion, 'usage', None)
+        prompt_tokens = (getattr(usage, 'prompt_tokens', 0) or 0) // len(pending)
+        completion_tokens = (getattr(usage, 'completion_tokens', 0) or 0) // len(pending)
+        for pid, result in answered.items():
+            cache.put(keys[pid], model, result, prompt_tokens, completion_tokens)
+    return results
+
+
+def is_retryable(error) -> bool:
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # openai.APIConnectionError / APITimeoutError carry no status code
+    return type(error).__name__ in ('APIConnectionError', 'APITimeoutError')
+
+
+class RateLimiter():
+    # Sliding one-minute window over both request count and token spend.
+    # acquire() blocks until the request fits inside both budgets.
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, window=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self.events = deque()  # (timestamp, tokens)
+        self.tokens_in_window = 0
+        self.lock = threading.Lock()
+
+    def _expire(self, now) -> None:
+        while self.events and now - self.events[0][0] >= self.window:
+            _, tokens = self.events.popleft()
+            self.tokens_in_window -= tokens
+
+    def _wait_time(self, now, tokens):
+        waits = [0.0]
+        if self.requests_per_minute and len(self.events) >= self.requests_per_minute:
+            waits.append(self.events[len(self.events) - self.requests_per_minute][0] + self.window - now)
+        if self.tokens_per_minute and self.events and self.tokens_in_window + tokens > self.tokens_per_minute:
+            # Wait until enough of the oldest spend has left the window
+            freed = self.tokens_in_window + tokens - self.tokens_per_minute
+            for timestamp, spent in self.events:
+                freed -= spent
+                if freed <= 0:
+                    waits.append(timestamp + self.window - now)
+                    break
+        return max(waits)
+
+    def acquire(self, tokens=0) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._expire(now)
+                delay = self._wait_time(now, tokens)
+                if delay <= 0:
+                    self.events.append((now, tokens))
+                    self.tokens_in_window += tokens
+                    return
+            time.sleep(min(delay, 1.0))
+
+
+class ExtractionEngine():
+    # Runs an extraction function over many posts on a thread pool, keeping at
+    # most max_in_flight calls outstanding. With requests/tokens per minute set
+    # every attempt is rate limited here; leave them unset when extract_fn does
+    # its own limiting (e.g. request_extraction with a cache and rate_limiter).
+    def __init__(self, extract_fn, max_in_flight=8, requests_per_minute=None, tokens_per_minute=None,
+                 max_retries=5, base_delay=1.0, max_delay=30.0, token_estimator=None):
+        self.extract_fn = extract_fn
+        self.max_in_flight = max_in_flight
+        self.rate_limiter = None
+        if requests_per_minute or tokens_per_minute:
+            self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.token_estimator = token_estimator or (lambda item: estimate_tokens(str(item)) + MAX_TOKENS)
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'retries': 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, key) -> None:
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def _call_with_retry(self, item):
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(self.token_estimator(item))
+            try:
+                return self.extract_fn(item)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                # Full jitter keeps a burst of 429s from retrying in lockstep
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                self._count('retries')
+                time.sleep(delay)
+
+    def run(self, items):
+        # Yields (item, result, error) as calls complete, in completion order
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            in_flight = {}
+
+            def submit_next():
+                for item in items:
+                    in_flight[pool.submit(self._call_with_retry, item)] = item
+                    self._count('submitted')
+                    return True
+                return False
+
+            for _ in range(self.max_in_flight):
+                if not submit_next():
+                    break
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = in_flight.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        self._count('completed')
+                        yield item, future.result(), None
+                    else:
+                        self._count('failed')
+                        yield item, None, error
+                    submit_next()
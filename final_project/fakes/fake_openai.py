@@ -0,0 +1,144 @@
+import json
+import random
+import re
+import sys
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ticker_index import TickerIndex
+
+SENTIMENTS = ['positive', 'neutral', 'negative']
+
+
+class FakeOpenAIServer():
+    # Minimal OpenAI-compatible /v1/chat/completions endpoint. Answers are
+    # derived from the ticker index, with injectable latency and error rates so
+    # the extraction engine's retry and rate-limit paths can be exercised.
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, rate_limit_rate=0.0,
+                 latency_per_token=0.0, malformed_rate=0.0,
+                 ticker_index=None, host='127.0.0.1', port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        # Generation time grows with output length, like a real model
+        self.latency_per_token = latency_per_token
+        self.malformed_rate = malformed_rate
+        self.ticker_index = ticker_index or TickerIndex.from_json()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _extract(self, text):
+        tickers = sorted(self.ticker_index.tickers_in(text))
+        with self.lock:
+            return [{'ticker': ticker, 'sentiment': self.random.choice(SENTIMENTS)} for ticker in tickers]
+
+    def answer(self, messages):
+        # Only look at the post itself, not the instructions in front of it
+        text = messages[-1]['content'].split('\n\n', 1)[-1] if messages else ''
+        if not text.startswith('### POST '):
+            return json.dumps(self._extract(text))
+
+        # Batched prompt: answer every post block by id
+        answers = {}
+        for block in re.split(r'^### POST ', text, flags=re.MULTILINE)[1:]:
+            pid, _, body = block.partition('\n')
+            answers[pid.strip()] = self._extract(body)
+        with self.lock:
+            malformed = self.random.random() < self.malformed_rate
+        if malformed:
+            return "Sure! Here are the results: {" + json.dumps(answers)[1:-10]
+        return json.dumps(answers)
+
+    def _roll(self):
+        with self.lock:
+            self.stats['requests'] += 1
+            roll = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        return roll, delay
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                roll, delay = fake._roll()
+                time.sleep(delay)
+                if roll < fake.rate_limit_rate:
+                    with fake.lock:
+                        fake.stats['rate_limited'] += 1
+                    return self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}})
+                if roll < fake.rate_limit_rate + fake.error_rate:
+                    with fake.lock:
+                        fake.stats['errors'] += 1
+                    return self._send(503, {'error': {'message': 'Service unavailable', 'type': 'server_error'}})
+                if not self.path.endswith('/chat/completions'):
+                    return self._send(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+                messages = request.get('messages', [])
+                content = fake.answer(messages)
+                prompt_tokens = sum(len(m.get('content', '')) for m in messages) // 4 + 1
+                completion_tokens = len(content) // 4 + 1
+                time.sleep(completion_tokens * fake.latency_per_token)
+                with fake.lock:
+                    fake.stats['prompt_tokens'] += prompt_tokens
+                    fake.stats['completion_tokens'] += completion_tokens
+                self._send(200, {
+                    'id': 'chatcmpl-fake',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': request.get('model', 'fake'),
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': content}}],
+                    'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                              'total_tokens': prompt_tokens + completion_tokens},
+                })
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    with FakeOpenAIServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8089) as fake:
+        print(f"Fake OpenAI server listening on {fake.base_url}")
+        fake.thread.join()
@@ -0,0 +1,88 @@
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from listing_providers import LISTING_PAGE_SIZE, ListingProvider
+
+# Comments Reddit returns per comment-tree request (morechildren pages)
+COMMENT_PAGE_SIZE = 100
+
+WORDS = ("the market is wild today and i think we are going to see a big move before earnings "
+         "calls puts yolo diamond hands rotation into value fed rates inflation print").split()
+TICKERS = ['AAPL', 'TSLA', 'NVDA', 'GME', 'AMC', 'MSFT', 'AMZN', 'META', 'PLTR', 'SPY']
+
+
+class FakeListingProvider(ListingProvider):
+    # Generates deterministic hot listings offline. Every listing page sleeps
+    # for `latency` seconds to stand in for a Reddit round trip. Bumping `day`
+    # rotates `churn` of each listing out for new posts and edits `edit_rate`
+    # of the rest, to mimic how hot pages change between scrapes.
+    def __init__(self, latency=0.5, stickied_per_sub=2, seed=0, day=0, churn=0.2, edit_rate=0.05):
+        self.latency = latency
+        self.stickied_per_sub = stickied_per_sub
+        self.seed = seed
+        self.day = day
+        self.churn = churn
+        self.edit_rate = edit_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def make_post(self, sub_reddit, i, stickied=False):
+        # Seeded per post so the same post looks the same on every day
+        rng = random.Random(f"{self.seed}:{sub_reddit}:{i}")
+        words = rng.choices(WORDS, k=rng.randint(10, 80))
+        words.insert(rng.randrange(len(words)), '$' + rng.choice(TICKERS))
+        selftext = ' '.join(words)
+        edits = sum(1 for day in range(1, self.day + 1)
+                    if random.Random(f"{self.seed}:{sub_reddit}:{i}:{day}").random() < self.edit_rate)
+        if edits:
+            selftext += f" EDIT {edits}: still holding"
+        return SimpleNamespace(
+            id=f"{sub_reddit[:3]}{i:05d}",
+            url=f"https://www.reddit.com/r/{sub_reddit}/comments/{sub_reddit[:3]}{i:05d}/",
+            permalink=f"/r/{sub_reddit}/comments/{sub_reddit[:3]}{i:05d}/",
+            title=' '.join(words[:8]).capitalize(),
+            author=f"user{rng.randint(1, 5000)}",
+            created_utc=1721100000.0 + i * 60,
+            score=rng.randint(0, 5000) + self.day * 10,
+            selftext=selftext,
+            num_comments=rng.randint(0, 800) + self.day,
+            stickied=stickied,
+        )
+
+    def hot(self, sub_reddit, limit):
+        first = int(self.day * self.churn * limit)
+        posts = [self.make_post(sub_reddit, first + i, stickied=i < self.stickied_per_sub) for i in range(limit)]
+        pages = max(1, -(-limit // LISTING_PAGE_SIZE))
+        with self.lock:
+            self.requests += pages
+        time.sleep(self.latency * pages)
+        return posts
+
+    def comments(self, post):
+        # post.num_comments comments, generated one at a time from a per-post
+        # seed, so comment i is the same on every day and a thread that grew
+        # only appends new ones. Comment i is posted a second after comment
+        # i - 1 and replies to the post or to any earlier comment. Every
+        # COMMENT_PAGE_SIZE comments sleeps `latency`, like one morechildren
+        # request.
+        rng = random.Random(f"{self.seed}:{post.id}:comments")
+        choices, randint, rand, randrange = rng.choices, rng.randint, rng.random, rng.randrange
+        for i in range(post.num_comments):
+            if i % COMMENT_PAGE_SIZE == 0:
+                with self.lock:
+                    self.requests += 1
+                if self.latency:
+                    time.sleep(self.latency)
+            words = choices(WORDS, k=randint(3, 40))
+            if rand() < 0.1:
+                words.insert(randrange(len(words)), '$' + TICKERS[randrange(len(TICKERS))])
+            yield SimpleNamespace(
+                id=f"{post.id}c{i:x}",
+                parent_id=f"t1_{post.id}c{randrange(i):x}" if i and rand() < 0.7 else f"t3_{post.id}",
+                author=f"user{randint(1, 5000)}",
+                body=' '.join(words),
+                score=randint(-5, 500),
+                created_utc=post.created_utc + 1 + i,
+            )
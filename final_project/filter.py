@@ -1,60 +1,204 @@
-import sqlite3
 import json
-import re
-import pandas as pd
-from openai import OpenAI
 import os
-import utils.config as config
-import tqdm
+import threading
+from ticker_index import TickerIndex
+from extraction import BatchParseError, ExtractionEngine, RateLimiter, pack_batches, post_id, request_batch_extraction, request_extraction
+from llm_cache import LLMCache
+from db import connect
+from mentions import create_mention_table, save_mentions
+from comments import create_comment_tables
+from sentiment_backends import LexiconBackend, SentimentBackend
+from near_duplicates import NearDuplicateBackend, NearDuplicateIndex
+import archive
+import metrics
+from metrics import timed
 
-# Load your OpenAI API key from an environment variable or directly set it here
-client = OpenAI(api_key=config.OPENAI_API_KEY)
+# Load your OpenAI API key from an environment variable or directly set it here.
+# Set OPENAI_BASE_URL to point at a local OpenAI-compatible server for testing.
+# Without utils/config.py (offline benchmarks, fakes) the key comes from OPENAI_API_KEY.
+try:
+    import utils.config as config
+    OPENAI_API_KEY = config.OPENAI_API_KEY
+except ImportError:
+    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-# Load stock tickers from JSON
-with open('final_project/utils/company_tickers.json', 'r') as f:
-    stock_tickers = json.load(f)
+# Single-pass matcher over every stock ticker and company name, memory-mapped
+# from the compiled index (recompiled only when the JSON changes)
+ticker_index = TickerIndex.load('final_project/utils/company_tickers.json')
 
-tickers = {v['ticker']: v['title'] for k, v in stock_tickers.items()}
-ticker_patterns = {ticker: re.compile(r'\b' + re.escape(ticker) + r'\b', re.IGNORECASE) for ticker in tickers}
+# Responses are cached by normalized prompt, so daily re-scrapes of the same post are free
+LLM_CACHE_PATH = os.getenv('FILTER_CACHE_PATH', 'final_project/scraped_data/llm_cache.db')
+
+# The OpenAI client (about a second to import) and the cache database are
+# only opened once a post actually needs the API, so lexicon runs, the
+# prefilter and the benchmarks never pay for them
+_client = None
+_llm_cache = None
+_near_duplicates = None
+_lazy_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lazy_lock:
+            if _client is None:
+                from openai import OpenAI
+                # No SDK retries: the extraction engine owns backoff and retries
+                _client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    return _client
+
+def get_llm_cache():
+    global _llm_cache
+    if _llm_cache is None:
+        with _lazy_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMCache(LLM_CACHE_PATH)
+    return _llm_cache
+
+def close_llm_cache():
+    # Writes back the cache's buffered last-used times, if it was ever opened
+    global _llm_cache
+    if _llm_cache is not None:
+        _llm_cache.close()
+        _llm_cache = None
+
+# Crossposts and reposts with a reworded title share one extraction per
+# near-duplicate cluster (MinHash/LSH over title + body, see
+# near_duplicates.py). FILTER_DEDUP_THRESHOLD is the estimated Jaccard
+# similarity a post needs to join a cluster; 0 turns it off.
+DEDUP_THRESHOLD = float(os.getenv('FILTER_DEDUP_THRESHOLD', 0.8))
+DEDUP_PATH = os.getenv('FILTER_DEDUP_PATH', 'final_project/scraped_data/near_duplicates.db')
+DEDUP_MAX_AGE_DAYS = int(os.getenv('FILTER_DEDUP_MAX_AGE_DAYS', 30))
+
+def get_near_duplicates():
+    global _near_duplicates
+    if _near_duplicates is None:
+        with _lazy_lock:
+            if _near_duplicates is None:
+                _near_duplicates = NearDuplicateIndex(DEDUP_PATH, threshold=DEDUP_THRESHOLD,
+                                                      max_age_days=DEDUP_MAX_AGE_DAYS)
+    return _near_duplicates
+
+def close_near_duplicates():
+    global _near_duplicates
+    if _near_duplicates is not None:
+        _near_duplicates.close()
+        _near_duplicates = None
+
+# Concurrency and rate-limit budgets for the extraction engine
+MAX_IN_FLIGHT = int(os.getenv('FILTER_MAX_IN_FLIGHT', 8))
+REQUESTS_PER_MINUTE = int(os.getenv('FILTER_REQUESTS_PER_MINUTE', 500))
+TOKENS_PER_MINUTE = int(os.getenv('FILTER_TOKENS_PER_MINUTE', 200_000))
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+# Posts packed into one prompt; 1 keeps the one-post-per-request behaviour
+BATCH_SIZE = int(os.getenv('FILTER_BATCH_SIZE', 1))
+BATCH_TOKEN_BUDGET = int(os.getenv('FILTER_BATCH_TOKEN_BUDGET', 6000))
+
+# 'openai' calls the API, 'lexicon' scores posts locally without any network
+SENTIMENT_BACKEND = os.getenv('FILTER_BACKEND', 'openai')
 
 # Function to call the OpenAI API to extract stock tickers and sentiment
+@timed('filter_extract_tickers_and_sentiment_seconds')
 def extract_tickers_and_sentiment(text):
-    prompt = f"Here is a block of text scraped from Reddit. Return a list of python dictionaries format of any stock or company referenced, as well as a rating of how positive the post is about that stock or company. Only output the python list, nothing else.\n\n{text}"
-
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a sentiment analysis assistant, skilled in extracting stock tickers and sentiment from text."},
-            {"role": "user", "content": prompt}],
-        max_tokens=150,
-        temperature=0.5,
-    )
-    content = completion.choices[0].message.content
-    
-    # use regex, to only select the [ ] and the content inside
-    match = re.search(r'\[.*?\]', content, re.DOTALL)
-    if match:
-        return match.group()
-    else:
-        print("No match found")
-        return '[]'
+    return request_extraction(get_client(), text, cache=get_llm_cache(), rate_limiter=rate_limiter)
+
+@timed('filter_prefilter_seconds')
+def needs_extraction(row) -> bool:
+    return ticker_index.contains_any(f"{row['title']} {row['body']}")
 
+@timed('filter_process_post_seconds')
 def process_post(row):
     combined_text = f"{row['title']} {row['body']}"
-    
+
     # Preprocess to check for stock tickers before making an API call
-    if not any(pattern.search(combined_text) for pattern in ticker_patterns.values()):
+    if not needs_extraction(row):
         return (row['url'], row['scraped_date'], json.dumps([]))  # Return empty list if no tickers are found
-    
+
     # Call the OpenAI API to extract stock tickers and sentiment
     extracted_data = extract_tickers_and_sentiment(combined_text)
-    
+
     return (row['url'], row['scraped_date'], extracted_data)
 
-def main():
-    # Connect to the SQLite database
-    conn = sqlite3.connect('final_project/scraped_data/reddit_posts.db')
-    
+def process_batch(rows):
+    if len(rows) == 1:
+        return [process_post(rows[0])]
+
+    posts = {post_id(row['url'], row['scraped_date']): row for row in rows}
+    try:
+        extracted = request_batch_extraction(
+            get_client(), {pid: f"{row['title']} {row['body']}" for pid, row in posts.items()},
+            cache=get_llm_cache(), rate_limiter=rate_limiter)
+    except BatchParseError as e:
+        print(f"Falling back to per-post calls: {e}")
+        extracted = {}
+
+    results = []
+    for pid, row in posts.items():
+        if pid in extracted:
+            results.append((row['url'], row['scraped_date'], extracted[pid]))
+        else:
+            # The model skipped or mangled this post, so ask about it alone
+            results.append(process_post(row))
+    return results
+
+class OpenAIBackend(SentimentBackend):
+    def __init__(self, batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT, token_budget=BATCH_TOKEN_BUDGET):
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.token_budget = token_budget
+
+    def analyze(self, rows):
+        return process_batch(rows)
+
+def make_backend(name=SENTIMENT_BACKEND, dedup=DEDUP_THRESHOLD > 0):
+    if name == 'openai':
+        if dedup:
+            return NearDuplicateBackend(OpenAIBackend(), get_near_duplicates(), ticker_index)
+        return OpenAIBackend()
+    if name == 'lexicon':
+        return LexiconBackend(ticker_index)
+    raise ValueError(f"Unknown sentiment backend: {name}")
+
+@timed('filter_save_mention_seconds')
+def save_mention(conn, result, commit=True) -> None:
+    new_post = conn.execute('SELECT 1 FROM stock_mentions WHERE url = ? AND scraped_date = ?', result[:2]).fetchone() is None
+    conn.execute('INSERT OR REPLACE INTO stock_mentions (url, scraped_date, extracted_data) VALUES (?, ?, ?)', result)
+    # Validate once here so readers can aggregate the typed mention table
+    # directly, and keep the daily rollups current in the same transaction
+    dropped = save_mentions(conn, *result, new_post=new_post)
+    if dropped:
+        print(f"Dropped {dropped} unusable entries for {result[0]}")
+    if commit:
+        conn.commit()
+
+# Posts still missing a stock_mentions row. The LEFT JOIN is answered from
+# the (url, scraped_date) primary keys and pages are keyed on the posts rowid,
+# so each chunk is an index range scan instead of a full table load.
+UNANALYZED_POSTS_QUERY = """
+    SELECT p.rowid, p.url, p.title, p.body, p.scraped_date
+    FROM posts p
+    LEFT JOIN stock_mentions m ON m.url = p.url AND m.scraped_date = p.scraped_date
+    WHERE p.rowid > ? AND m.url IS NULL
+    ORDER BY p.rowid
+    LIMIT ?
+"""
+
+# Comments that passed the ticker prefilter when they were stored and have
+# no stock_mentions row yet, keyed by their permalink. Comments without a
+# ticker never get a row at all, unlike posts: busy threads run to millions.
+UNANALYZED_COMMENTS_QUERY = """
+    SELECT c.rowid, c.url, '' AS title, c.body, c.scraped_date
+    FROM comments c
+    LEFT JOIN stock_mentions m ON m.url = c.url AND m.scraped_date = c.scraped_date
+    WHERE c.rowid > ? AND c.has_ticker AND m.url IS NULL
+    ORDER BY c.rowid
+    LIMIT ?
+"""
+
+CHUNK_SIZE = int(os.getenv('FILTER_CHUNK_SIZE', 500))
+
+def create_tables(conn) -> None:
     # Create the stock_mentions table if it doesn't exist
     conn.execute('''
         CREATE TABLE IF NOT EXISTS stock_mentions (
@@ -64,39 +208,134 @@ def main():
             PRIMARY KEY (url, scraped_date)
         )
     ''')
+    create_mention_table(conn)
+    create_comment_tables(conn)
+    # Every posts rowid at or below the watermark has been analyzed
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS filter_progress (
+            name TEXT PRIMARY KEY,
+            last_rowid INTEGER
+        )
+    ''')
+    conn.commit()
+    archive.track_changes(conn)
+
+def load_watermark(conn, name='stock_mentions') -> int:
+    row = conn.execute('SELECT last_rowid FROM filter_progress WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
+def save_watermark(conn, rowid, name='stock_mentions') -> None:
+    conn.execute('INSERT OR REPLACE INTO filter_progress (name, last_rowid) VALUES (?, ?)', (name, rowid))
+    conn.commit()
+
+def iter_unanalyzed_posts(conn, after_rowid=0, chunk_size=CHUNK_SIZE, query=UNANALYZED_POSTS_QUERY):
+    # Keyset pagination: memory is bounded by one chunk however big posts gets
+    columns = ['rowid', 'url', 'title', 'body', 'scraped_date']
+    while True:
+        chunk = conn.execute(query, (after_rowid, chunk_size)).fetchall()
+        if not chunk:
+            return
+        for values in chunk:
+            yield dict(zip(columns, values))
+        after_rowid = chunk[-1][0]
+
+def iter_unanalyzed_comments(conn, after_rowid=0, chunk_size=CHUNK_SIZE):
+    # Same row shape as posts, with an empty title, so comments share the
+    # prefilter, batching and extraction path
+    return iter_unanalyzed_posts(conn, after_rowid, chunk_size, UNANALYZED_COMMENTS_QUERY)
+
+# (watermark name, row source, table) of everything that gets analyzed
+BACKLOG_SOURCES = (('stock_mentions', iter_unanalyzed_posts, 'posts'),
+                   ('comments', iter_unanalyzed_comments, 'comments'))
+
+def advance_watermark(conn, name, source, table) -> int:
+    # For runs that analyze rows out of order (pipeline.py): moves the
+    # watermark up to just before the first row still unanalyzed, or to the
+    # last row when every one has been
+    watermark = load_watermark(conn, name)
+    first = next(source(conn, watermark, 1), None)
+    if first is not None:
+        rowid = first['rowid'] - 1
+    else:
+        rowid = conn.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0] or 0
+    if rowid > watermark:
+        save_watermark(conn, rowid, name)
+    return max(rowid, watermark)
+
+def analyze_backlog(conn, backend, progress, source=iter_unanalyzed_posts, name='stock_mentions'):
+    # Runs one source of unanalyzed rows (posts, or comments naming a ticker)
+    # through the extraction engine and moves its watermark. Returns the
+    # engine, or None when there was nothing new.
+    watermark = load_watermark(conn, name)
+    last_rowid = watermark
+    first_failed_rowid = None
+
+    def llm_rows():
+        # Posts without any ticker never reach the API, so record them right away
+        nonlocal last_rowid
+        for row in source(conn, watermark):
+            last_rowid = row['rowid']
+            if needs_extraction(row):
+                yield row
+            else:
+                save_mention(conn, (row['url'], row['scraped_date'], json.dumps([])), commit=False)
+                progress.update(1)
+
+    # Process the rest concurrently, saving each result as soon as it completes
+    engine = ExtractionEngine(backend.analyze, max_in_flight=backend.max_in_flight)
+    batches = pack_batches(llm_rows(), lambda row: f"{row['title']} {row['body']}",
+                           batch_size=backend.batch_size, token_budget=backend.token_budget)
+    for rows, results, error in engine.run(batches):
+        progress.update(len(rows))
+        if error is not None:
+            # Leave the posts unanalyzed so the next run picks them up again
+            for row in rows:
+                print(f"Error extracting {row['url']}: {error}")
+            failed = min(row['rowid'] for row in rows)
+            first_failed_rowid = failed if first_failed_rowid is None else min(first_failed_rowid, failed)
+            continue
+        for result in results:
+            save_mention(conn, result)
     conn.commit()
-    
-    # Load the posts table into a DataFrame
-    posts_df = pd.read_sql_query('SELECT url, title, body, comments, image, scraped_date FROM posts', conn)
-    
-    # Load the stock_mentions table into a DataFrame
-    analyzed_df = pd.read_sql_query('SELECT url, scraped_date FROM stock_mentions', conn)
-    analyzed_urls_dates = set((row['url'], row['scraped_date']) for _, row in analyzed_df.iterrows())
-    
-    # Filter out already analyzed posts
-    unanalyzed_posts_df = posts_df[~posts_df[['url', 'scraped_date']].apply(tuple, axis=1).isin(analyzed_urls_dates)]
-    
-    # Limit to 100 posts per run
-    unanalyzed_posts_df = unanalyzed_posts_df.head(100)
-    
-    if unanalyzed_posts_df.empty:
+
+    # Failed posts hold the watermark back so they are retried next run
+    save_watermark(conn, last_rowid if first_failed_rowid is None else min(last_rowid, first_failed_rowid - 1), name)
+    return None if last_rowid == watermark else engine
+
+def main():
+    # Connect to the SQLite database
+    conn = connect('final_project/scraped_data/reddit_posts.db')
+    create_tables(conn)
+
+    import tqdm
+    progress = tqdm.tqdm()
+    backend = make_backend()
+    engines = {name: analyze_backlog(conn, backend, progress, source, name) for name, source, _ in BACKLOG_SOURCES}
+    progress.close()
+
+    if not any(engines.values()):
         print("No new posts to analyze.")
-        return
-    
-    # Process each post sequentially
-    results = []
-    for row in tqdm.tqdm(unanalyzed_posts_df.to_dict('records')):
-        result = process_post(row)
-        results.append(result)
-    
-    # Create DataFrame from results
-    mentions_df = pd.DataFrame(results, columns=['url', 'scraped_date', 'extracted_data'])
-    
-    # Save the mentions DataFrame to the stock_mentions table in the SQLite database
-    mentions_df.to_sql('stock_mentions', conn, if_exists='append', index=False)
-    
+    else:
+        for name, engine in engines.items():
+            if engine is not None:
+                print(f"Extraction stats ({name}): {engine.stats}")
+        if _llm_cache is not None:
+            print(_llm_cache.summary())
+        if _near_duplicates is not None:
+            print(_near_duplicates.summary())
+    if _llm_cache is not None:
+        _llm_cache.evict()
+    close_llm_cache()
+    if _near_duplicates is not None:
+        _near_duplicates.evict()
+    close_near_duplicates()
+    # Parquet copy for long-range analysis, when ARCHIVE_DIR is set
+    archive.update(conn)
+
     # Close the connection
     conn.close()
 
 if __name__ == '__main__':
-    main()
+    with metrics.profiled():
+        main()
+    metrics.export(run='filter')
@@ -0,0 +1,80 @@
+import math
+import threading
+
+from extraction import RateLimiter
+
+# Reddit allows 100 OAuth requests per minute per client id, shared by every
+# thread that uses the same credentials.
+REDDIT_REQUESTS_PER_MINUTE = 100
+LISTING_PAGE_SIZE = 100
+
+
+class ListingProvider():
+    # Source of subreddit listings. hot() returns post objects exposing the
+    # PRAW Submission attributes the crawler reads: url, title, author,
+    # created_utc, score, selftext, num_comments and stickied.
+    def hot(self, sub_reddit, limit):
+        raise NotImplementedError
+
+    # Every comment of a post from hot(), as an iterator, so a thread is never
+    # held in memory whole. Comments expose id, parent_id, author, body,
+    # score and created_utc; parents need not come before their replies.
+    def comments(self, post):
+        raise NotImplementedError
+
+
+class PrawListingProvider(ListingProvider):
+    # Thread-safe front for PRAW. PRAW clients must not be shared between
+    # threads, so each worker thread lazily gets its own client and keeps it
+    # for every subreddit it scrapes; all of them draw from one global rate
+    # limiter so the pool as a whole stays under Reddit's limit.
+    def __init__(self, requests_per_minute=REDDIT_REQUESTS_PER_MINUTE):
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.local = threading.local()
+
+    def _client(self):
+        reddit = getattr(self.local, 'reddit', None)
+        if reddit is None:
+            import praw
+            import utils.config as config
+            reddit = praw.Reddit(
+                client_id=config.REDDIT_CLIENT_ID,
+                client_secret=config.REDDIT_CLIENT_SECRET,
+                user_agent=config.REDDIT_USER_AGENT,
+                ratelimit_seconds=60,
+            )
+            self.local.reddit = reddit
+        return reddit
+
+    def hot(self, sub_reddit, limit):
+        # Listings are fetched in pages of 100; charge the limiter per page
+        for _ in range(max(1, math.ceil(limit / LISTING_PAGE_SIZE))):
+            self.rate_limiter.acquire()
+        return list(self._client().subreddit(sub_reddit).hot(limit=limit))
+
+    def comments(self, post):
+        # Depth-first walk with one iterator per level, instead of
+        # replace_more(limit=None), which loads the whole forest before
+        # returning anything. A MoreComments stub is expanded when the walk
+        # reaches it (one request for up to 100 comments) and its cached
+        # result dropped once walked, since the stub itself stays in the
+        # first page's tree and would otherwise keep every page alive.
+        from praw.models import MoreComments
+        self.rate_limiter.acquire()
+        submission = self._client().submission(id=post.id)
+        stack = [(iter(submission.comments), None)]
+        while stack:
+            replies, more = stack[-1]
+            item = next(replies, None)
+            if item is None:
+                stack.pop()
+                if more is not None:
+                    more._comments = None
+                continue
+            if isinstance(item, MoreComments):
+                self.rate_limiter.acquire()
+                stack.append((iter(item.comments()), item))
+                continue
+            yield item
+            if item.replies:
+                stack.append((iter(item.replies), None))
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import re
+import threading
+import time
+
+from db import connect
+
+CACHE_PATH = 'final_project/scraped_data/llm_cache.db'
+
+# USD per 1M tokens, used to report what the cache saved
+PRICES = {
+    'gpt-4o-mini': {'prompt': 0.15, 'completion': 0.60},
+    'gpt-4o': {'prompt': 2.50, 'completion': 10.00},
+}
+
+
+def normalize_text(text):
+    # Re-scrapes of the same post differ only in whitespace noise
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def cache_key(model, messages, **params):
+    payload = {
+        'model': model,
+        'messages': [{'role': m['role'], 'content': normalize_text(m['content'])} for m in messages],
+        'params': params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    price = PRICES.get(model)
+    if price is None:
+        return 0.0
+    return (prompt_tokens * price['prompt'] + completion_tokens * price['completion']) / 1_000_000
+
+
+class LLMCache():
+    # Persistent content-addressed cache of chat completion responses, keyed by
+    # a hash of the normalized prompt, model and sampling parameters.
+    # Hits only buffer their last_used_at; the buffer is written in one
+    # transaction every touch_batch hits or touch_interval seconds, and on
+    # put, evict and close, so a hit costs a SELECT instead of a commit.
+    def __init__(self, path=CACHE_PATH, max_entries=200_000, max_age_days=90, touch_batch=1000, touch_interval=30.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self.touches = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        # Same WAL / synchronous=NORMAL settings as the posts database
+        self.connection = connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                created_at REAL,
+                last_used_at REAL
+            )
+        """)
+        self.connection.execute('CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used_at)')
+        self.connection.commit()
+        self.stats = {'hits': 0, 'misses': 0, 'saved_prompt_tokens': 0, 'saved_completion_tokens': 0, 'saved_usd': 0.0}
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT model, response, prompt_tokens, completion_tokens, created_at FROM llm_cache WHERE key = ?',
+                (key,)).fetchone()
+            now = time.time()
+            if row is None or (self.max_age_days and now - row[4] > self.max_age_days * 86400):
+                self.stats['misses'] += 1
+                return None
+            model, response, prompt_tokens, completion_tokens, _ = row
+            self.touches[key] = now
+            if len(self.touches) >= self.touch_batch or time.monotonic() - self.last_flush >= self.touch_interval:
+                self._flush_touches()
+            self.stats['hits'] += 1
+            self.stats['saved_prompt_tokens'] += prompt_tokens
+            self.stats['saved_completion_tokens'] += completion_tokens
+            self.stats['saved_usd'] += estimate_cost(model, prompt_tokens, completion_tokens)
+            return response
+
+    def _flush_touches(self) -> None:
+        # Caller holds the lock and commits
+        if self.touches:
+            self.connection.executemany('UPDATE llm_cache SET last_used_at = ? WHERE key = ?',
+                                        [(used, key) for key, used in self.touches.items()])
+            self.touches = {}
+        self.connection.commit()
+        self.last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush_touches()
+
+    def put(self, key, model, response, prompt_tokens=0, completion_tokens=0) -> None:
+        now = time.time()
+        with self.lock:
+            self.touches.pop(key, None)
+            self.connection.execute("""
+                INSERT OR REPLACE INTO llm_cache (key, model, response, prompt_tokens, completion_tokens, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (key, model, response, prompt_tokens, completion_tokens, now, now))
+            self._flush_touches()
+
+    def evict(self):
+        # Drop expired entries, then the least recently used beyond max_entries
+        with self.lock:
+            # Pending hits first, so recently used entries aren't the ones dropped
+            self._flush_touches()
+            removed = 0
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self.connection.execute('DELETE FROM llm_cache WHERE created_at < ?', (cutoff,)).rowcount
+            if self.max_entries:
+                removed += self.connection.execute("""
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,)).rowcount
+            self.connection.commit()
+            return removed
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+
+    def summary(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+        return (f"LLM cache: {self.stats['hits']} hits, {self.stats['misses']} misses ({hit_rate:.0%} hit rate), "
+                f"saved {self.stats['hits']} calls / ~${self.stats['saved_usd']:.4f}")
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,152 @@
+import ast
+import json
+import sys
+
+import archive
+from comments import comment_subreddit
+from rollups import apply_delta, create_rollup_tables, rebuild
+
+SENTIMENT_SCORES = {'positive': 1.0, 'neutral': 0.0, 'negative': -1.0}
+
+# Labels the model uses instead of the three we ask for
+SENTIMENT_ALIASES = {
+    'bullish': 'positive', 'very positive': 'positive', 'somewhat positive': 'positive', 'good': 'positive',
+    'bearish': 'negative', 'very negative': 'negative', 'somewhat negative': 'negative', 'bad': 'negative',
+    'mixed': 'neutral', 'none': 'neutral', 'n/a': 'neutral', 'unknown': 'neutral',
+}
+
+CREATE_MENTION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS mention (
+        url TEXT NOT NULL,
+        scraped_date TEXT NOT NULL,
+        sub_reddit TEXT,
+        ticker TEXT NOT NULL,
+        sentiment TEXT NOT NULL CHECK (sentiment IN ('positive', 'neutral', 'negative')),
+        score REAL NOT NULL
+    )
+'''
+
+MENTION_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS mention_post ON mention (url, scraped_date)',
+    'CREATE INDEX IF NOT EXISTS mention_date_ticker ON mention (scraped_date, ticker)',
+    'CREATE INDEX IF NOT EXISTS mention_date_subreddit ON mention (scraped_date, sub_reddit)',
+]
+
+INSERT_MENTION = '''
+    INSERT INTO mention (url, scraped_date, sub_reddit, ticker, sentiment, score)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+
+def create_mention_table(conn) -> None:
+    conn.execute(CREATE_MENTION_TABLE)
+    for statement in MENTION_INDEXES:
+        conn.execute(statement)
+    conn.commit()
+    create_rollup_tables(conn)
+
+
+def _load(extracted_data):
+    try:
+        return json.loads(extracted_data)
+    except json.JSONDecodeError:
+        pass
+    # We ask the model for "python dictionaries", so single-quoted literals show up
+    try:
+        return ast.literal_eval(extracted_data)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def normalize_sentiment(value):
+    # Returns (label, score) or None for anything we can't interpret
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        score = max(-1.0, min(1.0, float(value)))
+        label = 'positive' if score > 0 else 'negative' if score < 0 else 'neutral'
+        return label, score
+    if not isinstance(value, str):
+        return None
+    label = value.strip().lower()
+    label = SENTIMENT_ALIASES.get(label, label)
+    if label not in SENTIMENT_SCORES:
+        return None
+    return label, SENTIMENT_SCORES[label]
+
+
+def normalize_extraction(extracted_data):
+    # Validates an LLM extraction once, at write time. Returns a list of
+    # (ticker, sentiment, score) and the number of entries that were dropped.
+    if not isinstance(extracted_data, str) or not extracted_data.strip():
+        return [], 0
+    contents = _load(extracted_data)
+    if not isinstance(contents, list):
+        return [], 1
+    mentions = []
+    dropped = 0
+    for content in contents:
+        if not isinstance(content, dict):
+            dropped += 1
+            continue
+        ticker = str(content.get('ticker') or '').strip().lstrip('$').upper()
+        sentiment = normalize_sentiment(content.get('sentiment', content.get('rating')))
+        if not ticker or sentiment is None:
+            dropped += 1
+            continue
+        mentions.append((ticker, sentiment[0], sentiment[1]))
+    return mentions, dropped
+
+
+def save_mentions(conn, url, scraped_date, extracted_data, new_post=False, update_rollups=True):
+    # Replaces the mention rows of one post and moves the daily rollups by the
+    # difference; the caller owns the transaction. new_post counts the post
+    # itself towards the day's analyzed-post totals.
+    mentions, dropped = normalize_extraction(extracted_data)
+    key = (url, scraped_date)
+    row = conn.execute('SELECT sub_reddit FROM posts WHERE url = ? AND scraped_date = ?', key).fetchone()
+    # Only rows of posts count as posts, the way rebuild() counts them
+    new_post = new_post and row is not None
+    if row is None:
+        # Mentions from comments are keyed by the comment permalink
+        row = comment_subreddit(conn, *key)
+    sub_reddit = row[0] if row else None
+    removed = conn.execute('SELECT ticker, sentiment FROM mention WHERE url = ? AND scraped_date = ?', key).fetchall()
+    conn.execute('DELETE FROM mention WHERE url = ? AND scraped_date = ?', key)
+    conn.executemany(INSERT_MENTION, [(url, scraped_date, sub_reddit, ticker, sentiment, score)
+                                      for ticker, sentiment, score in mentions])
+    if update_rollups:
+        apply_delta(conn, scraped_date, sub_reddit, removed,
+                    [(ticker, sentiment) for ticker, sentiment, _ in mentions], new_post)
+    return dropped
+
+
+def migrate(conn, chunk_size=5000):
+    # One-shot backfill of mention, and the rollups, from every existing stock_mentions row
+    create_mention_table(conn)
+    archive.track_changes(conn)
+    migrated = 0
+    dropped = 0
+    last_rowid = 0
+    while True:
+        chunk = conn.execute('''
+            SELECT rowid, url, scraped_date, extracted_data FROM stock_mentions
+            WHERE rowid > ? ORDER BY rowid LIMIT ?
+        ''', (last_rowid, chunk_size)).fetchall()
+        if not chunk:
+            break
+        with conn:
+            for rowid, url, scraped_date, extracted_data in chunk:
+                dropped += save_mentions(conn, url, scraped_date, extracted_data, update_rollups=False)
+        migrated += len(chunk)
+        last_rowid = chunk[-1][0]
+    rebuild(conn)
+    return migrated, dropped
+
+
+if __name__ == '__main__':
+    from db import connect
+    conn = connect(sys.argv[1] if len(sys.argv) > 1 else 'final_project/scraped_data/reddit_posts.db')
+    migrated, dropped = migrate(conn)
+    print(f"Migrated {migrated} stock_mentions rows into mention ({dropped} unusable entries dropped)")
+    conn.close()
@@ -0,0 +1,206 @@
+import cProfile
+import functools
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Set METRICS_DIR to have each entry point write a run summary there on exit:
+# metrics-<run>-<timestamp>.json (one per run, to diff between runs) and
+# <run>.prom (Prometheus text format, overwritten, for a textfile collector).
+METRICS_DIR = os.getenv('METRICS_DIR')
+# Set METRICS_PROFILE to a path to also write a cProfile dump of the main
+# thread. For the worker threads use a sampling profiler from outside, e.g.
+# py-spy record -o profile.svg -- python final_project/filter.py
+METRICS_PROFILE = os.getenv('METRICS_PROFILE')
+PREFIX = 'dwd_'
+
+# Seconds; spans a cached ticker lookup up to a slow OpenAI call
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+
+class Histogram():
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 6),
+        }
+
+
+class Registry():
+    # Process-wide counters and histograms. Everything is keyed by metric
+    # name; one lock guards all updates, which costs well under a microsecond
+    # next to the calls being measured.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def inc(self, name, value=1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value) -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        # Observes the block's duration in <name>; failures also count in <name>_errors
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(f'{name}_errors')
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def summary(self):
+        with self.lock:
+            return {
+                'started': self.started,
+                'elapsed_s': round(time.time() - self.started, 3),
+                'counters': dict(sorted(self.counters.items())),
+                'timers': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            }
+
+    def prometheus(self):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'# TYPE {PREFIX}{name}_total counter')
+                lines.append(f'{PREFIX}{name}_total {value}')
+            for name, histogram in sorted(self.histograms.items()):
+                metric = PREFIX + name
+                lines.append(f'# TYPE {metric} histogram')
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(bound)
+                    lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum {histogram.sum}')
+                lines.append(f'{metric}_count {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, directory=None, run='run'):
+        # Writes the JSON summary and the Prometheus file; returns the JSON path
+        directory = directory or METRICS_DIR
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        summary = dict(self.summary(), run=run)
+        path = os.path.join(directory, f"metrics-{run}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        prom_path = os.path.join(directory, f'{run}.prom')
+        with open(prom_path + '.tmp', 'w') as f:
+            f.write(self.prometheus())
+        os.replace(prom_path + '.tmp', prom_path)
+        return path
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+timer = registry.timer
+timed = registry.timed
+export = registry.export
+
+
+@contextmanager
+def profiled(path=None):
+    # cProfile the enclosed block when a path is given (or METRICS_PROFILE is
+    # set); the dump opens with pstats, snakeviz or gprof2dot
+    path = path or METRICS_PROFILE
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        profiler.dump_stats(path)
+        print(f"Profile written to {path}")
+
+
+def compare(baseline_path, current_path, threshold=0.2):
+    # Timers whose mean grew by more than threshold between two JSON summaries
+    with open(baseline_path) as f:
+        baseline = json.load(f)['timers']
+    with open(current_path) as f:
+        current = json.load(f)['timers']
+    regressions = {}
+    for name, stats in current.items():
+        before = baseline.get(name)
+        if before and before['mean'] > 0 and stats['mean'] > before['mean'] * (1 + threshold):
+            regressions[name] = (before['mean'], stats['mean'])
+    return regressions
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) != 3:
+        sys.exit('usage: python final_project/metrics.py BASELINE.json CURRENT.json')
+    regressions = compare(sys.argv[1], sys.argv[2])
+    for name, (before, after) in regressions.items():
+        print(f"{name}: {before * 1000:.3f}ms -> {after * 1000:.3f}ms ({after / before - 1:+.0%})")
+    if not regressions:
+        print("No timer regressed by more than 20%")
+    sys.exit(1 if regressions else 0)
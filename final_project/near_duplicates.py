@@ -0,0 +1,270 @@
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+
+from db import connect
+from sentiment_backends import SentimentBackend
+
+DEDUP_PATH = 'final_project/scraped_data/near_duplicates.db'
+
+WORD_PATTERN = re.compile(r"[a-z0-9$][a-z0-9$']*")
+
+
+def shingle_hashes(text, size=3):
+    # Distinct word n-grams of the lowercased text, as 64-bit hashes. Case,
+    # punctuation and spacing never change a shingle, so "[Crosspost]" tags
+    # or a fixed typo only touch the few n-grams around them.
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        grams = [' '.join(words)] if words else []
+    else:
+        grams = [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return {int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'little') for gram in grams}
+
+
+def lsh_parameters(threshold, num_perm):
+    # (bands, rows) whose S-curve (1/bands)**(1/rows) crosses closest to the
+    # threshold: pairs above it almost always share a bucket, pairs well
+    # below it rarely do
+    return min(((num_perm // rows, rows) for rows in range(1, num_perm + 1)),
+               key=lambda params: abs((1 / params[0]) ** (1 / params[1]) - threshold))
+
+
+class NearDuplicateIndex():
+    # MinHash signatures of post texts, bucketed by LSH bands, grouping
+    # near-copies (crossposts, re-titled reposts) into clusters that share one
+    # extraction. The first post of a cluster leads it; a later post joins
+    # when a band bucket makes it a candidate, its estimated Jaccard
+    # similarity reaches `threshold`, and it names the same tickers, so that
+    # "buy AAPL" boilerplate never borrows a "buy MSFT" answer. Clusters and
+    # their results are kept in SQLite for max_age_days, so a repost finds
+    # the original from an earlier day.
+    def __init__(self, path=DEDUP_PATH, threshold=0.8, num_perm=128, shingle_size=3, min_shingles=5,
+                 max_age_days=30, seed=1):
+        # NumPy is only imported once deduplication is actually used
+        import numpy as np
+        self.np = np
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.min_shingles = min_shingles
+        self.max_age_days = max_age_days
+        self.bands, self.rows = lsh_parameters(threshold, num_perm)
+        # One multiply-shift hash per permutation: (a * x + b) mod 2**64 with
+        # a odd, keeping the top 32 bits, which are the well-mixed ones
+        rng = np.random.default_rng(seed)
+        self.a = (rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) << np.uint64(1) | np.uint64(1))[:, None]
+        self.b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)[:, None] << np.uint64(1)
+        self.lock = threading.Lock()
+        self.buckets = [{} for _ in range(self.bands)]
+        self.clusters = {}  # id -> Cluster; ids are per process, rowids come on resolve
+        self._ids = itertools.count()
+        self.stats = {'posts': 0, 'leaders': 0, 'reused': 0, 'waited': 0, 'unsigned': 0, 'loaded': 0}
+        # WAL and synchronous=NORMAL like every other database, so the
+        # per-reuse commits below are cheap
+        self.connection = connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS near_duplicate_clusters (
+                id INTEGER PRIMARY KEY,
+                signature BLOB,
+                tickers TEXT,
+                extracted_data TEXT,
+                members INTEGER,
+                created_at REAL
+            )
+        """)
+        self.connection.commit()
+        self._load()
+
+    def _load(self) -> None:
+        cutoff = time.time() - self.max_age_days * 86400 if self.max_age_days else 0
+        rows = self.connection.execute("""
+            SELECT id, signature, tickers, extracted_data FROM near_duplicate_clusters
+            WHERE extracted_data IS NOT NULL AND created_at >= ?
+        """, (cutoff,)).fetchall()
+        for rowid, blob, tickers, extracted_data in rows:
+            signature = self.np.frombuffer(blob, dtype='<u4')
+            if len(signature) != self.num_perm:
+                continue  # written with a different num_perm
+            self._insert(Cluster(next(self._ids), signature, tickers, extracted_data, rowid))
+        self.stats['loaded'] = len(rows)
+
+    def signature(self, text):
+        # num_perm minimum hashes of the shingle set, or None when the text is
+        # too short for the estimate to mean anything
+        np = self.np
+        hashes = shingle_hashes(text, self.shingle_size)
+        if len(hashes) < self.min_shingles:
+            return None
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))[None, :]
+        return ((self.a * values + self.b) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def _insert(self, cluster) -> None:
+        self.clusters[cluster.id] = cluster
+        for bucket, key in zip(self.buckets, self._band_keys(cluster.signature)):
+            bucket.setdefault(key, []).append(cluster.id)
+
+    def similarity(self, first, second) -> float:
+        # Share of agreeing minimum hashes estimates the Jaccard similarity
+        return float((first == second).mean())
+
+    def _find(self, signature, tickers):
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for cluster_id in candidates:
+            cluster = self.clusters[cluster_id]
+            if cluster.tickers != tickers:
+                continue
+            similarity = self.similarity(signature, cluster.signature)
+            if similarity >= best_similarity:
+                best, best_similarity = cluster, similarity
+        return best
+
+    def claim(self, text, tickers):
+        # (cluster, leads) for a post: an existing cluster it belongs to, or a
+        # new one it now leads and must supply the extraction for. (None,
+        # False) when the text is too short to compare.
+        signature = self.signature(text)
+        tickers = json.dumps(sorted(tickers))
+        with self.lock:
+            self.stats['posts'] += 1
+            if signature is None:
+                self.stats['unsigned'] += 1
+                return None, False
+            cluster = self._find(signature, tickers)
+            if cluster is not None:
+                return cluster, False
+            # Leaders are only written once their extraction lands
+            cluster = Cluster(next(self._ids), signature, tickers)
+            self._insert(cluster)
+            self.stats['leaders'] += 1
+            return cluster, True
+
+    def resolve(self, cluster, extracted_data) -> None:
+        # The leader's extraction, or None when it failed: the cluster is then
+        # dropped so the next post like it leads a fresh one
+        with self.lock:
+            if extracted_data is None:
+                self.clusters.pop(cluster.id, None)
+                for bucket, key in zip(self.buckets, self._band_keys(cluster.signature)):
+                    members = bucket.get(key)
+                    if members and cluster.id in members:
+                        members.remove(cluster.id)
+            else:
+                cluster.extracted_data = extracted_data
+                cluster.rowid = self.connection.execute("""
+                    INSERT INTO near_duplicate_clusters (signature, tickers, extracted_data, members, created_at)
+                    VALUES (?, ?, ?, 1, ?)
+                """, (cluster.signature.astype('<u4').tobytes(), cluster.tickers, extracted_data, time.time())).lastrowid
+                self.connection.commit()
+        cluster.ready.set()
+
+    def reuse(self, cluster, timeout=None):
+        # The cluster's extraction, waiting up to `timeout` seconds while its
+        # leader is still being extracted; None if it never arrives
+        if not cluster.ready.is_set():
+            with self.lock:
+                self.stats['waited'] += 1
+            cluster.ready.wait(timeout)
+        if cluster.extracted_data is None:
+            return None
+        with self.lock:
+            self.stats['reused'] += 1
+            self.connection.execute('UPDATE near_duplicate_clusters SET members = members + 1 WHERE id = ?',
+                                    (cluster.rowid,))
+            self.connection.commit()
+        return cluster.extracted_data
+
+    def evict(self):
+        # Drop clusters past max_age_days
+        with self.lock:
+            removed = 0
+            if self.max_age_days:
+                removed = self.connection.execute('DELETE FROM near_duplicate_clusters WHERE created_at < ?',
+                                                  (time.time() - self.max_age_days * 86400,)).rowcount
+            self.connection.commit()
+            return removed
+
+    def summary(self):
+        posts = self.stats['posts']
+        avoided = self.stats['reused'] / posts if posts else 0.0
+        return (f"Near duplicates: {self.stats['reused']} of {posts} posts reused a cluster's extraction "
+                f"({avoided:.0%} of LLM extractions avoided), {self.stats['leaders']} new clusters, "
+                f"{len(self.clusters)} clusters indexed")
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+class Cluster():
+    def __init__(self, cluster_id, signature, tickers, extracted_data=None, rowid=None):
+        self.id = cluster_id
+        self.rowid = rowid
+        self.signature = signature
+        self.tickers = tickers
+        self.extracted_data = extracted_data
+        self.ready = threading.Event()
+        if extracted_data is not None:
+            self.ready.set()
+
+
+class NearDuplicateBackend(SentimentBackend):
+    # Wraps another backend so each near-duplicate cluster is extracted once.
+    # Cluster leaders in a batch go to the wrapped backend together; members
+    # whose leader was extracted earlier (this run or a previous day) copy its
+    # result; members whose leader is still in flight on another worker wait
+    # for it up to wait_timeout seconds, then fall back to their own call.
+    def __init__(self, backend, index, ticker_index, wait_timeout=120.0):
+        self.backend = backend
+        self.index = index
+        self.ticker_index = ticker_index
+        self.wait_timeout = wait_timeout
+        self.batch_size = backend.batch_size
+        self.max_in_flight = backend.max_in_flight
+        self.token_budget = backend.token_budget
+
+    def analyze(self, rows):
+        results = {}
+        extract, leaders, members = [], [], []
+        for row in rows:
+            text = f"{row['title']} {row['body']}"
+            cluster, leads = self.index.claim(text, {match.ticker for match in self.ticker_index.iter_matches(text)})
+            if cluster is None or leads:
+                extract.append(row)
+                if leads:
+                    leaders.append((row, cluster))
+            else:
+                members.append((row, cluster))
+
+        if extract:
+            try:
+                for result in self.backend.analyze(extract):
+                    results[result[:2]] = result
+            finally:
+                # A failed batch drops its clusters instead of stranding members
+                for row, cluster in leaders:
+                    result = results.get((row['url'], row['scraped_date']))
+                    self.index.resolve(cluster, result[2] if result else None)
+
+        fallback = []
+        for row, cluster in members:
+            extracted_data = self.index.reuse(cluster, self.wait_timeout)
+            if extracted_data is None:
+                fallback.append(row)
+            else:
+                results[(row['url'], row['scraped_date'])] = (row['url'], row['scraped_date'], extracted_data)
+        if fallback:
+            for result in self.backend.analyze(fallback):
+                results[result[:2]] = result
+        return [results[(row['url'], row['scraped_date'])] for row in rows]
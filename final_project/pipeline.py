@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import archive
+import metrics
+from comments import COMMENT_POSTS
+from db import DB_PATH, POST_COLUMNS, connect
+
+# Marks the end of a stream; every stage forwards it once its input is drained
+DONE = object()
+
+QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 256))
+
+CREATE_CHECKPOINT_TABLE = '''
+    CREATE TABLE IF NOT EXISTS pipeline_checkpoint (
+        scraped_date TEXT,
+        sub_reddit TEXT,
+        posts INTEGER,
+        finished_at REAL,
+        PRIMARY KEY (scraped_date, sub_reddit)
+    )
+'''
+
+
+class StageStats():
+    # Per-stage counters. busy is time spent doing the stage's own work,
+    # blocked is time spent waiting for room in the next queue (backpressure)
+    # and latency is how long an item took from being handed to the stage,
+    # queueing included, to leaving it (end to end for aggregate).
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.latencies = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.started = None
+        self.finished = None
+
+    def record(self, items=1, busy=0.0, latencies=()) -> None:
+        with self.lock:
+            self.items += items
+            self.busy += busy
+            for latency in latencies:
+                self.latencies += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+
+    def summary(self):
+        elapsed = ((self.finished or time.perf_counter()) - self.started) if self.started else 0.0
+        return {
+            'items': self.items,
+            'errors': self.errors,
+            'elapsed_s': round(elapsed, 3),
+            'items_per_s': round(self.items / elapsed, 1) if elapsed else 0.0,
+            'busy_s': round(self.busy, 3),
+            'blocked_s': round(self.blocked, 3),
+            'latency_mean_ms': round(1000 * self.latency_total / self.latencies, 2) if self.latencies else 0.0,
+            'latency_max_ms': round(1000 * self.latency_max, 2),
+        }
+
+
+class Pipeline():
+    # Streams posts through scrape -> prefilter -> extract -> aggregate with a
+    # bounded queue between each pair of stages, so extraction starts on the
+    # first subreddit while the others are still being fetched, and a slow
+    # stage makes the ones upstream wait instead of piling posts up in memory.
+    #
+    # The database doubles as the checkpoint: subreddits stored today are
+    # recorded in pipeline_checkpoint and not fetched again, and posts that
+    # were stored but never reached stock_mentions are replayed first, so a
+    # crashed run picks up where it stopped.
+    def __init__(self, scraper, backend, ticker_index, db_path=DB_PATH, queue_size=QUEUE_SIZE, verbose=False):
+        self.scraper = scraper
+        self.backend = backend
+        self.ticker_index = ticker_index
+        self.db_path = db_path
+        self.verbose = verbose
+        # Unbounded: it holds at most one listing per subreddit, and fetch
+        # workers must never block on it, or a failing consumer would leave
+        # the fetch pool waiting on them forever at shutdown
+        self.listings = queue.Queue()
+        self.posts = queue.Queue(maxsize=queue_size)
+        self.to_extract = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue(maxsize=queue_size)
+        self.stats = {name: StageStats(name) for name in ('scrape', 'prefilter', 'extract', 'aggregate')}
+        self.errors = []
+
+    def _put(self, q, item, stats):
+        start = time.perf_counter()
+        q.put(item)
+        stats.blocked += time.perf_counter() - start
+
+    def _drain(self, q):
+        while True:
+            item = q.get()
+            if item is DONE:
+                return
+            yield item
+
+    def _fail(self, stats, error) -> None:
+        stats.errors += 1
+        self.errors.append((stats.name, error))
+        print(f"Error in {stats.name} stage: {error}")
+
+    def create_tables(self, conn) -> None:
+        from filter import create_tables
+        create_tables(conn)
+        conn.execute(CREATE_CHECKPOINT_TABLE)
+        conn.commit()
+
+    def checkpointed(self, conn, scraped_date):
+        rows = conn.execute('SELECT sub_reddit FROM pipeline_checkpoint WHERE scraped_date = ?', (scraped_date,))
+        return {sub_reddit for sub_reddit, in rows}
+
+    def scrape(self, conn, today):
+        # Runs on the calling thread, which owns the scraper's connection:
+        # replays the unanalyzed backlog, then stores listings as the fetch
+        # pool delivers them and forwards every post not yet analyzed.
+        from filter import BACKLOG_SOURCES, load_watermark
+        stats = self.stats['scrape']
+        stats.started = time.perf_counter()
+        forwarded = set()
+
+        def forward(row):
+            key = (row['url'], row['scraped_date'])
+            if key not in forwarded:
+                forwarded.add(key)
+                row['entered'] = time.perf_counter()
+                self._put(self.posts, row, stats)
+
+        done = self.checkpointed(conn, today)
+        sub_reddits = [sub_reddit for sub_reddit in self.scraper.sub_reddits if sub_reddit not in done]
+        if self.verbose and done:
+            print(f"Resuming: {len(done)} subreddits already stored for {today}")
+
+        def fetch(crawler):
+            try:
+                self.listings.put((crawler, crawler.fetch(), None))
+            except Exception as e:
+                self.listings.put((crawler, None, e))
+
+        with ThreadPoolExecutor(max_workers=self.scraper.max_workers) as pool:
+            for sub_reddit in sub_reddits:
+                pool.submit(fetch, self.scraper.crawler(sub_reddit))
+
+            replayed = 0
+            for name, source, _ in BACKLOG_SOURCES:
+                # Rows at or below the watermark are all analyzed already
+                for row in source(conn, load_watermark(conn, name)):
+                    forward({key: row[key] for key in ('url', 'title', 'body', 'scraped_date')})
+                    replayed += 1
+            if self.verbose and replayed:
+                print(f"Replayed {replayed} stored but unanalyzed posts")
+
+            for _ in sub_reddits:
+                crawler, posts, error = self.listings.get()
+                if error is not None:
+                    self._fail(stats, f"{crawler.sub_reddit}: {error}")
+                    continue
+                start = time.perf_counter()
+                try:
+                    rows = [dict(zip(POST_COLUMNS, row)) for row in crawler.save_posts(posts, self.scraper.verbose)]
+                except sqlite3.Error as e:
+                    # Not checkpointed, so the next run fetches it again
+                    self._fail(stats, f"{crawler.sub_reddit}: {e}")
+                    continue
+                analyzed = {(url, scraped_date) for url, scraped_date in conn.execute(
+                    'SELECT url, scraped_date FROM stock_mentions WHERE scraped_date = ?', (today,))} if rows else set()
+                elapsed = time.perf_counter() - start
+                stats.record(len(rows), elapsed, [elapsed])
+                if self.verbose:
+                    print(f"Stored {crawler.sub_reddit} ({len(rows)} posts)")
+                for row in rows:
+                    if (row['url'], row['scraped_date']) not in analyzed:
+                        forward(row)
+                # New comments naming a ticker follow their subreddit's posts,
+                # a batch at a time, so a huge thread streams through the
+                # queue; they were just stored, so skip the forwarded set
+                for row in crawler.crawl_comments(posts, self.scraper.verbose):
+                    row['entered'] = time.perf_counter()
+                    self._put(self.posts, row, stats)
+                # Checkpointed once its comment threads are walked too, so a
+                # crash mid-walk fetches the subreddit again on resume; stored
+                # posts and finished threads are not stored twice
+                with conn:
+                    conn.execute('INSERT OR REPLACE INTO pipeline_checkpoint VALUES (?, ?, ?, ?)',
+                                 (today, crawler.sub_reddit, len(rows), time.time()))
+        self.posts.put(DONE)
+        stats.finished = time.perf_counter()
+
+    def prefilter(self):
+        # Posts without a ticker never reach the extractor; their empty result
+        # goes straight to the aggregator
+        stats = self.stats['prefilter']
+        stats.started = time.perf_counter()
+        try:
+            for row in self._drain(self.posts):
+                start = time.perf_counter()
+                needs = self.ticker_index.contains_any(f"{row['title']} {row['body']}")
+                now = time.perf_counter()
+                stats.record(1, now - start, [now - start])
+                if needs:
+                    row['queued'] = now
+                    self._put(self.to_extract, row, stats)
+                else:
+                    self._put(self.results, ([row], [(row['url'], row['scraped_date'], json.dumps([]))], None), stats)
+        except Exception as e:
+            self._fail(stats, e)
+            for _ in self._drain(self.posts):
+                pass
+        finally:
+            self.to_extract.put(DONE)
+            stats.finished = time.perf_counter()
+
+    def extract(self):
+        from extraction import ExtractionEngine, pack_batches
+        stats = self.stats['extract']
+        stats.started = time.perf_counter()
+        self.engine = ExtractionEngine(self.backend.analyze, max_in_flight=self.backend.max_in_flight)
+        try:
+            batches = pack_batches(self._drain(self.to_extract), lambda row: f"{row['title']} {row['body']}",
+                                   batch_size=self.backend.batch_size, token_budget=self.backend.token_budget)
+            for rows, results, error in self.engine.run(batches):
+                now = time.perf_counter()
+                if error is not None:
+                    self._fail(stats, error)
+                stats.record(len(rows), 0.0, [now - row['queued'] for row in rows])
+                self._put(self.results, (rows, results, error), stats)
+        except Exception as e:
+            self._fail(stats, e)
+            for _ in self._drain(self.to_extract):
+                pass
+        finally:
+            self.results.put(DONE)
+            stats.finished = time.perf_counter()
+
+    def aggregate(self):
+        # Its own connection, so writing results never waits on the scraper's;
+        # WAL lets both write in turn. One transaction per result batch.
+        from filter import save_mention
+        stats = self.stats['aggregate']
+        stats.started = time.perf_counter()
+        conn = connect(self.db_path)
+        try:
+            for rows, results, error in self._drain(self.results):
+                if error is not None:
+                    # Left out of stock_mentions, so the next run replays them
+                    for row in rows:
+                        print(f"Error extracting {row['url']}: {error}")
+                    continue
+                start = time.perf_counter()
+                try:
+                    with conn:
+                        for result in results:
+                            save_mention(conn, result, commit=False)
+                except Exception:
+                    # The batch was rolled back: save it one result at a time,
+                    # so a bad one only costs itself. It stays out of
+                    # stock_mentions and the next run replays it.
+                    for result in results:
+                        try:
+                            with conn:
+                                save_mention(conn, result, commit=False)
+                        except Exception as e:
+                            self._fail(stats, f"saving {result[0]}: {e}")
+                now = time.perf_counter()
+                stats.record(len(rows), now - start, [now - row['entered'] for row in rows])
+        except Exception as e:
+            self._fail(stats, e)
+            for _ in self._drain(self.results):
+                pass
+        finally:
+            conn.close()
+            stats.finished = time.perf_counter()
+
+    def run(self):
+        conn = self.scraper.db_connection
+        self.create_tables(conn)
+        today = time.strftime("%Y-%m-%d", time.localtime(time.time()))
+        threads = [threading.Thread(target=stage, name=stage.__name__, daemon=True)
+                   for stage in (self.prefilter, self.extract, self.aggregate)]
+        for thread in threads:
+            thread.start()
+        try:
+            self.scrape(conn, today)
+        except Exception as e:
+            self._fail(self.stats['scrape'], e)
+            self.posts.put(DONE)
+        for thread in threads:
+            thread.join()
+        # Results land out of order, so each watermark only moves up to the
+        # first row still unanalyzed (a failed extraction holds it back)
+        from filter import BACKLOG_SOURCES, advance_watermark
+        for name, source, table in BACKLOG_SOURCES:
+            advance_watermark(conn, name, source, table)
+        return self.summary()
+
+    def summary(self):
+        summary = {name: stats.summary() for name, stats in self.stats.items()}
+        engine = getattr(self, 'engine', None)
+        if engine is not None:
+            summary['extract']['engine'] = dict(engine.stats)
+        comments = getattr(self.scraper, 'comments', None)
+        if comments is not None:
+            summary['scrape']['comments'] = dict(comments.stats)
+        near_duplicates = getattr(self.backend, 'index', None)
+        if near_duplicates is not None:
+            summary['extract']['near_duplicates'] = dict(near_duplicates.stats)
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrape, filter and aggregate in one streaming run')
+    parser.add_argument('--db', help=f'SQLite database (default: {DB_PATH}, or a temporary file with --fake)')
+    parser.add_argument('--posts', type=int, default=100, help='posts per subreddit')
+    parser.add_argument('--backend', choices=['openai', 'lexicon'], default=os.getenv('FILTER_BACKEND', 'openai'))
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE)
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--comment-posts', type=int, default=COMMENT_POSTS,
+                        help='posts per subreddit, highest score first, whose comment threads are ingested')
+    parser.add_argument('--fake', action='store_true', help='use the local fake Reddit and OpenAI providers')
+    parser.add_argument('--fake-latency', type=float, default=0.05, help='seconds per fake LLM call')
+    parser.add_argument('--stats', help='write the per-stage counters to this JSON file')
+    parser.add_argument('--metrics', default=metrics.METRICS_DIR, help='directory for the JSON/Prometheus run summary')
+    parser.add_argument('--profile', default=metrics.METRICS_PROFILE, help='write a cProfile dump of the run here')
+    parser.add_argument('--archive', default=archive.ARCHIVE_DIR, help='bring this Parquet archive up to date after the run')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    fake_server = None
+    provider = None
+    db_path = args.db or DB_PATH
+    if args.fake:
+        from fakes.fake_openai import FakeOpenAIServer
+        from fakes.fake_reddit import FakeListingProvider
+        from ticker_index import TickerIndex
+        directory = tempfile.mkdtemp(prefix='pipeline-')
+        db_path = args.db or os.path.join(directory, 'reddit_posts.db')
+        fake_server = FakeOpenAIServer(latency=args.fake_latency, ticker_index=TickerIndex.from_json()).start()
+        # filter.py reads these at import and builds its client and cache from them
+        os.environ['OPENAI_BASE_URL'] = fake_server.base_url
+        os.environ.setdefault('OPENAI_API_KEY', 'fake')
+        os.environ.setdefault('FILTER_CACHE_PATH', os.path.join(directory, 'llm_cache.db'))
+        os.environ.setdefault('FILTER_DEDUP_PATH', os.path.join(directory, 'near_duplicates.db'))
+        # The fake has no quota, so keep the production limits from pacing it
+        os.environ.setdefault('FILTER_REQUESTS_PER_MINUTE', '100000')
+        os.environ.setdefault('FILTER_TOKENS_PER_MINUTE', '100000000')
+        provider = FakeListingProvider(latency=0.2)
+
+    import filter
+    from reddit_scrape import Scraper
+    scraper = Scraper(number_of_posts=args.posts, provider=provider, incremental=args.incremental, db_path=db_path,
+                      comment_posts=args.comment_posts)
+    pipeline = Pipeline(scraper, filter.make_backend(args.backend), filter.ticker_index,
+                        db_path=db_path, queue_size=args.queue_size, verbose=args.verbose)
+    start = time.perf_counter()
+    with metrics.profiled(args.profile):
+        summary = pipeline.run()
+    filter.close_llm_cache()
+    filter.close_near_duplicates()
+    summary['wall_s'] = round(time.perf_counter() - start, 3)
+    if fake_server is not None:
+        fake_server.stop()
+    print(json.dumps(summary, indent=2))
+    if args.stats:
+        with open(args.stats, 'w') as f:
+            json.dump(summary, f, indent=2)
+    if args.archive:
+        conn = connect(db_path)
+        written = archive.update(conn, args.archive)
+        conn.close()
+        print(f"Archive: {sum(map(len, written.values()))} partitions written to {args.archive}")
+    if args.metrics:
+        print(f"Metrics: {metrics.export(args.metrics, run='pipeline')}")
+    if args.fake:
+        print(f"Database: {db_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,80 +1,148 @@
-import praw
-import utils.config as config
+import os
 import time
+import queue
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from db import CREATE_POSTS_INDEX, DB_PATH, PostWriter, connect, post_fingerprint
+from listing_providers import PrawListingProvider
+from comments import COMMENT_POSTS, CommentIngester, select_posts
+import archive
+import metrics
+from metrics import inc, timed
+
+# Incremental scrapes only write posts that are new or edited, plus a score
+# snapshot for the rest. vis.py and the rollups read posts, so unchanged
+# posts then drop out of the day's counts: opt in with SCRAPE_INCREMENTAL=1.
+INCREMENTAL = os.getenv('SCRAPE_INCREMENTAL', '0') == '1'
 
 class Crawler():
-    def __init__(self, sub_reddit, number_of_posts, db_connection):
+    def __init__(self, sub_reddit, number_of_posts, db_connection, writer=None, provider=None, incremental=False,
+                 comments=None, comment_posts=0):
         self.sub_reddit = sub_reddit
         self.number_of_posts = number_of_posts
         self.db_connection = db_connection
-        self.reddit = praw.Reddit(
-            client_id=config.REDDIT_CLIENT_ID,
-            client_secret=config.REDDIT_CLIENT_SECRET,
-            user_agent=config.REDDIT_USER_AGENT
-        )
+        self.writer = writer or PostWriter(db_connection)
+        self.provider = provider or PrawListingProvider()
+        # Only store full rows for new or edited posts; unchanged ones get a score snapshot
+        self.incremental = incremental
+        # CommentIngester for the comment threads of the top comment_posts posts
+        self.comments = comments
+        self.comment_posts = comment_posts
+
+    @timed('crawler_fetch_seconds')
+    def fetch(self):
+        # Pull the listing without touching the database, so it can run on a worker thread
+        posts = [post for post in self.provider.hot(self.sub_reddit, self.number_of_posts) if not post.stickied]
+        inc('crawler_posts_fetched', len(posts))
+        return posts
 
+    @timed('crawler_crawl_seconds')
     def crawl(self, verbose=False) -> None:
-        subreddit = self.reddit.subreddit(self.sub_reddit)
-        hot_posts = subreddit.hot(limit=self.number_of_posts)
-
-        for post in hot_posts:
-            if not post.stickied:
-                post_date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(post.created_utc))
-                today_date = time.strftime("%Y-%m-%d", time.localtime(time.time()))
-
-                # Save the post data
-                self.save_to_sqlite(
-                    post.url,
-                    post.title,
-                    self.sub_reddit,
-                    str(post.author),
-                    post.created_utc,
-                    post.score,
-                    post.selftext,
-                    post.num_comments,
-                    post.url if post.url.endswith(('.jpg', '.png', '.gif')) else ''
-                )
+        posts = self.fetch()
+        try:
+            self.save_posts(posts, verbose)
+        except sqlite3.Error as e:
+            print(f"Error saving {self.sub_reddit} to SQLite: {e}")
+            return
+        for _ in self.crawl_comments(posts, verbose):
+            pass
 
-                if verbose:
-                    print(f"Saved post: {post.title}")
+    def crawl_comments(self, posts, verbose=False):
+        # Streams new comments of the highest-scoring posts into the comments
+        # table, yielding the rows that name a ticker
+        if self.comments is None or not self.comment_posts:
+            return
+        for post in select_posts(posts, self.comment_posts):
+            try:
+                yield from self.comments.ingest(self.sub_reddit, post)
+            except Exception as e:
+                print(f"Error scraping comments of {post.url}: {e}")
+                continue
+            if verbose:
+                print(f"Scraped comments of: {post.title}")
 
+    def seen_fingerprints(self):
+        rows = self.db_connection.execute(
+            'SELECT post_id, fingerprint FROM seen_posts WHERE sub_reddit = ?', (self.sub_reddit,))
+        return dict(rows.fetchall())
 
-    def save_to_sqlite(self, url, title, sub_reddit, author, post_date, upvotes, body, comments, image) -> None:
-        cursor = self.db_connection.cursor()
-        try:
-            cursor.execute("""
-                INSERT OR IGNORE INTO posts (url, title, sub_reddit, author, post_date, upvotes, body, comments, image, scraped_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                url,
-                title,
-                sub_reddit,
-                author,
-                post_date,
-                upvotes,
-                body,
-                comments,
-                image,
-                time.strftime("%Y-%m-%d", time.localtime(time.time()))  # Store the current timestamp as the scraped_date
+    def save_posts(self, posts, verbose=False):
+        # Returns the rows written to posts (unchanged posts in incremental mode are left out)
+        seen = self.seen_fingerprints() if self.incremental else {}
+        saved = []
+        today_date = time.strftime("%Y-%m-%d", time.localtime(time.time()))
+        for post in posts:
+            edited = False
+            if self.incremental:
+                post_id = getattr(post, 'id', None) or post.url
+                fingerprint = post_fingerprint(post.title, post.selftext, post.url)
+                self.writer.mark_seen((self.sub_reddit, post_id, post.url, fingerprint, today_date, today_date))
+                if seen.get(post_id) == fingerprint:
+                    self.writer.add_snapshot((post.url, today_date, post.score, post.num_comments))
+                    continue
+                # Edited since it was last seen, possibly earlier today: its
+                # row for today, if any, gets the new text instead of being kept
+                edited = post_id in seen
+
+            # Save the post data
+            saved.append(self.save_to_sqlite(
+                post.url,
+                post.title,
+                self.sub_reddit,
+                str(post.author),
+                post.created_utc,
+                post.score,
+                post.selftext,
+                post.num_comments,
+                post.url if post.url.endswith(('.jpg', '.png', '.gif')) else '',
+                edited
             ))
-            self.db_connection.commit()
-        except sqlite3.Error as e:
-            print(f"Error saving to SQLite: {e}")
-        finally:
-            cursor.close()
+
+            if verbose:
+                print(f"Saved post: {post.title}")
+
+        # One transaction for the whole subreddit
+        self.writer.flush()
+        return saved
+
+    @timed('crawler_save_to_sqlite_seconds')
+    def save_to_sqlite(self, url, title, sub_reddit, author, post_date, upvotes, body, comments, image, edited=False):
+        # Buffered; rows reach the database when the writer flushes
+        row = (
+            url,
+            title,
+            sub_reddit,
+            author,
+            post_date,
+            upvotes,
+            body,
+            comments,
+            image,
+            time.strftime("%Y-%m-%d", time.localtime(time.time()))  # Store the current timestamp as the scraped_date
+        )
+        self.writer.add(row, edited)
+        return row
 
 
 class Scraper():
-    def __init__(self, number_of_posts=100, verbose=False):
+    def __init__(self, number_of_posts=100, verbose=False, provider=None, max_workers=None, incremental=False,
+                 db_path=DB_PATH, comment_posts=0):
         self.sub_reddits = ["wallstreetbets", "investing", "stocks", "trading",
                             "forex", "algotrading", "investor", "etoro",
                             "asktrading", "finance", "forextrading"]
         self.number_of_posts = number_of_posts
         self.verbose = verbose
+        # One provider (and so one rate limit) shared by every subreddit
+        self.provider = provider or PrawListingProvider()
+        self.max_workers = max_workers or len(self.sub_reddits)
+        self.incremental = incremental
+        self.comment_posts = comment_posts
 
-        self.db_connection = sqlite3.connect('/Users/abe/git/Dancing_with_Data/final_project/scraped_data/reddit_posts.db')
+        self.db_connection = connect(db_path)
+        self.writer = PostWriter(self.db_connection)
         self.create_table()
+        # Comment threads share the connection; only this thread writes to it
+        self.comments = CommentIngester(self.db_connection, self.provider) if comment_posts else None
 
     def create_table(self):
         cursor = self.db_connection.cursor()
@@ -94,19 +162,49 @@ class Scraper():
                     primary key (url, scraped_date)
                 )
             """)
+            cursor.execute(CREATE_POSTS_INDEX)
+            # Score/comment-count history for posts whose text did not change
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS post_snapshots (
+                    url TEXT,
+                    scraped_date TEXT,
+                    upvotes INTEGER,
+                    comments INTEGER,
+                    primary key (url, scraped_date)
+                )
+            """)
+            # Per-subreddit record of every post seen and its content fingerprint
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS seen_posts (
+                    sub_reddit TEXT,
+                    post_id TEXT,
+                    url TEXT,
+                    fingerprint TEXT,
+                    first_seen TEXT,
+                    last_seen TEXT,
+                    primary key (sub_reddit, post_id)
+                )
+            """)
             self.db_connection.commit()
+            archive.track_changes(self.db_connection)
         except sqlite3.Error as e:
             print(f"Error creating table: {e}")
         finally:
             cursor.close()
 
+    def crawler(self, sub_reddit):
+        return Crawler(sub_reddit=sub_reddit, number_of_posts=self.number_of_posts,
+                       db_connection=self.db_connection, writer=self.writer, provider=self.provider,
+                       incremental=self.incremental, comments=self.comments, comment_posts=self.comment_posts)
+
     def scrape_sub_reddit(self, sub_reddit):
-        crawler = Crawler(sub_reddit=sub_reddit, number_of_posts=self.number_of_posts, db_connection=self.db_connection)
-        crawler.crawl(self.verbose)
+        self.crawler(sub_reddit).crawl(self.verbose)
 
-    def scrape_all(self):
+    def scrape_all(self, concurrent=False):
         if self.verbose:
             print(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
+        if concurrent:
+            return self.scrape_all_concurrent()
         for sub_reddit in self.sub_reddits:
             if self.verbose:
                 print("="*20)
@@ -114,10 +212,46 @@ class Scraper():
                 print("="*20)
             self.scrape_sub_reddit(sub_reddit)
 
+    def scrape_all_concurrent(self):
+        # Listings are fetched in parallel; only this thread writes to SQLite,
+        # draining finished listings from the queue as they arrive.
+        listings = queue.Queue()
+
+        def fetch(crawler):
+            try:
+                listings.put((crawler, crawler.fetch(), None))
+            except Exception as e:
+                listings.put((crawler, None, e))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for sub_reddit in self.sub_reddits:
+                pool.submit(fetch, self.crawler(sub_reddit))
+            for _ in self.sub_reddits:
+                crawler, posts, error = listings.get()
+                if error is not None:
+                    print(f"Error scraping subreddit {crawler.sub_reddit}: {error}")
+                    continue
+                if self.verbose:
+                    print(f"Scraped subreddit: {crawler.sub_reddit} ({len(posts)} posts)")
+                try:
+                    crawler.save_posts(posts, self.verbose)
+                except sqlite3.Error as e:
+                    print(f"Error saving {crawler.sub_reddit} to SQLite: {e}")
+                    continue
+                for _ in crawler.crawl_comments(posts, self.verbose):
+                    pass
+
     def __del__(self):
         if self.db_connection:
             self.db_connection.close()
 
 
-scrapey = Scraper(verbose=False)
-scrapey.scrape_all()
+if __name__ == '__main__':
+    with metrics.profiled():
+        scrapey = Scraper(verbose=False, incremental=INCREMENTAL, comment_posts=COMMENT_POSTS)
+        scrapey.scrape_all(concurrent=True)
+        if scrapey.comments is not None:
+            print(scrapey.comments.summary())
+        archive.update(scrapey.db_connection)
+    metrics.export(run='scrape')
+
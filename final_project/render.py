@@ -0,0 +1,145 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+
+import vis
+from db import DB_PATH, connect
+
+# Bump when the drawing code changes so every date is re-rendered once
+RENDER_VERSION = 1
+MANIFEST = 'render_manifest.json'
+FORMATS = ('png', 'svg')
+
+FIGURES = {
+    'stocks': ((12, 6), 'Stock Sentiments', vis.draw_stock_sentiments),
+    'subreddits': ((8, 8), 'Subreddit Sentiments', vis.draw_subreddit_sentiments),
+    'overall': ((8, 8), 'Overall Sentiment', vis.draw_overall_sentiment),
+}
+
+# One set of figures per process, cleared and redrawn for every date
+_figures = None
+
+
+def _process_figures():
+    global _figures
+    if _figures is None:
+        _figures = {name: Figure(figsize=size) for name, (size, _, _) in FIGURES.items()}
+    return _figures
+
+
+def date_views(conn, date):
+    # The three dashboard views for one date, straight from the rollups
+    return (vis.mentions_and_sentiment_sql(conn, date), vis.subreddit_sentiment_sql(conn, date),
+            vis.overall_sentiment_sql(conn, date))
+
+
+def content_hash(views, formats):
+    stock_sentiments, sub_sentiments, total_sentiment = views
+    payload = json.dumps([RENDER_VERSION, sorted(formats), sorted(stock_sentiments.items()),
+                          sorted(sub_sentiments.items()), total_sentiment], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def output_paths(out_dir, date, formats):
+    return [os.path.join(out_dir, f'{date}_{name}.{fmt}') for name in FIGURES for fmt in formats]
+
+
+def render_views(date, views, out_dir, formats=FORMATS):
+    # Draws one date's three figures and writes each in every format. Files
+    # are written next to their final name and renamed into place, so a
+    # crashed render never leaves a truncated image behind.
+    figures = _process_figures()
+    paths = []
+    for (name, (_, title, draw)), data in zip(FIGURES.items(), views):
+        fig = figures[name]
+        fig.clf()
+        draw(fig.add_subplot(), data)
+        fig.suptitle(f'{title} for {date}')
+        fig.tight_layout()
+        for fmt in formats:
+            path = os.path.join(out_dir, f'{date}_{name}.{fmt}')
+            fig.savefig(path + '.tmp', format=fmt)
+            os.replace(path + '.tmp', path)
+            paths.append(path)
+    return date, paths
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def render_dates(conn, out_dir, dates=None, formats=FORMATS, workers=None, force=False):
+    # Renders every date that has rollups (or only the given dates) into
+    # out_dir, skipping dates whose rollup content and outputs are unchanged
+    # since the last run. Returns (rendered, skipped) date lists.
+    os.makedirs(out_dir, exist_ok=True)
+    if dates is None:
+        dates = [date for date, in conn.execute('SELECT scraped_date FROM rollup_overall ORDER BY scraped_date')]
+    manifest = load_manifest(out_dir)
+    pending = {}
+    skipped = []
+    for date in dates:
+        views = date_views(conn, date)
+        digest = content_hash(views, formats)
+        if (not force and manifest.get(date) == digest
+                and all(os.path.exists(path) for path in output_paths(out_dir, date, formats))):
+            skipped.append(date)
+        else:
+            pending[date] = (views, digest)
+
+    rendered = []
+    try:
+        if workers == 1 or len(pending) <= 1:
+            for date, (views, digest) in pending.items():
+                render_views(date, views, out_dir, formats)
+                manifest[date] = digest
+                rendered.append(date)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(render_views, date, views, out_dir, formats)
+                           for date, (views, _) in pending.items()]
+                for future in as_completed(futures):
+                    date, _ = future.result()
+                    manifest[date] = pending[date][1]
+                    rendered.append(date)
+    finally:
+        # Whatever finished is recorded, so a rerun only redoes the rest
+        save_manifest(out_dir, manifest)
+    return sorted(rendered), skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the daily sentiment plots to image files')
+    parser.add_argument('dates', nargs='*', help='dates to render (default: every date with rollups)')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--out', default='final_project/plots')
+    parser.add_argument('--format', dest='formats', nargs='+', default=list(FORMATS), choices=['png', 'svg', 'pdf'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='re-render dates even if unchanged')
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    rendered, skipped = render_dates(conn, args.out, args.dates or None, args.formats, args.workers, args.force)
+    conn.close()
+    print(f"Rendered {len(rendered)} dates, {len(skipped)} unchanged, into {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import sys
+from collections import Counter
+
+SENTIMENT_LABELS = ('positive', 'neutral', 'negative')
+
+# Per-day aggregates behind the dashboards, kept in step with mention by
+# applying deltas in the same transaction that writes a post's mentions.
+CREATE_ROLLUP_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_ticker (
+        scraped_date TEXT NOT NULL,
+        ticker TEXT NOT NULL,
+        positive INTEGER NOT NULL DEFAULT 0,
+        neutral INTEGER NOT NULL DEFAULT 0,
+        negative INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scraped_date, ticker)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_subreddit (
+        scraped_date TEXT NOT NULL,
+        sub_reddit TEXT NOT NULL,
+        posts INTEGER NOT NULL DEFAULT 0,
+        positive INTEGER NOT NULL DEFAULT 0,
+        neutral INTEGER NOT NULL DEFAULT 0,
+        negative INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scraped_date, sub_reddit)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_overall (
+        scraped_date TEXT PRIMARY KEY,
+        posts INTEGER NOT NULL DEFAULT 0,
+        positive INTEGER NOT NULL DEFAULT 0,
+        neutral INTEGER NOT NULL DEFAULT 0,
+        negative INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+]
+
+
+def _upsert(table, keys, values):
+    columns = keys + values
+    return f'''
+        INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})
+        ON CONFLICT ({', '.join(keys)}) DO UPDATE SET
+            {', '.join(f'{value} = {value} + excluded.{value}' for value in values)}
+    '''
+
+
+UPSERT_TICKER = _upsert('rollup_ticker', ['scraped_date', 'ticker'], list(SENTIMENT_LABELS))
+UPSERT_SUBREDDIT = _upsert('rollup_subreddit', ['scraped_date', 'sub_reddit'], ['posts', *SENTIMENT_LABELS])
+UPSERT_OVERALL = _upsert('rollup_overall', ['scraped_date'], ['posts', *SENTIMENT_LABELS])
+
+
+def create_rollup_tables(conn) -> None:
+    for statement in CREATE_ROLLUP_TABLES:
+        conn.execute(statement)
+    conn.commit()
+
+
+def _sentiment_vector(counter, key):
+    return [counter[(key, label)] for label in SENTIMENT_LABELS]
+
+
+def apply_delta(conn, scraped_date, sub_reddit, removed, added, new_post=False) -> None:
+    # removed/added are (ticker, sentiment) pairs for one post. The caller owns
+    # the transaction, so rollups commit or roll back together with mention.
+    delta = Counter(added)
+    delta.subtract(Counter(removed))
+    if not delta and not new_post:
+        return
+    tickers = Counter()
+    sentiments = Counter()
+    for (ticker, sentiment), count in delta.items():
+        tickers[(ticker, sentiment)] += count
+        sentiments[(None, sentiment)] += count
+
+    ticker_rows = [(scraped_date, ticker, *_sentiment_vector(tickers, ticker)) for ticker in {ticker for ticker, _ in tickers}]
+    conn.executemany(UPSERT_TICKER, [row for row in ticker_rows if any(row[2:])])
+    totals = _sentiment_vector(sentiments, None)
+    if sub_reddit is not None:
+        conn.execute(UPSERT_SUBREDDIT, (scraped_date, sub_reddit, int(new_post), *totals))
+    conn.execute(UPSERT_OVERALL, (scraped_date, int(new_post), *totals))
+
+
+def _where(column, dates, *conditions):
+    conditions = list(conditions)
+    if dates is not None:
+        conditions.insert(0, f"{column} IN ({', '.join('?' for _ in dates)})")
+    return ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+
+def rebuild(conn, dates=None) -> None:
+    # Recomputes rollups from mention and stock_mentions, for every date or
+    # only the given ones. Used after migrations and to repair drift.
+    create_rollup_tables(conn)
+    params = []
+    if dates is not None:
+        dates = list(dates)
+        params = dates
+    sums = ', '.join(f"SUM(sentiment = '{label}')" for label in SENTIMENT_LABELS)
+    with conn:
+        for table in ('rollup_ticker', 'rollup_subreddit', 'rollup_overall'):
+            conn.execute(f"DELETE FROM {table} {_where('scraped_date', dates)}", params)
+        conn.execute(f'''
+            INSERT INTO rollup_ticker (scraped_date, ticker, {', '.join(SENTIMENT_LABELS)})
+            SELECT scraped_date, ticker, {sums} FROM mention {_where('scraped_date', dates)}
+            GROUP BY scraped_date, ticker
+        ''', params)
+        # Analyzed posts per subreddit, so subreddits without mentions still show up
+        conn.execute(f'''
+            INSERT INTO rollup_subreddit (scraped_date, sub_reddit, posts)
+            SELECT p.scraped_date, p.sub_reddit, COUNT(*) FROM stock_mentions m
+            JOIN posts p ON p.url = m.url AND p.scraped_date = m.scraped_date
+            {_where('m.scraped_date', dates, 'p.sub_reddit IS NOT NULL')}
+            GROUP BY p.scraped_date, p.sub_reddit
+        ''', params)
+        conn.executemany(UPSERT_SUBREDDIT, conn.execute(f'''
+            SELECT scraped_date, sub_reddit, 0, {sums} FROM mention
+            {_where('scraped_date', dates, 'sub_reddit IS NOT NULL')}
+            GROUP BY scraped_date, sub_reddit
+        ''', params).fetchall())
+        conn.execute(f'''
+            INSERT INTO rollup_overall (scraped_date, posts)
+            SELECT m.scraped_date, COUNT(*) FROM stock_mentions m
+            JOIN posts p ON p.url = m.url AND p.scraped_date = m.scraped_date
+            {_where('m.scraped_date', dates)}
+            GROUP BY m.scraped_date
+        ''', params)
+        conn.executemany(UPSERT_OVERALL, conn.execute(f'''
+            SELECT scraped_date, 0, {sums} FROM mention {_where('scraped_date', dates)}
+            GROUP BY scraped_date
+        ''', params).fetchall())
+
+
+def ticker_sentiment(conn, date):
+    return conn.execute(f'''
+        SELECT ticker, {', '.join(SENTIMENT_LABELS)} FROM rollup_ticker
+        WHERE scraped_date = ? AND {' + '.join(SENTIMENT_LABELS)} > 0
+    ''', (date,)).fetchall()
+
+
+def subreddit_sentiment(conn, date):
+    return conn.execute(f'''
+        SELECT sub_reddit, {', '.join(SENTIMENT_LABELS)} FROM rollup_subreddit WHERE scraped_date = ?
+    ''', (date,)).fetchall()
+
+
+def overall_sentiment(conn, date):
+    return conn.execute(f'''
+        SELECT {', '.join(SENTIMENT_LABELS)} FROM rollup_overall WHERE scraped_date = ?
+    ''', (date,)).fetchone()
+
+
+def ticker_range(conn, start, end, tickers=None):
+    # Every (date, ticker) row between start and end inclusive in one query,
+    # optionally restricted to the given tickers
+    tickers = list(tickers) if tickers is not None else None
+    conditions = ['scraped_date BETWEEN ? AND ?', f"{' + '.join(SENTIMENT_LABELS)} > 0"]
+    return conn.execute(f'''
+        SELECT scraped_date, ticker, {', '.join(SENTIMENT_LABELS)} FROM rollup_ticker
+        {_where('ticker', tickers, *conditions)}
+    ''', [*(tickers or []), start, end]).fetchall()
+
+
+def subreddit_range(conn, start, end):
+    return conn.execute(f'''
+        SELECT scraped_date, sub_reddit, posts, {', '.join(SENTIMENT_LABELS)} FROM rollup_subreddit
+        WHERE scraped_date BETWEEN ? AND ?
+    ''', (start, end)).fetchall()
+
+
+def overall_range(conn, start, end):
+    return conn.execute(f'''
+        SELECT scraped_date, posts, {', '.join(SENTIMENT_LABELS)} FROM rollup_overall
+        WHERE scraped_date BETWEEN ? AND ? ORDER BY scraped_date
+    ''', (start, end)).fetchall()
+
+
+if __name__ == '__main__':
+    from db import connect
+    conn = connect(sys.argv[1] if len(sys.argv) > 1 else 'final_project/scraped_data/reddit_posts.db')
+    rebuild(conn)
+    print(f"Rebuilt rollups for {conn.execute('SELECT COUNT(*) FROM rollup_overall').fetchone()[0]} days")
+    conn.close()
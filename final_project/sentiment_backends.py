@@ -0,0 +1,141 @@
+import json
+import re
+from bisect import bisect_left
+
+
+SENTIMENTS = ('positive', 'neutral', 'negative')
+
+# Small finance / r/wallstreetbets lexicon. Weights are in [-1, 1]; extend it
+# with load_lexicon() from a "word,weight" file for a fuller dictionary.
+FINANCE_LEXICON = {
+    # positive
+    'bull': 0.6, 'bullish': 0.9, 'buy': 0.5, 'buying': 0.5, 'bought': 0.4, 'long': 0.4, 'calls': 0.5,
+    'moon': 0.9, 'mooning': 0.9, 'rocket': 0.8, 'tendies': 0.8, 'squeeze': 0.5, 'rally': 0.7,
+    'rallying': 0.7, 'gain': 0.6, 'gains': 0.6, 'gained': 0.6, 'profit': 0.6, 'profits': 0.6,
+    'profitable': 0.7, 'beat': 0.6, 'beats': 0.6, 'upgrade': 0.7, 'upgraded': 0.7, 'outperform': 0.7,
+    'growth': 0.5, 'growing': 0.5, 'strong': 0.5, 'record': 0.4, 'surge': 0.7, 'surged': 0.7,
+    'soar': 0.8, 'soared': 0.8, 'undervalued': 0.6, 'winner': 0.6, 'win': 0.5, 'great': 0.6,
+    'good': 0.4, 'love': 0.6, 'hold': 0.2, 'hodl': 0.4, 'dividend': 0.3, 'breakout': 0.6,
+    'green': 0.5, 'recovery': 0.5, 'recover': 0.5, 'up': 0.2, 'higher': 0.3, 'opportunity': 0.4,
+    # negative
+    'bear': -0.6, 'bearish': -0.9, 'sell': -0.5, 'selling': -0.5, 'sold': -0.4, 'short': -0.4,
+    'shorting': -0.5, 'puts': -0.5, 'dump': -0.8, 'dumping': -0.8, 'crash': -0.9, 'crashing': -0.9,
+    'crashed': -0.9, 'tank': -0.8, 'tanked': -0.8, 'tanking': -0.8, 'loss': -0.6, 'losses': -0.6,
+    'lost': -0.5, 'miss': -0.6, 'missed': -0.6, 'downgrade': -0.7, 'downgraded': -0.7,
+    'underperform': -0.7, 'overvalued': -0.6, 'bagholder': -0.7, 'bagholding': -0.7, 'bags': -0.4,
+    'weak': -0.5, 'drop': -0.6, 'dropped': -0.6, 'plunge': -0.8, 'plunged': -0.8, 'fraud': -0.9,
+    'lawsuit': -0.6, 'bankrupt': -1.0, 'bankruptcy': -1.0, 'debt': -0.3, 'risk': -0.2, 'risky': -0.4,
+    'bad': -0.5, 'terrible': -0.8, 'worst': -0.8, 'hate': -0.6, 'red': -0.5, 'down': -0.2,
+    'lower': -0.3, 'recession': -0.6, 'layoffs': -0.6, 'scam': -0.9, 'rekt': -0.8, 'fell': -0.5,
+}
+
+NEGATIONS = frozenset(['not', 'no', 'never', "don't", "dont", "isn't", "isnt", "won't", "wont",
+                       "can't", "cant", "didn't", "didnt", "doesn't", "doesnt", 'nothing', 'without'])
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z$][A-Za-z'$-]*")
+
+
+def load_lexicon(path, base=FINANCE_LEXICON):
+    lexicon = dict(base)
+    with open(path, 'r') as f:
+        for line in f:
+            word, _, weight = line.strip().partition(',')
+            if word and weight:
+                lexicon[word.lower()] = float(weight)
+    return lexicon
+
+
+class SentimentBackend():
+    # Turns a batch of post rows (dicts with url, scraped_date, title, body)
+    # into (url, scraped_date, extracted_data) tuples, where extracted_data is
+    # a JSON list of {"ticker": ..., "sentiment": ...} objects.
+    batch_size = 1
+    max_in_flight = 1
+    token_budget = None
+
+    def analyze(self, rows):
+        raise NotImplementedError
+
+
+class LexiconBackend(SentimentBackend):
+    # Fully local, CPU-only scorer. Tokens of a whole batch are scored at once
+    # with NumPy; each ticker mention takes the sum of lexicon weights in a
+    # window of tokens around it, with negators flipping the next word.
+    def __init__(self, ticker_index, lexicon=FINANCE_LEXICON, window=12, threshold=0.25, batch_size=1000):
+        self.ticker_index = ticker_index
+        self.window = window
+        self.threshold = threshold
+        self.batch_size = batch_size
+        # NumPy is only imported once a lexicon backend is actually built
+        import numpy as np
+        self.vocabulary = {word: i + 1 for i, word in enumerate(lexicon)}  # 0 = not in lexicon
+        self.weights = np.zeros(len(self.vocabulary) + 1)
+        self.weights[1:] = list(lexicon.values())
+
+    def _tokenize(self, text):
+        starts = []
+        ids = []
+        for match in TOKEN_PATTERN.finditer(text):
+            word = match.group().lower().strip("$'")
+            starts.append(match.start())
+            # Negators get id -1: they score nothing themselves but flip the next word
+            ids.append(-1 if word in NEGATIONS else self.vocabulary.get(word, 0))
+        return starts, ids
+
+    def score_mentions(self, texts):
+        # Returns, per text, a list of (ticker, score) in mention order
+        import numpy as np
+        token_ids = []
+        mention_post = []
+        mention_token = []
+        mention_ticker = []
+        offsets = [0]
+        for post_index, text in enumerate(texts):
+            starts, ids = self._tokenize(text)
+            token_ids.extend(ids)
+            for match in self.ticker_index.iter_matches(text):
+                mention_post.append(post_index)
+                mention_token.append(offsets[-1] + bisect_left(starts, match.start))
+                mention_ticker.append(match.ticker)
+            offsets.append(len(token_ids))
+
+        ids = np.asarray(token_ids, dtype=np.int64)
+        scores = self.weights[np.maximum(ids, 0)]
+        negated = np.zeros(len(ids), dtype=bool)
+        negated[1:] = ids[:-1] < 0
+        scores[negated] *= -1
+        prefix = np.concatenate(([0.0], np.cumsum(scores)))
+
+        # Window sums around every mention, clipped to its own post
+        offsets = np.asarray(offsets)
+        posts = np.asarray(mention_post, dtype=np.int64)
+        centers = np.asarray(mention_token, dtype=np.int64)
+        lo = np.maximum(centers - self.window, offsets[posts])
+        hi = np.minimum(centers + self.window + 1, offsets[posts + 1])
+        window_scores = np.tanh(prefix[hi] - prefix[lo])
+
+        per_post = [[] for _ in texts]
+        for post_index, ticker, score in zip(mention_post, mention_ticker, window_scores.tolist()):
+            per_post[post_index].append((ticker, score))
+        return per_post
+
+    def label(self, score):
+        if score > self.threshold:
+            return 'positive'
+        if score < -self.threshold:
+            return 'negative'
+        return 'neutral'
+
+    def analyze(self, rows):
+        texts = [f"{row['title']} {row['body']}" for row in rows]
+        results = []
+        for row, mentions in zip(rows, self.score_mentions(texts)):
+            # One entry per ticker, averaging over its mentions in the post
+            totals = {}
+            for ticker, score in mentions:
+                total, count = totals.get(ticker, (0.0, 0))
+                totals[ticker] = (total + score, count + 1)
+            extracted = [{'ticker': ticker, 'sentiment': self.label(total / count)}
+                         for ticker, (total, count) in totals.items()]
+            results.append((row['url'], row['scraped_date'], json.dumps(extracted)))
+        return results
@@ -0,0 +1,317 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from collections import deque, namedtuple
+
+TICKERS_PATH = 'final_project/utils/company_tickers.json'
+
+# Compiled automaton kept next to the JSON; see TickerIndex.load
+INDEX_MAGIC = b'DWDTIDX\x01'
+INDEX_HEADER = struct.Struct('<8s32s7I')
+
+# A single ticker hit inside a post. start/end are character offsets into the
+# original text, kind is 'cashtag', 'ticker' or 'alias'.
+TickerMatch = namedtuple('TickerMatch', ['ticker', 'start', 'end', 'text', 'kind'])
+
+# Tickers that are also everyday English words. These only count when written
+# as a cashtag ($IT, $ON), otherwise every post would "mention" a stock.
+COMMON_WORDS = frozenset("""
+    a about all am an and any are as at be been best big blue but by can car
+    cash come could day do does dd eat edit else eps eye fan far fat few for
+    fun go good got has have he her here hi him his how i if im in is it its
+    just key kids know less life like live lol love low man me more most much
+    my new next nice no not now of off oh ok old on one open or our out own
+    pay play plus post real run safe say see she so some stay sun tax team
+    than that the then they this to too top true two up us usa very was way
+    we well were what when who why will win with wow yes yet you your
+""".split())
+
+# Legal-entity noise stripped from SEC company titles before they are used as
+# aliases ("COSTCO WHOLESALE CORP /NEW" -> "costco wholesale").
+LEGAL_SUFFIXES = frozenset("""
+    inc incorporated corp corporation co company ltd limited plc llc lp l p
+    sa s a se nv n v ag as a s holding holdings group trust the com de new
+    adr ads class cl
+""".split())
+
+ALIAS_MIN_LENGTH = 4
+
+
+def normalize_company_name(title):
+    title = re.sub(r'/.*$', '', title)
+    words = re.findall(r'[a-z0-9]+', title.lower())
+    while words and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    while words and words[0] == 'the':
+        words.pop(0)
+    return ' '.join(words)
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+def index_path(path=TICKERS_PATH):
+    return os.path.splitext(path)[0] + '.idx'
+
+
+def source_key(path=TICKERS_PATH, common_words=COMMON_WORDS):
+    # Changes whenever the JSON, the stopword list or the alias rules do
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(' '.join(sorted(common_words)).encode())
+    digest.update(f'{ALIAS_MIN_LENGTH}:{INDEX_MAGIC!r}'.encode())
+    return digest.digest()
+
+
+class _MappedPatterns():
+    # pattern id -> (ticker, length, kind), decoded from the index file on demand
+    KINDS = ('ticker', 'alias')
+
+    def __init__(self, starts, lengths, kinds, blob):
+        self.starts = starts
+        self.lengths = lengths
+        self.kinds = kinds
+        self.blob = blob
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, pattern_id):
+        pattern = self.cache.get(pattern_id)
+        if pattern is None:
+            ticker = bytes(self.blob[self.starts[pattern_id]:self.starts[pattern_id + 1]]).decode()
+            pattern = self.cache[pattern_id] = (ticker, self.lengths[pattern_id], self.KINDS[self.kinds[pattern_id]])
+        return pattern
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class TickerIndex():
+    # Aho-Corasick automaton over every ticker and company alias, so a post is
+    # scanned once regardless of how many tickers are in the universe.
+    def __init__(self, tickers, aliases=None, common_words=COMMON_WORDS):
+        self.common_words = common_words
+        self._mapped = None
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        # pattern id -> (ticker, length, kind)
+        self.patterns = []
+
+        for ticker in tickers:
+            self._add(ticker.lower(), ticker.upper(), 'ticker')
+        seen_aliases = {ticker.lower() for ticker in tickers}
+        for alias, ticker in (aliases or {}).items():
+            # Earlier (larger market cap) companies win alias collisions
+            if alias in seen_aliases:
+                continue
+            seen_aliases.add(alias)
+            self._add(alias, ticker.upper(), 'alias')
+        self._build_failure_links()
+
+    @classmethod
+    def from_json(cls, path=TICKERS_PATH, common_words=COMMON_WORDS):
+        with open(path, 'r') as f:
+            stock_tickers = json.load(f)
+        tickers = []
+        aliases = {}
+        for v in stock_tickers.values():
+            tickers.append(v['ticker'])
+            alias = normalize_company_name(v['title'])
+            if len(alias) >= ALIAS_MIN_LENGTH and alias not in common_words and alias not in aliases:
+                aliases[alias] = v['ticker']
+        return cls(tickers, aliases, common_words)
+
+    @classmethod
+    def load(cls, path=TICKERS_PATH, cache_path=None, common_words=COMMON_WORDS):
+        # Maps the compiled index next to the JSON, compiling it first when
+        # it is missing or was built from a different JSON. Building from
+        # JSON takes about half a second; mapping the file takes a few ms and
+        # only the nodes a scan actually visits are ever decoded.
+        cache_path = cache_path or index_path(path)
+        key = source_key(path, common_words)
+        try:
+            return cls.from_file(cache_path, key, common_words)
+        except (OSError, ValueError):
+            pass
+        index = cls.from_json(path, common_words)
+        try:
+            index.save(cache_path, key)
+        except OSError:
+            pass  # read-only checkout; keep using the in-memory automaton
+        return index
+
+    def save(self, path, key=b'') -> None:
+        # Flat little-endian uint32 arrays (CSR edges, failure links, merged
+        # outputs, pattern table) behind a header carrying the source key
+        edge_start, edge_char, edge_target = array('I', [0]), array('I'), array('I')
+        for edges in self.goto:
+            for char, child in edges.items():
+                edge_char.append(ord(char))
+                edge_target.append(child)
+            edge_start.append(len(edge_char))
+        out_start, out_ids = array('I', [0]), array('I')
+        for found in self.outputs:
+            out_ids.extend(found)
+            out_start.append(len(out_ids))
+        blob = bytearray()
+        ticker_start, lengths, kinds = array('I', [0]), array('I'), array('I')
+        for ticker, length, kind in self.patterns:
+            blob += ticker.encode()
+            ticker_start.append(len(blob))
+            lengths.append(length)
+            kinds.append(_MappedPatterns.KINDS.index(kind))
+        sections = [edge_start, edge_char, edge_target, array('I', self.fail), out_start, out_ids,
+                    ticker_start, lengths, kinds]
+        if sys.byteorder != 'little':
+            for section in sections:
+                section.byteswap()
+        header = INDEX_HEADER.pack(INDEX_MAGIC, key.ljust(32, b'\0'), len(self.goto), len(edge_char),
+                                   len(out_ids), len(self.patterns), len(blob), 0, 0)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            for section in sections:
+                section.tofile(f)
+            f.write(blob)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_file(cls, path, key=None, common_words=COMMON_WORDS):
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        if len(view) < INDEX_HEADER.size:
+            raise ValueError(f"{path} is truncated")
+        magic, stored_key, n_nodes, n_edges, n_outputs, n_patterns, blob_size, _, _ = \
+            INDEX_HEADER.unpack_from(view)
+        if magic != INDEX_MAGIC or sys.byteorder != 'little':
+            raise ValueError(f"{path} is not a ticker index for this build")
+        if key is not None and stored_key != key.ljust(32, b'\0'):
+            raise ValueError(f"{path} was compiled from a different ticker list")
+        sizes = (n_nodes + 1, n_edges, n_edges, n_nodes, n_nodes + 1, n_outputs, n_patterns + 1, n_patterns, n_patterns)
+        if len(view) != INDEX_HEADER.size + 4 * sum(sizes) + blob_size:
+            raise ValueError(f"{path} is truncated")
+        offset = INDEX_HEADER.size
+        sections = []
+        for size in sizes:
+            sections.append(view[offset:offset + 4 * size].cast('I'))
+            offset += 4 * size
+        edge_start, edge_char, edge_target, fail, out_start, out_ids, ticker_start, lengths, kinds = sections
+
+        index = cls.__new__(cls)
+        index.common_words = common_words
+        index._mapped = (mapped, edge_start, edge_char, edge_target, out_start, out_ids)
+        # None marks a node not decoded yet; iter_matches fills them in on first visit
+        index.goto = [None] * n_nodes
+        # Failure links are followed on most characters and list indexing is
+        # noticeably faster than indexing the mapped array; copying them is ~1ms
+        index.fail = fail.tolist()
+        index.outputs = [None] * n_nodes
+        index.patterns = _MappedPatterns(ticker_start, lengths, kinds, view[offset:offset + blob_size])
+        return index
+
+    def _load_node(self, node):
+        _, edge_start, edge_char, edge_target, out_start, out_ids = self._mapped
+        start, end = edge_start[node], edge_start[node + 1]
+        self.outputs[node] = out_ids[out_start[node]:out_start[node + 1]].tolist()
+        edges = self.goto[node] = dict(zip(map(chr, edge_char[start:end]), edge_target[start:end]))
+        return edges
+
+    def _add(self, pattern, ticker, kind) -> None:
+        node = 0
+        for char in pattern:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            node = next_node
+        self.outputs[node].append(len(self.patterns))
+        self.patterns.append((ticker, len(pattern), kind))
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                # Merge outputs so the scan never has to walk the failure chain
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def _accept(self, text, start, end, ticker, kind):
+        if end < len(text) and _is_word_char(text[end]):
+            return None
+        cashtag = start > 0 and text[start - 1] == '$'
+        if not cashtag and start > 0 and _is_word_char(text[start - 1]):
+            return None
+
+        matched = text[start:end]
+        if kind == 'alias':
+            # "Apple" is the company, "apple" is the fruit
+            if not matched[0].isupper():
+                return None
+            return TickerMatch(ticker, start, end, matched, kind)
+        if cashtag:
+            return TickerMatch(ticker, start - 1, end, text[start - 1:end], 'cashtag')
+        # Bare tickers must be written in caps: "BEAT" is a ticker, "beat" is not
+        if matched != ticker or len(ticker) == 1 or ticker.lower() in self.common_words:
+            return None
+        return TickerMatch(ticker, start, end, matched, kind)
+
+    def _lowered(self, text):
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # A few characters ('İ') expand when lowered; keep offsets aligned
+            lowered = ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+        return lowered
+
+    def iter_matches(self, text):
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        patterns = self.patterns
+        load_node = self._load_node
+        node = 0
+        edges = goto[0] if goto[0] is not None else load_node(0)
+        for i, char in enumerate(self._lowered(text)):
+            while node and char not in edges:
+                node = fail[node]
+                edges = goto[node]
+                if edges is None:
+                    edges = load_node(node)
+            node = edges.get(char, 0)
+            edges = goto[node]
+            if edges is None:
+                edges = load_node(node)
+            for pattern_id in outputs[node]:
+                ticker, length, kind = patterns[pattern_id]
+                match = self._accept(text, i + 1 - length, i + 1, ticker, kind)
+                if match is not None:
+                    yield match
+
+    def find(self, text):
+        return sorted(self.iter_matches(text), key=lambda m: (m.start, -m.end))
+
+    def contains_any(self, text) -> bool:
+        return next(self.iter_matches(text), None) is not None
+
+    def tickers_in(self, text):
+        return {match.ticker for match in self.iter_matches(text)}
@@ -1,104 +1,234 @@
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-import sqlite3
 import json
+from collections import namedtuple
+from db import connect
+import rollups
+import metrics
+from metrics import timed
+
+# pandas and matplotlib take over a second to import, so they are imported by
+# the functions that use them; the rollup views and render.py's change
+# detection run without either.
+
+SENTIMENT_LABELS = ['positive', 'neutral', 'negative']
+SENTIMENT_COLUMNS = ['url', 'scraped_date', 'sub_reddit', 'ticker', 'sentiment']
 
 def filter_by_date(date, mentions_df, posts_df):
     mentions_on_date = mentions_df[mentions_df['scraped_date'] == date]
     posts_on_date = posts_df[posts_df['scraped_date'] == date]
     return mentions_on_date, posts_on_date
 
-def mentions_and_sentiment(date, mentions_df, posts_df):
-    mentions_on_date, _ = filter_by_date(date, mentions_df, posts_df)
-    mentions_and_sentiment_counts = {}
-    for _, mention in mentions_on_date.iterrows():
-        if pd.notna(mention['extracted_data']) and len(mention['extracted_data'].strip()) > 0:
-            try:
-                contents = json.loads(mention['extracted_data'])
-                if isinstance(contents, list):
-                    for content in contents:
-                        if isinstance(content, dict):
-                            ticker = content.get('ticker', '').upper()
-                            sentiment = content.get('sentiment', '').lower()
-                            if ticker not in mentions_and_sentiment_counts:
-                                mentions_and_sentiment_counts[ticker] = {'count': 0, 'sentiment': {'positive': 0, 'neutral': 0, 'negative': 0}}
-                            mentions_and_sentiment_counts[ticker]['count'] += 1
-                            if sentiment in mentions_and_sentiment_counts[ticker]['sentiment']:
-                                mentions_and_sentiment_counts[ticker]['sentiment'][sentiment] += 1
-                            else:
-                                print(f"Unexpected sentiment label: {sentiment}")
-            except json.JSONDecodeError:
-                print(f"Error decoding JSON for entry: {mention['extracted_data']}")
-    return mentions_and_sentiment_counts
-
-def subreddit_sentiment(date, mentions_df, posts_df):
+def parse_extracted_data(extracted_data):
+    if not isinstance(extracted_data, str) or len(extracted_data.strip()) == 0:
+        return []
+    try:
+        contents = json.loads(extracted_data)
+    except json.JSONDecodeError:
+        print(f"Error decoding JSON for entry: {extracted_data}")
+        return []
+    if not isinstance(contents, list):
+        return []
+    return [content for content in contents if isinstance(content, dict)]
+
+@timed('vis_sentiment_frame_seconds')
+def sentiment_frame(mentions_df, posts_df):
+    # One row per extracted mention: (url, scraped_date, sub_reddit, ticker, sentiment).
+    # Every extracted_data blob is parsed exactly once and subreddits come from
+    # a single join, so the aggregations below are plain groupbys over this frame.
+    items = mentions_df['extracted_data'].map(parse_extracted_data)
+    long_df = mentions_df[['url', 'scraped_date']].assign(item=items).explode('item')
+    long_df = long_df[long_df['item'].notna()]
+    long_df['ticker'] = long_df['item'].str.get('ticker').fillna('').astype(str).str.upper()
+    long_df['sentiment'] = long_df['item'].str.get('sentiment').fillna('').astype(str).str.lower()
+    subreddits = posts_df[['url', 'scraped_date', 'sub_reddit']].drop_duplicates(['url', 'scraped_date'])
+    long_df = long_df.drop(columns='item').merge(subreddits, on=['url', 'scraped_date'], how='left')
+
+    unexpected = long_df.loc[~long_df['sentiment'].isin(SENTIMENT_LABELS), 'sentiment']
+    if len(unexpected):
+        print(f"Unexpected sentiment labels: {unexpected.value_counts().to_dict()}")
+    # Categoricals make the per-date filters and groupbys integer operations
+    long_df = long_df[SENTIMENT_COLUMNS].reset_index(drop=True)
+    return long_df.astype({column: 'category' for column in ['scraped_date', 'sub_reddit', 'ticker', 'sentiment']})
+
+def _sentiment_counts(long_df, by):
+    # Rows of `by`, columns positive/neutral/negative
+    known = long_df[long_df['sentiment'].isin(SENTIMENT_LABELS)]
+    counts = known.groupby([by, 'sentiment'], observed=True).size().unstack(fill_value=0)
+    return counts.reindex(columns=SENTIMENT_LABELS, fill_value=0)
+
+@timed('vis_mentions_and_sentiment_seconds')
+def mentions_and_sentiment(date, mentions_df, posts_df, long_df=None):
+    if long_df is None:
+        long_df = sentiment_frame(*filter_by_date(date, mentions_df, posts_df))
+    on_date = long_df[long_df['scraped_date'] == date]
+    totals = on_date.groupby('ticker', observed=True).size()
+    counts = _sentiment_counts(on_date, 'ticker').reindex(totals.index, fill_value=0)
+    return {ticker: {'count': int(total), 'sentiment': {label: int(counts.at[ticker, label]) for label in SENTIMENT_LABELS}}
+            for ticker, total in totals.items()}
+
+@timed('vis_subreddit_sentiment_seconds')
+def subreddit_sentiment(date, mentions_df, posts_df, long_df=None):
     mentions_on_date, posts_on_date = filter_by_date(date, mentions_df, posts_df)
-    subreddit_sentiment_counts = {}
-    for _, post in posts_on_date.iterrows():
-        subreddit = post['sub_reddit']
-        if subreddit not in subreddit_sentiment_counts:
-            subreddit_sentiment_counts[subreddit] = {'positive': 0, 'neutral': 0, 'negative': 0}
-    for _, mention in mentions_on_date.iterrows():
-        if pd.notna(mention['extracted_data']) and len(mention['extracted_data'].strip()) > 0:
-            try:
-                contents = json.loads(mention['extracted_data'])
-                if isinstance(contents, list):
-                    for content in contents:
-                        if isinstance(content, dict):
-                            sentiment = content.get('sentiment', '').lower()
-                            url = mention.get('url')
-                            scraped_date = mention.get('scraped_date')
-                            if url and scraped_date:
-                                post_row = posts_df[(posts_df['url'] == url) & (posts_df['scraped_date'] == scraped_date)]
-                                if not post_row.empty:
-                                    subreddit = post_row['sub_reddit'].values[0]
-                                    if subreddit and sentiment in subreddit_sentiment_counts[subreddit]:
-                                        subreddit_sentiment_counts[subreddit][sentiment] += 1
-                                    else:
-                                        print(f"Unexpected sentiment label: {sentiment}")
-            except json.JSONDecodeError:
-                print(f"Error decoding JSON for entry: {mention['extracted_data']}")
-    return subreddit_sentiment_counts
-
-def overall_sentiment(date, mentions_df, posts_df):
-    mentions_on_date, _ = filter_by_date(date, mentions_df, posts_df)
-    positive_count = 0
-    neutral_count = 0
-    negative_count = 0
-    for _, mention in mentions_on_date.iterrows():
-        if pd.notna(mention['extracted_data']) and len(mention['extracted_data'].strip()) > 0:
-            try:
-                contents = json.loads(mention['extracted_data'])
-                if isinstance(contents, list):
-                    for content in contents:
-                        if isinstance(content, dict):
-                            sentiment = content.get('sentiment', '').lower()
-                            if sentiment == 'positive':
-                                positive_count += 1
-                            elif sentiment == 'neutral':
-                                neutral_count += 1
-                            elif sentiment == 'negative':
-                                negative_count += 1
-                            else:
-                                print(f"Unexpected sentiment label: {sentiment}")
-            except json.JSONDecodeError:
-                print(f"Error decoding JSON for entry: {mention['extracted_data']}")
-    return {'positive': positive_count, 'neutral': neutral_count, 'negative': negative_count}
-
-import matplotlib.pyplot as plt
-import numpy as np
-
-def display_plots(date, mentions_df, posts_df):
-    stock_sentiments = mentions_and_sentiment(date, mentions_df, posts_df)
-    sub_sentiments = subreddit_sentiment(date, mentions_df, posts_df)
-    total_sentiment = overall_sentiment(date, mentions_df, posts_df)
+    if long_df is None:
+        long_df = sentiment_frame(mentions_on_date, posts_on_date)
+    on_date = long_df[(long_df['scraped_date'] == date) & long_df['sub_reddit'].notna()]
+    # Every subreddit scraped that day shows up, even with no mentions
+    subreddits = posts_on_date['sub_reddit'].drop_duplicates()
+    counts = _sentiment_counts(on_date, 'sub_reddit').reindex(subreddits, fill_value=0)
+    return {subreddit: {label: int(counts.at[subreddit, label]) for label in SENTIMENT_LABELS}
+            for subreddit in counts.index}
+
+@timed('vis_overall_sentiment_seconds')
+def overall_sentiment(date, mentions_df, posts_df, long_df=None):
+    if long_df is None:
+        long_df = sentiment_frame(*filter_by_date(date, mentions_df, posts_df))
+    counts = long_df.loc[long_df['scraped_date'] == date, 'sentiment'].value_counts()
+    return {label: int(counts.get(label, 0)) for label in SENTIMENT_LABELS}
+
+def _rollup(conn, query, *args):
+    # conn is a SQLite connection, or an archive.Archive answering the same
+    # rollup queries from the Parquet partitions
+    if hasattr(conn, query):
+        return getattr(conn, query)(*args)
+    return getattr(rollups, query)(conn, *args)
+
+# The same three views read from the precomputed daily rollups, touching only
+# the requested date's rows
+@timed('vis_mentions_and_sentiment_sql_seconds')
+def mentions_and_sentiment_sql(conn, date):
+    return {ticker: {'count': positive + neutral + negative,
+                     'sentiment': {'positive': positive, 'neutral': neutral, 'negative': negative}}
+            for ticker, positive, neutral, negative in _rollup(conn, 'ticker_sentiment', date)}
+
+@timed('vis_subreddit_sentiment_sql_seconds')
+def subreddit_sentiment_sql(conn, date):
+    return {subreddit: {'positive': positive, 'neutral': neutral, 'negative': negative}
+            for subreddit, positive, neutral, negative in _rollup(conn, 'subreddit_sentiment', date)}
+
+@timed('vis_overall_sentiment_sql_seconds')
+def overall_sentiment_sql(conn, date):
+    row = _rollup(conn, 'overall_sentiment', date) or (0, 0, 0)
+    return dict(zip(SENTIMENT_LABELS, row))
+
+# Multi-day views. Each rollup table is read once for the whole range and
+# pivoted to one row per period, with (key, sentiment) columns; days without
+# any rows come back as zeros instead of gaps.
+SentimentTimeseries = namedtuple('SentimentTimeseries', ['tickers', 'subreddits', 'overall'])
+
+def _pivot_range(rows, key, values, start, end, freq):
+    import pandas as pd
+    df = pd.DataFrame(rows, columns=['scraped_date', key, *values])
+    df['scraped_date'] = pd.to_datetime(df['scraped_date'])
+    if df.empty:
+        columns = pd.MultiIndex.from_product([[], values], names=[key, None])
+        return pd.DataFrame(index=pd.date_range(start, end, freq='D').rename('scraped_date'),
+                            columns=columns, dtype='int64').resample(freq).sum()
+    wide = df.pivot_table(index='scraped_date', columns=key, values=values, aggfunc='sum', fill_value=0)
+    if wide.columns.nlevels > 1:
+        wide = wide.swaplevel(0, 1, axis=1).sort_index(axis=1)
+    wide = wide.reindex(pd.date_range(start, end, freq='D'), fill_value=0)
+    wide.index.name = 'scraped_date'
+    return wide.resample(freq).sum().astype('int64')
+
+@timed('vis_sentiment_timeseries_seconds')
+def sentiment_timeseries(conn, start, end, tickers=None, freq='D'):
+    # Per-ticker, per-subreddit and overall sentiment counts between start and
+    # end (inclusive), summed per freq period ('D', 'W', 'MS', ...)
+    import pandas as pd
+    ticker_rows = _rollup(conn, 'ticker_range', start, end, tickers)
+    subreddit_rows = _rollup(conn, 'subreddit_range', start, end)
+    overall = pd.DataFrame(_rollup(conn, 'overall_range', start, end), columns=['scraped_date', 'posts', *SENTIMENT_LABELS])
+    overall['scraped_date'] = pd.to_datetime(overall['scraped_date'])
+    overall = (overall.set_index('scraped_date').reindex(pd.date_range(start, end, freq='D'), fill_value=0)
+               .rename_axis('scraped_date').resample(freq).sum().astype('int64'))
+    return SentimentTimeseries(
+        tickers=_pivot_range(ticker_rows, 'ticker', SENTIMENT_LABELS, start, end, freq),
+        subreddits=_pivot_range(subreddit_rows, 'sub_reddit', ['posts', *SENTIMENT_LABELS], start, end, freq),
+        overall=overall,
+    )
+
+def mention_counts(wide):
+    # Total mentions per key and period from a (key, sentiment) frame
+    import pandas as pd
+    if wide.columns.empty:
+        return pd.DataFrame(index=wide.index)
+    return wide.T.groupby(level=0).sum().T
+
+def net_sentiment(wide):
+    # (positive - negative) / mentions per key and period, NaN where nothing was said
+    import pandas as pd
+    if wide.columns.empty:
+        return pd.DataFrame(index=wide.index)
+    positive = wide.xs('positive', axis=1, level=1)
+    negative = wide.xs('negative', axis=1, level=1)
+    total = sum(wide.xs(label, axis=1, level=1) for label in SENTIMENT_LABELS)
+    return (positive - negative) / total.where(total > 0)
+
+def rolling_sentiment(wide, window=7):
+    # Trailing-window mention counts and net sentiment, weighting each period
+    # by how much was said in it
+    counts = wide.rolling(window, min_periods=1).sum()
+    return mention_counts(counts), net_sentiment(counts)
+
+def trending_tickers(ts, window=7, z_threshold=2.0, min_mentions=5):
+    # Tickers whose latest-period mention count stands out against the
+    # preceding window. The spread is floored at 1 so a ticker that goes from
+    # a flat 0 to a handful of mentions doesn't get an infinite score.
+    import pandas as pd
+    counts = mention_counts(ts.tickers)
+    if counts.empty or len(counts) < 2:
+        return pd.DataFrame(columns=['mentions', 'baseline', 'zscore', 'momentum'])
+    history = counts.iloc[-window - 1:-1]
+    baseline = history.mean()
+    spread = history.std(ddof=0).clip(lower=1.0)
+    latest = counts.iloc[-1]
+    net = net_sentiment(ts.tickers)
+    momentum = net.iloc[-1] - net.iloc[-window - 1:-1].mean()
+    trend = pd.DataFrame({'mentions': latest, 'baseline': baseline,
+                          'zscore': (latest - baseline) / spread, 'momentum': momentum})
+    trend = trend[(trend['mentions'] >= min_mentions) & (trend['zscore'] >= z_threshold)]
+    return trend.sort_values('zscore', ascending=False)
+
+def display_plots(date, conn):
+    plot_sentiments(date, mentions_and_sentiment_sql(conn, date), subreddit_sentiment_sql(conn, date),
+                    overall_sentiment_sql(conn, date))
+
+def display_plots_from_frames(date, mentions_df, posts_df):
+    # Parse and join once, then take all three views from the same frame
+    long_df = sentiment_frame(*filter_by_date(date, mentions_df, posts_df))
+    stock_sentiments = mentions_and_sentiment(date, mentions_df, posts_df, long_df)
+    sub_sentiments = subreddit_sentiment(date, mentions_df, posts_df, long_df)
+    total_sentiment = overall_sentiment(date, mentions_df, posts_df, long_df)
+    plot_sentiments(date, stock_sentiments, sub_sentiments, total_sentiment)
+
+def plot_sentiments(date, stock_sentiments, sub_sentiments, total_sentiment):
+    import matplotlib.pyplot as plt
     
     # Figure for stock sentiments
     fig1, ax1 = plt.subplots(figsize=(12, 6))
     fig1.canvas.manager.set_window_title(f'Stock Sentiments for {date}')
+    draw_stock_sentiments(ax1, stock_sentiments)
+    plt.tight_layout()
+    plt.show()
     
+    # Figure for subreddit sentiments
+    fig2, ax2 = plt.subplots(figsize=(8, 8))
+    fig2.canvas.manager.set_window_title(f'Subreddit Sentiments for {date}')
+    draw_subreddit_sentiments(ax2, sub_sentiments)
+    plt.tight_layout()
+    plt.show()
+    
+    # Figure for overall sentiment
+    fig3, ax3 = plt.subplots(figsize=(8, 8))
+    fig3.canvas.manager.set_window_title(f'Overall Sentiment for {date}')
+    draw_overall_sentiment(ax3, total_sentiment)
+    plt.tight_layout()
+    plt.show(block=True)
+
+# The drawing itself only touches the axes it is given, so render.py can
+# reuse the same figures for every date without going through pyplot
+def draw_stock_sentiments(ax1, stock_sentiments):
     # Prepare data for stock sentiments plot
+    import numpy as np
     tickers = list(stock_sentiments.keys())
     counts = [stock_sentiments[ticker]['count'] for ticker in tickers]
     positive = [stock_sentiments[ticker]['sentiment']['positive'] for ticker in tickers]
@@ -109,7 +239,7 @@ def display_plots(date, mentions_df, posts_df):
     
     # Only show the top 20 tickers
     top_20 = sorted(zip(tickers, counts, positive, neutral, negative), key=lambda x: x[1], reverse=True)[:20]
-    tickers, counts, positive, neutral, negative = zip(*top_20)
+    tickers, counts, positive, neutral, negative = zip(*top_20) if top_20 else ((), (), (), (), ())
     index = np.arange(len(tickers))  # Update index to match the length of the top 20 tickers
     
     # Bar plot for stock sentiments
@@ -128,15 +258,10 @@ def display_plots(date, mentions_df, posts_df):
     ax1.set_xticks(index)
     ax1.set_xticklabels(tickers, rotation=90)
     ax1.legend()
-    
-    plt.tight_layout()
-    plt.show()
-    
-    # Figure for subreddit sentiments
-    fig2, ax2 = plt.subplots(figsize=(8, 8))
-    fig2.canvas.manager.set_window_title(f'Subreddit Sentiments for {date}')
-    
+
+def draw_subreddit_sentiments(ax2, sub_sentiments):
     # Pie chart for subreddit sentiments
+    import matplotlib.pyplot as plt
     sub_sentiments_counts = {k: sum(v.values()) for k, v in sub_sentiments.items()}
     sub_sentiments_labels = list(sub_sentiments_counts.keys())
     sub_sentiments_sizes = list(sub_sentiments_counts.values())
@@ -145,12 +270,13 @@ def display_plots(date, mentions_df, posts_df):
     cmap = plt.cm.RdYlGn
     
     # Normalize the sizes to range from 0 to 1
-    norm = plt.Normalize(min(sub_sentiments_sizes), max(sub_sentiments_sizes))
+    norm = plt.Normalize(min(sub_sentiments_sizes, default=0), max(sub_sentiments_sizes, default=1))
     
     # Generate the colors for each segment based on the normalized sizes
     colors = cmap(norm(sub_sentiments_sizes))
     
-    ax2.pie(sub_sentiments_sizes, labels=sub_sentiments_labels, startangle=90, colors=colors)
+    if sum(sub_sentiments_sizes):
+        ax2.pie(sub_sentiments_sizes, labels=sub_sentiments_labels, startangle=90, colors=colors)
     ax2.set_title('Overall Sentiment of Each Subreddit')
     
     # Add a legend explaining the color scheme
@@ -158,34 +284,69 @@ def display_plots(date, mentions_df, posts_df):
     legend_colors = ['red', 'orange', 'green']
     legend_handles = [plt.Rectangle((0, 0), 1, 1, color=color) for color in legend_colors]
     ax2.legend(legend_handles, legend_labels, loc='upper right')
-    
-    plt.tight_layout()
-    plt.show()
-    
-    # Figure for overall sentiment
-    fig3, ax3 = plt.subplots(figsize=(8, 8))
-    fig3.canvas.manager.set_window_title(f'Overall Sentiment for {date}')
-    
+
+def draw_overall_sentiment(ax3, total_sentiment):
     # Pie chart for overall sentiment
     # make the negative sentiment red, neutral sentiment yellow, and positive sentiment green
     total_counts = list(total_sentiment.values())
     total_labels = ['Positive', 'Neutral', 'Negative']
     colors = ['green', 'orange', 'red']
-    ax3.pie(total_counts, labels=total_labels, autopct='%1.1f%%', colors=colors)
+    if sum(total_counts):
+        ax3.pie(total_counts, labels=total_labels, autopct='%1.1f%%', colors=colors)
     ax3.set_title('Overall Sentiment of All Posts')
-    
-    plt.tight_layout()
+
+
+def display_range_plots(start, end, conn, tickers=None, freq='D', top=8, window=7):
+    import matplotlib.pyplot as plt
+    ts = sentiment_timeseries(conn, start, end, tickers, freq)
+    plot_timeseries(ts, top=top, window=window)
     plt.show(block=True)
 
+def plot_timeseries(ts, top=8, window=7):
+    # One figure for a date range: overall sentiment mix, the busiest tickers'
+    # mention counts, and each subreddit's rolling net sentiment
+    import matplotlib.pyplot as plt
+    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(14, 12), sharex=True)
+    index = ts.overall.index
+    if len(index):
+        fig.canvas.manager.set_window_title(f'Sentiment {index[0]:%Y-%m-%d} to {index[-1]:%Y-%m-%d}')
+
+    ax1.stackplot(index, *(ts.overall[label] for label in SENTIMENT_LABELS),
+                  labels=['Positive', 'Neutral', 'Negative'], colors=['green', 'orange', 'red'], alpha=0.8)
+    ax1.set_ylabel('Mentions')
+    ax1.set_title('Overall Sentiment')
+    ax1.legend(loc='upper left')
 
+    counts, _ = rolling_sentiment(ts.tickers, window)
+    if not counts.empty:
+        busiest = mention_counts(ts.tickers).sum().nlargest(top).index
+        for ticker in busiest:
+            ax2.plot(index, counts[ticker], label=ticker)
+        ax2.legend(loc='upper left', ncol=2)
+    ax2.set_ylabel(f'Mentions ({window}-period rolling)')
+    ax2.set_title(f'Top {top} Stock Tickers')
+
+    subreddits = ts.subreddits.drop(columns='posts', level=1) if not ts.subreddits.empty else ts.subreddits
+    _, net = rolling_sentiment(subreddits, window)
+    if not net.empty:
+        for subreddit in net.columns:
+            ax3.plot(index, net[subreddit], label=subreddit)
+        ax3.legend(loc='upper left', ncol=3, fontsize='small')
+    ax3.axhline(0, color='grey', linewidth=0.8)
+    ax3.set_ylim(-1, 1)
+    ax3.set_ylabel('Net sentiment')
+    ax3.set_title('Subreddit Sentiment')
+
+    fig.autofmt_xdate()
+    plt.tight_layout()
+    return fig
 
 
 def main():
-    conn = sqlite3.connect('final_project/scraped_data/reddit_posts.db')
-    mentions_df = pd.read_sql_query('SELECT * FROM stock_mentions', conn)
-    posts_df = pd.read_sql_query('SELECT * FROM posts', conn)
-    display_plots('2024-07-16', mentions_df, posts_df)
+    conn = connect('final_project/scraped_data/reddit_posts.db')
+    display_plots('2024-07-16', conn)
     conn.close()
+    metrics.export(run='vis')
 
 if __name__ == '__main__':
     main()